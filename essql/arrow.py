@@ -0,0 +1,168 @@
+import re
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+# Query results as Apache Arrow tables (pyarrow is optional, only needed
+# by execute_arrow / iter_arrow / to_pandas of the executors). Column
+# types come from the index mapping for plain fields when asked, from the
+# values otherwise.
+
+def import_pyarrow():
+
+    # pyarrow is only needed for Arrow output
+    import pyarrow
+
+    return pyarrow
+
+def column_names(query_descriptor):
+
+    # Arrow needs a name for every column, expressions name themselves
+    return [
+        column_processor['alias'] if column_processor['alias'] is not None else column_processor['expr']
+        for column_processor in query_descriptor['columns_processors']
+    ]
+
+#----------------------------------------------------------------------#
+# Mapping                                                              #
+#----------------------------------------------------------------------#
+
+ES_TYPES = {
+    'long'            : 'int64',
+    'integer'         : 'int32',
+    'short'           : 'int16',
+    'byte'            : 'int8',
+    'unsigned_long'   : 'uint64',
+    # _source keeps the values as sent: float fields hold doubles
+    'double'          : 'float64',
+    'float'           : 'float64',
+    'half_float'      : 'float64',
+    'scaled_float'    : 'float64',
+    'boolean'         : 'bool_',
+    'keyword'         : 'string',
+    'constant_keyword': 'string',
+    'wildcard'        : 'string',
+    'text'            : 'string',
+    'ip'              : 'string',
+}
+
+_FIELD_RE = re.compile(r'[\w@.\-]+')
+
+def mapping_fields(mapping):
+
+    # GET <index>/_mapping -> { 'a.b': es type }; fields mapped with
+    # different types by the indices are left out
+    fields = {}
+    conflicts = set()
+
+    def walk(properties, prefix):
+        for name, spec in properties.items():
+            path = prefix + name
+
+            if 'type' in spec and spec['type'] != 'object':
+                if fields.get(path, spec['type']) != spec['type']:
+                    conflicts.add(path)
+                fields[path] = spec['type']
+
+            walk(spec.get('properties', {}), path + '.')
+            walk(spec.get('fields', {}), path + '.')
+
+    for index in mapping.values():
+        walk(index.get('mappings', {}).get('properties', {}), '')
+
+    return { path: es_type for path, es_type in fields.items() if path not in conflicts }
+
+def column_types(pa, query_descriptor, fields):
+
+    # Arrow type of the columns that are a plain mapped field, else None
+    types = []
+
+    for column_processor in query_descriptor['columns_processors']:
+        expr = column_processor['expr']
+
+        es_type = None
+        if not column_processor['used_aggr_functions'] and _FIELD_RE.fullmatch(expr):
+            es_type = fields.get(expr)
+
+        types.append(getattr(pa, ES_TYPES[es_type])() if es_type in ES_TYPES else None)
+
+    return types
+
+#----------------------------------------------------------------------#
+# Arrays                                                               #
+#----------------------------------------------------------------------#
+
+def to_array(pa, values, type=None):
+
+    # values: list or numpy array (converted without copy when possible)
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+        # Mixed types have no Arrow equivalent
+        array = pa.array([ None if v is None else str(v) for v in values ], type=pa.string())
+
+    # Safe casts only: a long field may still hold 2.5 in _source
+    if type is not None and array.type != type:
+        try:
+            array = array.cast(type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            pass
+
+    return array
+
+def record_batch(pa, names, columns, types):
+    return pa.RecordBatch.from_arrays([ to_array(pa, c, t) for c, t in zip(columns, types) ], names=names)
+
+def make_table(pa, names, types, batches):
+
+    # Batches were typed one at a time: a column that is all nulls in a
+    # batch, or ints in one and floats in another, gets a common type
+    if not batches:
+        return pa.table([ pa.array([], type=t or pa.null()) for t in types ], names=names)
+
+    columns = [
+        _common_chunks(pa, [ batch.column(i) for batch in batches ], types[i])
+        for i in range(len(names))
+    ]
+
+    return pa.table(columns, names=names)
+
+def _common_chunks(pa, chunks, mapped=None):
+
+    types = set(chunk.type for chunk in chunks) - set([ pa.null() ])
+
+    if not types:
+        target = mapped or pa.null()
+        return pa.chunked_array([ chunk.cast(target) for chunk in chunks ], type=target)
+
+    if len(types) == 1:
+        target = types.pop()
+    elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        target = pa.float64()
+    else:
+        target = None
+
+    if target is not None:
+        try:
+            return pa.chunked_array([ chunk.cast(target) for chunk in chunks ], type=target)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+
+    # Not compatible: everything as strings
+    values = [ v for chunk in chunks for v in chunk.to_pylist() ]
+
+    return pa.chunked_array([ to_array(pa, values, pa.string()) ], type=pa.string())
+
+#----------------------------------------------------------------------#
+# pandas                                                               #
+#----------------------------------------------------------------------#
+
+def to_pandas(table, **kwargs):
+
+    # Numeric columns without nulls become DataFrame columns without
+    # copies, Arrow buffers are released while converting
+    kwargs.setdefault('split_blocks' , True)
+    kwargs.setdefault('self_destruct', True)
+
+    return table.to_pandas(**kwargs)
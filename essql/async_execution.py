@@ -0,0 +1,230 @@
+import time
+import asyncio
+import contextlib
+
+from .execution import _BaseExecutor, decode_response, _report
+from .results import _ResultSetBuilder
+from . import instrumentation
+from . import arrow
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+def create_session(pool_size=100, **kwargs):
+
+    # aiohttp is only needed by the asyncio executor
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=pool_size)
+
+    return aiohttp.ClientSession(connector=connector, **kwargs)
+
+class AsyncExecutor(_BaseExecutor):
+
+    # Same results as Executor, on an aiohttp session. Sessions can be
+    # shared by many executors; without one, every execution opens its own.
+    # export() has no asyncio version.
+    def __init__(self, base_uri, query_descriptor, session=None, **kwargs):
+        super().__init__(base_uri, query_descriptor, **kwargs)
+        self.session = session
+
+    async def execute(self):
+
+        if self.result_cache is not None:
+            key  = self.result_cache.key(self.base_uri, self.query_descriptor)
+            rows = self._cached_rows(key)
+            if rows is not None:
+                return [ list(row) for row in rows ]
+
+        rows = []
+        async for row in self.execute_iter():
+            rows.append(row)
+
+        if self.result_cache is not None:
+            self.result_cache.put(key, rows, self.query_descriptor['indexes'], self.cache_ttl)
+            rows = [ list(row) for row in rows ]
+
+        return rows
+
+    # Same rows as execute() in a results.ResultSet, stored by column
+    async def execute_resultset(self, intern=True):
+
+        builder = None
+
+        async for rows in self.stream():
+            if builder is None:
+                builder = _ResultSetBuilder(rows, intern)
+            else:
+                builder.add(rows)
+
+        return builder.result()
+
+    # Arrow record batches of the rows, see Executor.iter_arrow
+    async def iter_arrow(self, mapping=False):
+
+        pa = arrow.import_pyarrow()
+
+        async with self._session() as session:
+            names, types = await self._arrow_columns_of(session, pa, mapping)
+
+            async for batch in self._iter_arrow(session, pa, names, types):
+                yield batch
+
+    async def execute_arrow(self, mapping=False):
+
+        pa = arrow.import_pyarrow()
+
+        async with self._session() as session:
+            names, types = await self._arrow_columns_of(session, pa, mapping)
+
+            batches = [ batch async for batch in self._iter_arrow(session, pa, names, types) ]
+
+        return arrow.make_table(pa, names, types, batches)
+
+    async def to_pandas(self, mapping=False, **kwargs):
+        return arrow.to_pandas(await self.execute_arrow(mapping), **kwargs)
+
+    async def _arrow_columns_of(self, session, pa, mapping):
+        return self._arrow_columns(pa, await self._request(session, *self._mapping_request()) if mapping else None)
+
+    async def _iter_arrow(self, session, pa, names, types):
+
+        query_descriptor = self.query_descriptor
+
+        stats = self.stats = instrumentation.QueryStats(query_descriptor['indexes'])
+
+        pages = self._iter_cursor( session, self._cursor(query_descriptor) )
+
+        try:
+            async for page in pages:
+                for batch in self._page_batches(pa, names, types, page):
+                    yield batch
+        finally:
+            await pages.aclose()
+            _report('query', stats)
+
+    @contextlib.asynccontextmanager
+    async def _session(self):
+
+        if self.session is not None:
+            yield self.session
+            return
+
+        async with create_session() as session:
+            yield session
+
+    # Header, then one row at a time
+    async def execute_iter(self):
+
+        if self.session is not None:
+            async for row in self._execute_iter(self.session):
+                yield row
+            return
+
+        async with create_session() as session:
+            async for row in self._execute_iter(session):
+                yield row
+
+    async def _execute_iter(self, session):
+
+        query_descriptor = self.query_descriptor
+
+        stats = self.stats = instrumentation.QueryStats(query_descriptor['indexes'])
+
+        pages = self._iter_cursor( session, self._cursor(query_descriptor) )
+
+        try:
+            # Errors of the first request are raised before the header
+            try:
+                first_page = await pages.__anext__()
+            except StopAsyncIteration:
+                first_page = []
+
+            yield self.headers(query_descriptor)
+
+            for row in self._page_rows(first_page, query_descriptor):
+                yield row
+
+            del first_page
+
+            async for page in pages:
+                for row in self._page_rows(page, query_descriptor):
+                    yield row
+        finally:
+            await pages.aclose()
+            _report('query', stats)
+
+    # Header, then lists of up to batch_size rows
+    async def stream(self, batch_size=1000):
+
+        batch = None
+
+        async for row in self.execute_iter():
+
+            if batch is None:
+                yield row
+                batch = []
+                continue
+
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    async def _iter_cursor(self, session, cursor):
+
+        try:
+            while True:
+                request = cursor.next_request()
+                if request is None:
+                    break
+
+                page = cursor.feed( await self._request(session, *request) )
+
+                if page:
+                    yield page
+        finally:
+            request = cursor.close_request()
+            if request is not None:
+                # Best effort, like Executor._iter_cursor
+                try:
+                    await self._request(session, *request)
+                except Exception:
+                    pass
+
+    async def _request(self, session, path, body, method='GET'):
+
+        uri = self.base_uri.rstrip('/') + '/' + path
+
+        t0 = time.perf_counter()
+
+        async with session.request(method, uri, json=body) as response:
+            content = await response.read()
+
+        t1 = time.perf_counter()
+
+        try:
+            return decode_response(uri, response.status, content, self.decoder, self.source_fields)
+        finally:
+            if self.stats is not None:
+                self.stats.add_request(t1 - t0, time.perf_counter() - t1, len(content))
+
+#----------------------------------------------------------------------#
+# Batches                                                              #
+#----------------------------------------------------------------------#
+
+async def execute_all(base_uri, query_descriptors, session=None, pool_size=100, return_exceptions=False, **kwargs):
+
+    # Runs all the queries concurrently on one session, results in the
+    # same order as query_descriptors
+    if session is None:
+        async with create_session(pool_size) as session:
+            return await execute_all(base_uri, query_descriptors, session, pool_size, return_exceptions, **kwargs)
+
+    executions = [ AsyncExecutor(base_uri, query_descriptor, session=session, **kwargs).execute() for query_descriptor in query_descriptors ]
+
+    return await asyncio.gather(*executions, return_exceptions=return_exceptions)
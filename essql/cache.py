@@ -0,0 +1,350 @@
+import os
+import re
+import sys
+import copy
+import json
+import time
+import fnmatch
+import hashlib
+import tempfile
+import threading
+
+from collections import OrderedDict, namedtuple
+
+from . import __version__
+
+#----------------------------------------------------------------------#
+# SQL normalization                                                    #
+#----------------------------------------------------------------------#
+
+# Quoted sections are kept verbatim, comments are dropped and runs of
+# whitespace are collapsed. Unquoted text is lowercased: keywords are
+# caseless and plain identifiers are downcased by the parser anyway.
+_NORMALIZE_RE = re.compile(r"""
+      ( '(?:[^']|'')*'          # string literal
+      | "(?:[^"]|"")*"          # quoted identifier
+      | `(?:[^`\\]|\\.)*`       # query string
+      )
+    | (--[^\n]*)                # comment
+    | (\s+)                     # whitespace
+    | ([^'"`\s-]+|.)           # anything else
+""", re.VERBOSE)
+
+def normalize_sql(sql):
+
+    parts = []
+
+    for m in _NORMALIZE_RE.finditer(sql):
+        quoted, comment, space, other = m.groups()
+
+        if quoted is not None:
+            parts.append(quoted)
+        elif other is not None:
+            parts.append(other.lower())
+        elif parts and parts[-1] != ' ':
+            parts.append(' ')
+
+    return ''.join(parts).strip()
+
+#----------------------------------------------------------------------#
+# Plan cache                                                           #
+#----------------------------------------------------------------------#
+
+PlanCacheInfo = namedtuple('PlanCacheInfo', ['hits', 'misses', 'disk_hits', 'maxsize', 'currsize'])
+
+class PlanCache(object):
+
+    def __init__(self, maxsize=512, path=None, parser=None):
+
+        self.maxsize = maxsize
+        self.path    = path
+        self.parser  = parser
+
+        self.hits      = 0
+        self.misses    = 0
+        self.disk_hits = 0
+
+        self._plans = OrderedDict()
+        self._lock  = threading.Lock()
+
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+
+    def get_plan(self, sql):
+
+        key = normalize_sql(sql)
+
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(plan)
+
+        plan = self._load(key)
+
+        if plan is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            plan = self._compose(sql)
+            self._save(key, plan)
+            with self._lock:
+                self.misses += 1
+
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+
+        return copy.deepcopy(plan)
+
+    def prepare(self, sql):
+        from .composer import PreparedStatement
+        return PreparedStatement(self.get_plan(sql))
+
+    def info(self):
+        with self._lock:
+            return PlanCacheInfo(self.hits, self.misses, self.disk_hits, self.maxsize, len(self._plans))
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+            self.hits      = 0
+            self.misses    = 0
+            self.disk_hits = 0
+
+    def _compose(self, sql):
+
+        if self.parser is None:
+            from .composer import ComposerParser
+            self.parser = ComposerParser()
+
+        tree = self.parser.parse(sql)
+
+        return tree.composeQuery()
+
+    #
+    # On-disk tier
+    #
+
+    def _file_name(self, key):
+        digest = hashlib.sha1(('%s\0%s' % (__version__, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.json')
+
+    def _load(self, key):
+
+        if not self.path:
+            return None
+
+        # Plans are JSON, never pickles: the directory may be shared.
+        # Anything unreadable is a miss.
+        try:
+            with open(self._file_name(key), 'r', encoding='utf-8') as f:
+                stored = json.load(f, object_hook=_decode_plan)
+            stored_key, plan = stored['key'], stored['plan']
+        except Exception:
+            return None
+
+        # Guard against digest collisions
+        if stored_key != key:
+            return None
+
+        return plan
+
+    def _save(self, key, plan):
+
+        if not self.path:
+            return
+
+        try:
+            data = json.dumps({ 'key': key, 'plan': _encode_plan(plan) })
+        except (TypeError, ValueError):
+            return
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_name, self._file_name(key))
+        except OSError:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+# Tuples and bind parameters are tagged, everything else in a plan is
+# plain JSON
+def _encode_plan(obj):
+
+    from .composer import BindParameter, LikeParameter
+
+    if isinstance(obj, LikeParameter):
+        return { '__like__': [ obj.key, obj.field ] }
+    if isinstance(obj, BindParameter):
+        return { '__bind__': obj.key }
+    if isinstance(obj, tuple):
+        return { '__tuple__': [ _encode_plan(v) for v in obj ] }
+    if isinstance(obj, list):
+        return [ _encode_plan(v) for v in obj ]
+    if isinstance(obj, dict):
+        for k in obj:
+            if not isinstance(k, str):
+                raise TypeError(k)
+        return { k: _encode_plan(v) for k, v in obj.items() }
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+
+    raise TypeError(obj)
+
+def _decode_plan(obj):
+
+    from .composer import BindParameter, LikeParameter
+
+    if len(obj) == 1:
+        if '__like__' in obj:
+            return LikeParameter(*obj['__like__'])
+        if '__bind__' in obj:
+            return BindParameter(obj['__bind__'])
+        if '__tuple__' in obj:
+            return tuple(obj['__tuple__'])
+
+    return obj
+
+#----------------------------------------------------------------------#
+# Result cache                                                         #
+#----------------------------------------------------------------------#
+
+ResultCacheInfo = namedtuple('ResultCacheInfo', ['hits', 'misses', 'evictions', 'max_bytes', 'currbytes', 'currsize'])
+
+class _Entry(object):
+
+    __slots__ = ('rows', 'indexes', 'expires', 'size')
+
+    def __init__(self, rows, indexes, expires, size):
+        self.rows    = rows
+        self.indexes = indexes
+        self.expires = expires
+        self.size    = size
+
+class ResultCache(object):
+
+    # Processed rows of executed queries, for ttl seconds (per query or
+    # global), least recently used first out beyond max_bytes
+    def __init__(self, ttl=10, max_bytes=64 * 1024 * 1024, clock=time.monotonic):
+
+        self.ttl       = ttl
+        self.max_bytes = max_bytes
+        self.clock     = clock
+
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._bytes   = 0
+        self._lock    = threading.Lock()
+
+    @staticmethod
+    def key(base_uri, query_descriptor):
+
+        # Everything the rows depend on: the request and the processing
+        key = {
+            'uri'       : base_uri,
+            'indexes'   : query_descriptor['indexes'],
+            'dsl'       : query_descriptor['dsl'],
+            'projection': query_descriptor.get('projection'),
+            'having'    : query_descriptor.get('having'),
+            'limit'     : query_descriptor.get('limit'),
+            'parameters': query_descriptor.get('parameter_values'),
+        }
+
+        data = json.dumps(key, sort_keys=True, default=repr)
+
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry.expires <= self.clock():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry.rows
+
+    def put(self, key, rows, indexes, ttl=None):
+
+        ttl  = self.ttl if ttl is None else ttl
+        size = _rows_size(rows)
+
+        # Too big to be cached at all
+        if ttl <= 0 or size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = _Entry(rows, list(indexes), self.clock() + ttl, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, index=None):
+
+        # Entries of the queries on an index; index patterns match both ways
+        with self._lock:
+            if index is None:
+                keys = list(self._entries)
+            else:
+                keys = [ key for key, entry in self._entries.items() if any(_index_match(index, pattern) for pattern in entry.indexes) ]
+
+            for key in keys:
+                self._remove(key)
+
+        return len(keys)
+
+    def info(self):
+        with self._lock:
+            return ResultCacheInfo(self.hits, self.misses, self.evictions, self.max_bytes, self._bytes, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes    = 0
+            self.hits      = 0
+            self.misses    = 0
+            self.evictions = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+def _index_match(index, pattern):
+    return index == pattern or fnmatch.fnmatchcase(index, pattern) or fnmatch.fnmatchcase(pattern, index)
+
+def _rows_size(rows):
+
+    # Approximate: the lists and their cells, containers one level deep
+    size = sys.getsizeof(rows)
+
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+            if isinstance(value, (list, tuple)):
+                size += sum(sys.getsizeof(v) for v in value)
+            elif isinstance(value, dict):
+                size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+
+    return size
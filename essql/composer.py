@@ -1,5 +1,167 @@
+import keyword
+import functools
 
 from .parser import *
+from . import instrumentation
+
+#----------------------------------------------------------------------#
+# Bind parameters                                                      #
+#----------------------------------------------------------------------#
+
+class BindParameter(object):
+
+    # Placeholder left in the DSL, replaced by PreparedStatement.bind()
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return isinstance(other, BindParameter) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'BindParameter(%r)' % (self.key)
+
+class LikeParameter(BindParameter):
+
+    # LIKE pattern given by a parameter: the clause (term, prefix or
+    # wildcard) depends on the value, bind() builds it
+    def __init__(self, key, field):
+        super().__init__(key)
+        self.field = field
+
+    def __eq__(self, other):
+        return isinstance(other, LikeParameter) and other.key == self.key and other.field == self.field
+
+    def __hash__(self):
+        return hash((self.key, self.field))
+
+    def __repr__(self):
+        return 'LikeParameter(%r, %r)' % (self.key, self.field)
+
+def _use_parameters(query_plan, keys):
+
+    parameters = query_plan['parameters']
+
+    for key in keys:
+        if key not in parameters:
+            parameters.append(key)
+
+def _substitute(obj, values):
+
+    if isinstance(obj, LikeParameter):
+        return _like_query(obj.field, values[obj.key])
+    if isinstance(obj, BindParameter):
+        return values[obj.key]
+    if isinstance(obj, dict):
+        return { k: _substitute(v, values) for k, v in obj.items() }
+    if isinstance(obj, list):
+        return [ _substitute(v, values) for v in obj ]
+    return obj
+
+class PreparedStatement(object):
+
+    def __init__(self, query_plan):
+
+        self.query_plan = query_plan
+
+        parameters = query_plan.get('parameters', [])
+
+        self.positional = sorted([ k for k in parameters if k[0] == '?' ], key=lambda k: int(k[1:]))
+        self.named      = [ k[1:] for k in parameters if k[0] == ':' ]
+
+    def bind(self, *args, **kwargs):
+
+        if len(args) != len(self.positional):
+            raise ValueError("Expected %d positional parameters, got %d" % (len(self.positional), len(args)))
+
+        # Plain names are downcased by the parser, quoted ones are not
+        kwargs = { (k if k in self.named else k.lower()): v for k, v in kwargs.items() }
+
+        unknown = set(kwargs) - set(self.named)
+        if unknown:
+            raise ValueError("Unknown parameters: %s" % (', '.join(sorted(unknown))))
+
+        missing = set(self.named) - set(kwargs)
+        if missing:
+            raise ValueError("Missing parameters: %s" % (', '.join(sorted(missing))))
+
+        values = dict(zip(self.positional, args))
+        for name, value in kwargs.items():
+            values[':' + name] = value
+
+        # Only the DSL is rebuilt, everything else is shared with the
+        # prepared plan
+        query_plan = dict(self.query_plan)
+        query_plan['dsl'             ] = _substitute(self.query_plan['dsl'], values)
+        query_plan['parameter_values'] = values
+
+        if 'limit' in query_plan:
+            query_plan['limit'] = _substitute(self.query_plan['limit'], values)
+
+        return query_plan
+
+#----------------------------------------------------------------------#
+# Row projection                                                       #
+#----------------------------------------------------------------------#
+
+# Names visible to the column expressions
+PROJECTION_GLOBALS = {
+    '__builtins__': {},
+    '_Error'      : Exception,
+
+    'int'  : int,
+    'float': float,
+    'str'  : str,
+    'max'  : max,
+    'min'  : min,
+    'abs'  : abs,
+    'pow'  : pow,
+}
+
+def python_name(symbol):
+    # Fields that are not valid Python names (@timestamp, quoted names,
+    # keywords) are bound to a mangled local variable
+    if symbol.isidentifier() and not keyword.iskeyword(symbol) and not symbol.startswith('_'):
+        return symbol
+    return '_f_' + symbol.encode('utf-8').hex()
+
+def projection_source(columns_processors):
+
+    symbols = []
+    for column_processor in columns_processors:
+        for sym_name in column_processor['used_symbols']:
+            if sym_name not in symbols:
+                symbols.append(sym_name)
+
+    lines = [
+        "def _project(_hit, _params):",
+        "    _src   = _hit.get('_source', _hit)",
+        "    _stats = _hit.get('stats')",
+    ]
+
+    for sym_name in symbols:
+        lines.append("    %s = _src.get(%r)" % (python_name(sym_name), sym_name))
+
+    for i, column_processor in enumerate(columns_processors):
+        lines.append("    try:")
+        lines.append("        _c%d = %s" % (i, column_processor['expr_python']))
+        lines.append("    except _Error:")
+        lines.append("        _c%d = None" % (i))
+
+    lines.append("    return [ %s ]" % (', '.join([ '_c%d' % (i) for i in range(len(columns_processors)) ])))
+
+    return '\n'.join(lines) + '\n'
+
+@functools.lru_cache(maxsize=256)
+def compile_projection(source):
+
+    namespace = dict(PROJECTION_GLOBALS)
+
+    exec(compile(source, '<projection>', 'exec'), namespace)
+
+    return namespace['_project']
 
 #----------------------------------------------------------------------#
 # Literals                                                             #
@@ -10,6 +172,7 @@ def EXPR_INFO_DATA():
     return  {
         'used_symbols'       : [],
         'used_aggr_functions': [],
+        'used_parameters'    : [],
         'expr'               : None,
         'expr_python'        : None,
         #'expr_literal'       : None,
@@ -35,6 +198,24 @@ class _ASTBoolLiteral(ASTBoolLiteral):
         expr_info['expr'       ] = [ str(self.value)  ]        
         expr_info['expr_python'] = [ repr(self.value) ]
     
+class _ASTNullLiteral(ASTNullLiteral):
+
+    def composeExpr(self, expr_info):
+        expr_info['expr'       ] = [ 'NULL' ]
+        expr_info['expr_python'] = [ 'None' ]
+    
+class _ASTBindParameter(ASTBindParameter):
+
+    @property
+    def value(self):
+        return BindParameter(self.key)
+
+    def composeExpr(self, expr_info):
+        expr_info['used_parameters'].append(self.key)
+
+        expr_info['expr'       ] = [ ':%s' % (self.name) if self.name is not None else '?' ]
+        expr_info['expr_python'] = [ '_params[%r]' % (self.key) ]
+
 class _ASTIdentifier(ASTIdentifier):
 
     def composeExpr(self, expr_info):
@@ -50,31 +231,75 @@ class _ASTIdentifier(ASTIdentifier):
         
         for i, key in enumerate(self.value.split('.')):
             
-            
-            
             if i == 0:
                 expr.append(key)
-                expr_python.append(key)
+                expr_python.append(python_name(key) if key != '*' else '_src')
             else:
                 expr       .append( '.%s'    % (key) )
-                expr_python.append( "['%s']" % (key) )
-        
-        print(__file__, '_ASTIdentifier', expr, expr_python)
+                expr_python.append( "[%r]"   % (key) )
         
         expr_info['expr'       ] = expr
         expr_info['expr_python'] = expr_python
 
+    # WHERE <boolean field>
+    def composeBool(self, query_plan, bool_obj):
+        bool_obj.setdefault('filter', []).append({ 'term': { self.value: True } })
+
 #----------------------------------------------------------------------#
 # Expressions                                                          #
 #----------------------------------------------------------------------#
 
+# SQL operators that are spelled differently in Python
+PYTHON_OPS = {
+    '='      : '==',
+    '<>'     : '!=',
+    '||'     : '+',
+    'AND'    : ' and ',
+    'OR'     : ' or ',
+    'NOT'    : 'not ',
+    'IS'     : ' is ',
+    'IS NOT' : ' is not ',
+    'IN'     : ' in ',
+    'NOT IN' : ' not in ',
+}
+
+POSTFIX_OPS = {
+    'ISNULL'  : ' is None',
+    'NOTNULL' : ' is not None',
+    'NOT NULL': ' is not None',
+}
+
 class _ASTUnaryExpr(ASTUnaryExpr):
 
     def composeExpr(self, expr_info):
         self.expr1.composeExpr(expr_info)
 
-        expr_info['expr'       ] = ['(', self.op, expr_info['expr'       ], ')' ]
-        expr_info['expr_python'] = ['(', self.op, expr_info['expr_python'], ')' ]
+        if self.op in POSTFIX_OPS:
+            expr_info['expr'       ] = ['(', ] + expr_info['expr'       ] + [ ' %s' % (self.op), ')' ]
+            expr_info['expr_python'] = ['(', ] + expr_info['expr_python'] + [ POSTFIX_OPS[self.op], ')' ]
+        else:
+            expr_info['expr'       ] = ['(', self.op, ] + expr_info['expr'       ] + [ ')' ]
+            expr_info['expr_python'] = ['(', PYTHON_OPS.get(self.op, self.op), ] + expr_info['expr_python'] + [ ')' ]
+
+    def composeBool(self, query_plan, bool_obj):
+
+        op = self.op.upper()
+
+        if op == 'NOT':
+            negated = {}
+            _compose_bool(self.expr1, query_plan, negated)
+            bool_obj.setdefault('must_not', []).append(_bool_clause(negated))
+            return
+
+        field = _filter_field(self.expr1)
+
+        if field is None or op not in POSTFIX_OPS:
+            raise Exception("Unsupported WHERE condition: %s" % (self.toString()))
+
+        if op == 'ISNULL':
+            bool_obj.setdefault('must_not', []).append(_exists(field))
+        else:
+            bool_obj.setdefault('filter', []).append(_exists(field))
 
 class _ASTBinaryExpr(ASTBinaryExpr):
 
@@ -93,14 +318,137 @@ class _ASTBinaryExpr(ASTBinaryExpr):
         #
 
         expr_info['expr'       ] = ['(', ] + expr1        + [ self.op ] + expr2        + [ ')' ]
-        expr_info['expr_python'] = ['(', ] + expr_python1 + [ self.op ] + expr_python2 + [ ')' ]
+        expr_info['expr_python'] = ['(', ] + expr_python1 + [ PYTHON_OPS.get(self.op, self.op) ] + expr_python2 + [ ')' ]
+
+    def composeBool(self, query_plan, bool_obj):
+
+        op = self.op.upper()
+
+        if op == 'AND':
+            _compose_bool(self.expr1, query_plan, bool_obj)
+            _compose_bool(self.expr2, query_plan, bool_obj)
+            return
+
+        if op == 'OR':
+
+            should  = []
+            scoring = False
+
+            for e in _or_operands(self):
+                branch = {}
+                _compose_bool(e, query_plan, branch)
+                scoring = scoring or 'must' in branch
+                should.append(_bool_clause(branch))
+
+            bool_obj.setdefault('must' if scoring else 'filter', []).append({ 'bool': { 'should': should } })
+            return
+
+        bool_obj.setdefault('filter', []).append(self.composeFilter(query_plan))
+
+    def composeFilter(self, query_plan):
+
+        op = self.op.upper()
+
+        expr1, expr2 = self.expr1, self.expr2
+
+        field = _filter_field(expr1)
+        if field is None and op in REVERSED_OPS:
+            field = _filter_field(expr2)
+            expr1, expr2, op = expr2, expr1, REVERSED_OPS[op]
+
+        if field is None:
+            raise Exception("Unsupported WHERE condition: %s" % (self.toString()))
+
+        if op in ('IS', 'IS NOT') and isinstance(expr2, ASTNullLiteral):
+            if op == 'IS':
+                return { 'bool': { 'must_not': [ _exists(field) ] } }
+            return _exists(field)
+
+        if op in ('IN', 'NOT IN'):
+            if not isinstance(expr2, ASTExprList):
+                raise Exception("Unsupported WHERE condition: %s" % (self.toString()))
+            clause = { 'terms': { field: [ _filter_value(e, query_plan) for e in expr2.exprs ] } }
+            return clause if op == 'IN' else _not_matching(field, clause)
+
+        value = _filter_value(expr2, query_plan)
+
+        if op in RANGE_OPS:
+            return { 'range': { field: { RANGE_OPS[op]: value } } }
+
+        if op in ('=', '==', 'IS'):
+            return { 'term': { field: value } }
+
+        if op in ('!=', '<>'):
+            return _not_matching(field, { 'term': { field: value } })
+
+        # IS NOT also matches the documents where the field is missing
+        if op == 'IS NOT':
+            return { 'bool': { 'must_not': [ { 'term': { field: value } } ] } }
+
+        if op in ('LIKE', 'NOT LIKE'):
+            clause = _like_query(field, value)
+        elif op in ('GLOB', 'NOT GLOB'):
+            clause = { 'wildcard': { field: value } }
+        elif op in ('REGEXP', 'NOT REGEXP'):
+            clause = { 'regexp': { field: value } }
+        else:
+            raise Exception("Unsupported WHERE condition: %s" % (self.toString()))
+
+        return clause if not op.startswith('NOT ') else _not_matching(field, clause)
 
 class _ASTTernaryExpr(ASTTernaryExpr):
 
     def composeExpr(self, expr_info):
-        self.expr1.composeExpr(expr_info)
-        self.expr2.composeExpr(expr_info)
-        self.expr3.composeExpr(expr_info)
+
+        parts = []
+        for e in (self.expr1, self.expr2, self.expr3):
+            e.composeExpr(expr_info)
+            parts.append( (expr_info['expr'], expr_info['expr_python']) )
+
+        (expr1, python1), (expr2, python2), (expr3, python3) = parts
+
+        # <expr1> [NOT] BETWEEN <expr2> AND <expr3>
+        negate = [ 'not ' ] if self.op.startswith('not') else []
+
+        expr_info['expr'       ] = ['(', ] + expr1 + [ ' %s ' % (self.op.upper()) ] + expr2 + [ ' AND ' ] + expr3 + [ ')' ]
+        expr_info['expr_python'] = ['(', ] + negate + ['(', ] + python2 + [ '<=' ] + python1 + [ '<=' ] + python3 + [ ')', ')' ]
+
+    def composeBool(self, query_plan, bool_obj):
+
+        field = _filter_field(self.expr1)
+        if field is None:
+            raise Exception("Unsupported WHERE condition: %s" % (self.toString()))
+
+        clause = { 'range': { field: { 'gte': _filter_value(self.expr2, query_plan), 'lte': _filter_value(self.expr3, query_plan) } } }
+
+        if self.op.startswith('not'):
+            clause = _not_matching(field, clause)
+
+        bool_obj.setdefault('filter', []).append(clause)
+
+class _ASTExprList(ASTExprList):
+
+    def composeExpr(self, expr_info):
+
+        expr        = [ '(' ]
+        expr_python = [ '(' ]
+
+        for i, e in enumerate(self.exprs):
+
+            e.composeExpr(expr_info)
+
+            if i > 0:
+                expr.append(',')
+
+            expr       .extend(expr_info['expr'       ])
+            expr_python.extend(expr_info['expr_python'])
+            expr_python.append(',')
+
+        expr        += [ ')' ]
+        expr_python += [ ')' ]
+
+        expr_info['expr'       ] = expr
+        expr_info['expr_python'] = expr_python
 
 class _ASTCall(ASTCall):
 
@@ -136,8 +484,6 @@ class _ASTCall(ASTCall):
         #
         expr        = [ '(', fun_name, '(' ]
         expr_python = [ '(', fun_name, '(' ]
-         
-        print(__file__, "XXXX", params_exprs)
         
         if not is_aggr_function:
             for i, pe in enumerate(params_exprs):
@@ -154,13 +500,18 @@ class _ASTCall(ASTCall):
         else:
             col_expr, col_expr_python = params_exprs[0]
             
-            print(__file__, "Y", col_expr, col_expr_python)
-            
             expr       .append( "%s"   % (col_expr[0]       ) )
-            expr_python.append( "'%s'" % (col_expr_python[0]) )
+
+            # Aggregated values are read from the bucket statistics
+            expr_string = '%s(%s)' % (fun_name, col_expr[0])
+
+            if fun_name.upper() == 'COUNT' and col_expr[0] == '*':
+                expr_python = [ '(', "_stats['count(*)']" ]
+            else:
+                expr_python = [ '(', "_stats[%r]['value']" % (expr_string) ]
             
         expr        += [ ')', ')' ]
-        expr_python += [ ')', ')' ]
+        expr_python += [ ')' ] if is_aggr_function else [ ')', ')' ]
         
         expr_info['expr'       ] = expr
         expr_info['expr_python'] = expr_python
@@ -171,15 +522,20 @@ class _ASTQueryString(ASTQueryString):
     def composeExpr(self, expr_info):
         raise Exception("QUERY STRING not allowed inside expression")
         
-    def composeQuery(self, query_plan):
- 
-        dsl_obj = query_plan['dsl']
+    # Full text queries keep their score: must, not filter
+    def composeBool(self, query_plan, bool_obj):
+
+        query_string = self.query_string
+
+        if isinstance(query_string, ASTBindParameter):
+            _use_parameters(query_plan, [ query_string.key ])
+            query_string = query_string.value
         
-        dsl_obj['query'] = {
+        bool_obj.setdefault('must', []).append({
                 'query_string': {
-                    'query': self.query_string
+                    'query': query_string
                 }
-        }
+        })
         
 #----------------------------------------------------------------------#
 # SELECT ...                                                           #
@@ -195,8 +551,7 @@ class _ASTSelectColumn(ASTSelectColumn):
         expr_info = EXPR_INFO_DATA()
         
         self.expr.composeExpr(expr_info)
-        
-        print(expr_info)
+
         #
         # Alias
         #
@@ -220,6 +575,8 @@ class _ASTSelectColumn(ASTSelectColumn):
         
         
         query_plan['columns_processors'].append(expr_info)
+
+        _use_parameters(query_plan, expr_info['used_parameters'])
         
         dsl_obj = query_plan['dsl'] 
         fields = dsl_obj.get('_source', dsl_obj.setdefault('_source', []))         
@@ -255,6 +612,96 @@ class _ASTFrom(ASTFrom):
 # WHERE                                                                #
 #----------------------------------------------------------------------#
 
+# Predicates are translated to a bool query. Comparisons are filter
+# clauses: not scored, and cached by the node query cache.
+
+RANGE_OPS = { '<': 'lt', '<=': 'lte', '>': 'gt', '>=': 'gte' }
+
+# 3 < a  ->  a > 3
+REVERSED_OPS = { '<': '>', '<=': '>=', '>': '<', '>=': '<=', '=': '=', '==': '==', '!=': '!=', '<>': '<>' }
+
+def _compose_bool(expr, query_plan, bool_obj):
+
+    compose = getattr(expr, 'composeBool', None)
+    if compose is None:
+        raise Exception("Unsupported WHERE condition: %s" % (expr.toString()))
+
+    compose(query_plan, bool_obj)
+
+def _bool_clause(bool_obj):
+
+    # A single clause doesn't need a bool of its own
+    clauses = [ (occur, clause) for occur, clause_list in bool_obj.items() for clause in clause_list ]
+
+    if len(clauses) == 1 and clauses[0][0] in ('filter', 'must'):
+        return clauses[0][1]
+
+    return { 'bool': bool_obj }
+
+def _filter_field(expr):
+
+    if isinstance(expr, ASTIdentifier) and expr.value != '*':
+        return expr.value
+
+    return None
+
+def _filter_value(expr, query_plan):
+
+    # -1 is parsed as an unary minus
+    if isinstance(expr, ASTUnaryExpr) and expr.op in ('-', '+') and isinstance(expr.expr1, ASTNumericLiteral):
+        return -expr.expr1.value if expr.op == '-' else expr.expr1.value
+
+    if isinstance(expr, (ASTNumericLiteral, ASTStringLiteral, ASTBoolLiteral)):
+        return expr.value
+
+    if isinstance(expr, ASTBindParameter):
+        _use_parameters(query_plan, [ expr.key ])
+        return BindParameter(expr.key)
+
+    raise Exception("Expected a literal or a parameter in WHERE condition, found %s" % (expr.toString()))
+
+def _or_operands(expr):
+
+    # a OR b OR c is a single should list
+    if isinstance(expr, ASTBinaryExpr) and expr.op.upper() == 'OR':
+        return _or_operands(expr.expr1) + _or_operands(expr.expr2)
+
+    return [ expr ]
+
+def _exists(field):
+    return { 'exists': { 'field': field } }
+
+def _not_matching(field, clause):
+    # Like SQL, a <> 1 doesn't match the documents where a is missing
+    return { 'bool': { 'filter': [ _exists(field) ], 'must_not': [ clause ] } }
+
+def _like_query(field, pattern):
+
+    if isinstance(pattern, BindParameter):
+        return LikeParameter(pattern.key, field)
+
+    if not isinstance(pattern, str):
+        raise ValueError("LIKE pattern must be a string, got %r" % (pattern,))
+
+    if '%' not in pattern and '_' not in pattern:
+        return { 'term': { field: pattern } }
+
+    if pattern.endswith('%') and '%' not in pattern[:-1] and '_' not in pattern[:-1]:
+        return { 'prefix': { field: pattern[:-1] } }
+
+    wildcard = []
+    for c in pattern:
+        if c == '%':
+            wildcard.append('*')
+        elif c == '_':
+            wildcard.append('?')
+        elif c in '*?\\':
+            wildcard.append('\\' + c)
+        else:
+            wildcard.append(c)
+
+    return { 'wildcard': { field: ''.join(wildcard) } }
+
 class _ASTWhere(ASTWhere):
 
     MATCH_ALL = { "match_all": {} }
@@ -269,8 +716,16 @@ class _ASTWhere(ASTWhere):
         if self.expr is None:
             o = _ASTWhere.MATCH_ALL
             dsl['query'] = o
+            return
+
+        bool_obj = {}
+        _compose_bool(self.expr, query_plan, bool_obj)
+
+        # A lone query string is sent as it is
+        if list(bool_obj) == [ 'must' ] and len(bool_obj['must']) == 1:
+            dsl['query'] = bool_obj['must'][0]
         else:
-            self.expr.composeQuery(query_plan)
+            dsl['query'] = { 'bool': bool_obj }
 
 #----------------------------------------------------------------------#
 # ORDER                                                                #
@@ -304,6 +759,20 @@ class _ASTOrder(ASTOrder):
 # GROUP / HAVING                                                       #
 #----------------------------------------------------------------------#
 
+# GROUP BY is a composite aggregation, paged by the executor with after_key
+GROUP_BY_AGGREGATION = '_group_by'
+GROUP_BY_PAGE_SIZE   = 1000
+
+def _metric_aggregation(fun_name, col_name):
+
+    # count(*) is the bucket doc_count
+    if fun_name.upper() == 'COUNT':
+        if col_name == '*':
+            return None
+        return { 'value_count': { 'field': col_name } }
+
+    return { fun_name: { 'field': col_name } }
+
 class _ASTGroup(ASTGroup):
 
     def composeQuery(self, query_plan):
@@ -313,120 +782,70 @@ class _ASTGroup(ASTGroup):
         fields = [ f_expr.value for f_expr in self.exprs ]
         
         query_plan['aggregation_fields'] = fields
-     
-        root_body = {
-            #'aggs': {}
-        }
-        
-        aggs_body = root_body
-        
-        for field_name in fields:
 
-            aggs_body['aggs'] = {}
+        sources = []
+
+        for field_name in fields:
 
             if field_name.endswith(".keyword"):
                 aggr_name = field_name.replace(".keyword","")
             else:
                 aggr_name = field_name 
-            
-            field_aggr_body = {
-                "terms": {
-                    "field": field_name,
-                    "missing": 0.00000000000000001, 
+
+            sources.append({
+                aggr_name: {
+                    "terms": {
+                        "field": field_name,
+                        "missing_bucket": True,
+                    },
                 },
-            }
-            
-            aggs_body['aggs'][aggr_name] = field_aggr_body
-            
-            aggs_body = field_aggr_body
+            })
 
-        aggs_body['aggs'] = {}
-        
         #
-        # Aggregation for min,max,avg(<field>)
+        # Aggregation for min,max,avg(<field>)...
         #
 
-        field_name = fields[-1]
-        
-        field_aggr_body = {
-            "stats": { 
-                "field": field_name 
-            } ,
-        }
-        counters_name = "stats(%s)" % (field_name)
-        aggs_body['aggs'][ counters_name ] = field_aggr_body
+        metrics = {}
 
+        # HAVING is evaluated by the executor on every bucket page: pipeline
+        # aggregations (bucket_selector) are not allowed under a composite
+        expr_infos = query_plan['columns_processors'] + query_plan.get('having_conditions', [])
 
-        
-        for col_info in query_plan['columns_processors']:
+        for col_info in expr_infos:
             
             for fun_name, expr_str, col_name,  in col_info['used_aggr_functions']:
 
-                field_aggr_body = {}
-                field_aggr_body[ fun_name ] =  { 
-                    "field": col_name 
-                }
-                exprid = expr_str #"stats(%s)" % (field_name)
-                aggs_body['aggs'][ exprid ] = field_aggr_body
-  
-  
-  
-                    #b_filter = {}
-                    #
-                    #script_expr = having_expr.replace( expr_str, 'params.val')
-                    #
-                    #b_filter = {
-                    #    "bucket_selector": {
-                    #        "buckets_path": {
-                    #            "val": exprid
-                    #        },
-                    #        "script": script_expr
-                    #    }
-                    #}
-                    #
-                    #aggs_body['aggs'][ "%s_filter" % (expr_str) ] = b_filter
-
-
-   
-        if 'having_conditions' in query_plan:
+                field_aggr_body = _metric_aggregation(fun_name, col_name)
 
+                if field_aggr_body is not None:
+                    metrics[ expr_str ] = field_aggr_body
 
-            for having_condition in query_plan['having_conditions']:
-                print( having_condition )
-                
-                having_expr = having_condition['expr']
-                
-                for fun_name, expr_str, col_name,  in having_condition['used_aggr_functions']:
-
-                    field_aggr_body = {}
-                    field_aggr_body[ fun_name ] =  { 
-                        "field": col_name 
-                    }
-                    exprid = expr_str #"stats(%s)" % (field_name)
-                    aggs_body['aggs'][ exprid ] = field_aggr_body
-  
-  
-  
-                    b_filter = {}
-                    
-                    script_expr = having_expr.replace( expr_str, 'params.val')
-                    
-                    b_filter = {
-                        "bucket_selector": {
-                            "buckets_path": {
-                                "val": exprid
-                            },
-                            "script": script_expr
-                        }
-                    }
-                    
-                    aggs_body['aggs'][ "%s_filter" % (expr_str) ] = b_filter
-                    
-
-
-        dsl_obj.update( root_body )
-        
-        #dsl_obj['size'] = 0
+        dsl_obj['aggs'] = {
+            GROUP_BY_AGGREGATION: {
+                "composite": {
+                    "size"   : GROUP_BY_PAGE_SIZE,
+                    "sources": sources,
+                },
+                "aggs": metrics,
+            }
+        }
+
+        # Only the buckets are read: no hits, and a response trimmed to the
+        # composite aggregation. Hit-free requests can be served by the
+        # shard request cache.
+        dsl_obj['size'] = 0
+
+        query_plan['request_params'] = {
+            'request_cache': 'true',
+            'filter_path'  : ','.join([
+                'error',
+                'aggregations.%s.after_key' % (GROUP_BY_AGGREGATION),
+                'aggregations.%s.buckets'   % (GROUP_BY_AGGREGATION),
+            ]),
+        }
+
+        if 'having_conditions' in query_plan:
+            query_plan['having'] = projection_source(query_plan['having_conditions'])
 
 
 class _ASTHaving(ASTHaving):
@@ -441,10 +860,10 @@ class _ASTHaving(ASTHaving):
             
             expr_info = EXPR_INFO_DATA()
             
-            print(__file__, "Z", expr_info)
-            
             having_expr.composeExpr(expr_info)
 
+            _use_parameters(query_plan, expr_info['used_parameters'])
+
             expr_info['expr']        = ''.join(  expr_info['expr'] )
             expr_info['expr_python'] = ''.join(  expr_info['expr_python'] )
            
@@ -464,7 +883,14 @@ class _ASTLimit(ASTLimit):
 
         val = self.expr.value
 
-        dsl['size'] = val
+        if isinstance(val, BindParameter):
+            _use_parameters(query_plan, [ val.key ])
+
+        # LIMIT counts the groups of an aggregation, the executor applies it
+        if GROUP_BY_AGGREGATION in dsl.get('aggs', {}):
+            query_plan['limit'] = val
+        else:
+            dsl['size'] = val
 
 #----------------------------------------------------------------------#
 #                                                                      #
@@ -507,6 +933,18 @@ class _ASTQuery(ASTQuery):
 
     def composeQuery(self):
 
+        if not instrumentation.enabled():
+            return self._composeQuery()
+
+        with instrumentation.timer() as t:
+            query_plan = self._composeQuery()
+
+        instrumentation.emit('compose', { 'elapsed': t.elapsed, 'indexes': query_plan['indexes'] })
+
+        return query_plan
+
+    def _composeQuery(self):
+
         query_plan = {
             #
             'indexes': [],
@@ -517,7 +955,10 @@ class _ASTQuery(ASTQuery):
             },
             
             # Columns
-            'columns_processors': []
+            'columns_processors': [],
+
+            # Bind parameters keys, see PreparedStatement
+            'parameters': [],
         }
         
         self.s.composeQuery(query_plan)
@@ -527,6 +968,8 @@ class _ASTQuery(ASTQuery):
         
         if self.l:
             self.l.composeQuery(query_plan)
+
+        query_plan['projection'] = projection_source(query_plan['columns_processors'])
         
         return query_plan
 
@@ -536,8 +979,8 @@ class _ASTQuery(ASTQuery):
 
 class ComposerParser(Parser):
 
-    def __init__(self):
-        return super().__init__()
+    def __init__(self, packrat=False, backend='pyparsing'):
+        return super().__init__(packrat, backend)
 
     # LITERALS
     
@@ -550,6 +993,12 @@ class ComposerParser(Parser):
     def createNumericLiteral(self, s):
         return _ASTNumericLiteral(s)
 
+    def createNullLiteral(self):
+        return _ASTNullLiteral()
+
+    def createBindParameter(self, name, loc):
+        return _ASTBindParameter(name, loc)
+
     def createIdentifier(self, s):
         return _ASTIdentifier(s)
 
@@ -564,6 +1013,9 @@ class ComposerParser(Parser):
     def createASTTernaryExpr(self, op, e1, e2, e3):
         return _ASTTernaryExpr(op, e1, e2, e3)
 
+    def createExprList(self, exprs):
+        return _ASTExprList(exprs)
+
     def createCall(self, name, params):
         return _ASTCall(name, params)
 
@@ -620,6 +1072,11 @@ class ComposerParser(Parser):
     def createQuery(self, s, o, l):
         return _ASTQuery(s, o, l)
 
+    # PREPARED STATEMENTS
+
+    def prepare(self, sql):
+        return PreparedStatement(self.parse(sql).composeQuery())
+
 #----------------------------------------------------------------------#
 #                                                                      #
 #----------------------------------------------------------------------#
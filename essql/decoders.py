@@ -0,0 +1,178 @@
+import json
+import threading
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+# A decoder turns the raw bytes of a response into Python objects:
+#
+#   decode(content, fields=None)
+#
+# fields are the _source keys used by the query: decoders parsing on
+# demand only materialize those, the others may ignore them.
+
+class JsonDecoder(object):
+
+    name         = 'json'
+    content_type = 'application/json'
+
+    def decode(self, content, fields=None):
+        # Bytes are parsed as they are, without decoding a str first
+        return json.loads(content)
+
+class OrjsonDecoder(object):
+
+    name         = 'orjson'
+    content_type = 'application/json'
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads
+
+    def decode(self, content, fields=None):
+        return self.loads(content)
+
+class SimdjsonDecoder(object):
+
+    name         = 'simdjson'
+    content_type = 'application/json'
+
+    def __init__(self):
+        import simdjson
+        self.simdjson = simdjson
+
+        # A parser holds one document at a time
+        self._local = threading.local()
+
+    @property
+    def parser(self):
+
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = self.simdjson.Parser()
+
+        return parser
+
+    def decode(self, content, fields=None):
+
+        doc = self.parser.parse(content)
+
+        try:
+            if fields is None or not isinstance(doc, self.simdjson.Object):
+                return self.materialize(doc)
+
+            results = {}
+            for key in doc.keys():
+                if key == 'hits':
+                    results[key] = self.decode_hits(doc[key], fields)
+                else:
+                    results[key] = self.materialize(doc[key])
+
+            return results
+        finally:
+            # The parser can't be reused while proxies are alive
+            del doc
+
+    def decode_hits(self, hits, fields):
+
+        results = {}
+
+        for key in hits.keys():
+
+            if key != 'hits':
+                results[key] = self.materialize(hits[key])
+                continue
+
+            rows = []
+            for hit in hits[key]:
+
+                row = {}
+                for k in hit.keys():
+                    if k != '_source':
+                        row[k] = self.materialize(hit[k])
+                        continue
+
+                    source = hit[k]
+                    row[k] = { f: self.materialize(source[f]) for f in fields if f in source }
+
+                rows.append(row)
+
+            results[key] = rows
+
+        return results
+
+    def materialize(self, value):
+
+        if isinstance(value, self.simdjson.Object):
+            return value.as_dict()
+        if isinstance(value, self.simdjson.Array):
+            return value.as_list()
+
+        return value
+
+#----------------------------------------------------------------------#
+# Binary formats                                                       #
+#----------------------------------------------------------------------#
+
+class CborDecoder(object):
+
+    name         = 'cbor'
+    content_type = 'application/cbor'
+
+    def __init__(self):
+        import cbor2
+        self.loads = cbor2.loads
+
+    def decode(self, content, fields=None):
+        return self.loads(content)
+
+# CBOR maps (major type 5) and the self-describe tag
+CBOR_FIRST_BYTES = set(range(0xa0, 0xc0)) | set([ 0xd9 ])
+
+# Binary responses are recognized from their first bytes: a JSON document
+# starts with '{', '[' or whitespace. None for JSON.
+def wire_decoder(content):
+
+    if content[:1] and content[0] in CBOR_FIRST_BYTES:
+        return get_decoder('cbor')
+
+    return None
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+DECODERS = {
+    'json'    : JsonDecoder,
+    'orjson'  : OrjsonDecoder,
+    'simdjson': SimdjsonDecoder,
+    'cbor'    : CborDecoder,
+}
+
+_decoders = {}
+_lock     = threading.Lock()
+
+# Decoder instance from a name, 'auto' (orjson when it is installed, json
+# otherwise) or a decoder object
+def get_decoder(decoder=None):
+
+    if decoder is None:
+        decoder = 'auto'
+
+    if not isinstance(decoder, str):
+        return decoder
+
+    with _lock:
+        if decoder not in _decoders:
+            if decoder == 'auto':
+                try:
+                    _decoders[decoder] = OrjsonDecoder()
+                except ImportError:
+                    _decoders[decoder] = JsonDecoder()
+            elif decoder in DECODERS:
+                _decoders[decoder] = DECODERS[decoder]()
+            else:
+                raise ValueError("Unknown decoder: %s" % (decoder))
+
+        return _decoders[decoder]
@@ -1,226 +1,1009 @@
 
 import json
-import requests
+import time
+import heapq
+import queue
+import threading
+import itertools
+import urllib.parse
 
-from .composer import ComposerParser
+from .composer import ComposerParser, compile_projection, GROUP_BY_AGGREGATION
+from .transport import default_transport
+from .decoders import get_decoder, wire_decoder
+from .results import ResultSet
+from . import instrumentation
+from . import arrow
 
 #----------------------------------------------------------------------#
 #                                                                      #
 #----------------------------------------------------------------------#
 
-class Executor(object):
+class ExecutionError(Exception):
 
-    def __init__(self, base_uri, query_descriptor):
+    def __init__(self, msg, status=None, response=None):
+        super().__init__(msg)
+        self.status   = status
+        self.response = response
+
+# State, cursors and row projection shared by Executor and the asyncio
+# executor; the requests are made by the subclasses
+class _BaseExecutor(object):
+
+    def __init__(self, base_uri, query_descriptor, vectorize=False, page_size=1000, decoder=None, result_cache=None, cache_ttl=None):
 
         self.base_uri         = base_uri
         self.query_descriptor = query_descriptor
 
-    def execute(self):
-        
-        query_descriptor = self.query_descriptor
+        # Response bytes to objects: 'json', 'orjson', 'simdjson' or 'auto'
+        self.decoder          = get_decoder(decoder)
+        self.source_fields    = _source_fields(query_descriptor)
+
+        # Evaluate numeric columns with numpy when it is installed
+        self.vectorize        = vectorize
+
+        # Hits evaluated together in vectorized mode
+        self.chunk_size       = 10000
+
+        # LIMIT above page_size is fetched with search_after under a
+        # point in time, page_size hits per request
+        self.page_size        = page_size
+        self.keep_alive       = '1m'
+
+        # Timings and counts of the last execution, see instrumentation
+        self.stats            = None
+
+        # execute() results kept by a cache.ResultCache, cache_ttl seconds
+        # or the default of the cache
+        self.result_cache     = result_cache
+        self.cache_ttl        = cache_ttl
+
+    def _cached_rows(self, key):
+
+        rows = self.result_cache.get(key)
+
+        if rows is not None:
+            stats = self.stats = instrumentation.QueryStats(self.query_descriptor['indexes'])
+            stats.cached = True
+            stats.add_rows(len(rows) - 1, 0.0)
+            _report('query', stats)
+
+        return rows
+
+    def _cursor(self, query_descriptor):
 
-        
         # Search query
         #
         dsl_obj = query_descriptor['dsl']
         
-        
         # Index Name
         index = ','.join( query_descriptor['indexes'] )
-        
-        # Source fields
-        fields = []
-        for column_processor in query_descriptor['columns_processors']:
-            symbols = column_processor['used_symbols']
-            fields.extend(symbols)
-            
-        
-        #
-        # PERFORM REQUEST
-        #
-        
-        uri = self.base_uri + '/' + index + '/_search'
-    
-        response = requests.get(uri, json=dsl_obj)
-        
-        results = json.loads(response.text)
-        
-        import pprint
-        pprint.pprint(results)
-        
-        # FIX: handle errors
 
-        #
-        # PROCESS RESPONSE
-        #   
-        
-        if 'aggregations' in results:
-            
-            aggregation_fields = query_descriptor['aggregation_fields']
+        if 'aggs' in dsl_obj:
 
-            aggregations = results['aggregations']            
-            
-            results = self._process_aggregation(aggregations, aggregation_fields)
-            
-            results = self.process_result(results, query_descriptor)
+            if GROUP_BY_AGGREGATION not in dsl_obj['aggs']:
+                return _NestedTermsCursor(index, dsl_obj, query_descriptor['aggregation_fields'], self._process_aggregation)
 
-            
-        else:
-        
-            hits = results['hits']['hits']
-    
-            results = self.process_result(hits, query_descriptor)
-        
-        return results
-        
+            having = None
+            if query_descriptor.get('having'):
+                having = compile_projection(query_descriptor['having'])
 
-    def compile_expr(self, expr_str):
-            return compile( expr_str, '<string>', 'eval')
-    
-    def evaluate_expr(self, exec_context, expr_str):
-            return eval(expr_str, {}, exec_context)
-   
+            path = _search_path(index, query_descriptor.get('request_params'))
 
-    def create_column_expr_contex(self, symbols=None):
-    
-            context = {
-            }
+            return _CompositeCursor(path, dsl_obj, query_descriptor.get('limit'), self.page_size, having, query_descriptor.get('parameter_values', {}))
+
+        size = dsl_obj.get('size')
+
+        if size is None or size <= self.page_size:
+            return _SearchCursor(index, dsl_obj)
+
+        return _PitCursor(index, dsl_obj, size, self.page_size, self.keep_alive)
 
-            for symbol in dir(__builtins__):
-                    context[ symbol ] = None
+    def _page_rows(self, page, query_descriptor):
 
-            context['int'   ] = int
-            context['float' ] = float
+        # The rows of a page are computed before they are yielded, so the
+        # time spent by the consumer is not counted
+        t0 = time.perf_counter()
 
-            context['max'   ] = max
-            context['min'   ] = min
-            context['abs'   ] = abs
-            context['pow'   ] = pow
+        rows = list(self.iter_result(page, query_descriptor))
 
-            context['str'  ] = str
+        if self.stats is not None:
+            self.stats.add_rows(len(rows), time.perf_counter() - t0)
+
+        return rows
+
+    def headers(self, query_descriptor):
+        return [ column_processor['alias'] for column_processor in query_descriptor['columns_processors'] ]
 
-            if symbols is not None:
-                    context.update(symbols)
-            
-            return context
-            
     def process_result(self, results, query_descriptor):
-                
-        results2 = []
-        
-        headers = []
-        
-        # STEP 1: compile expressions
-        for column_processor in query_descriptor['columns_processors']:
 
-                expr_string = column_processor['expr_python']
+        results2 = [ self.headers(query_descriptor) ]
+        results2.extend( self.iter_result(results, query_descriptor) )
+
+        return results2
+
+    def iter_result(self, results, query_descriptor):
+
+        params = query_descriptor.get('parameter_values', {})
+
+        if self.vectorize:
+            from .vectorize import project_rows
+
+            for i in range(0, len(results), self.chunk_size):
+                for row in project_rows(query_descriptor['columns_processors'], results[i:i + self.chunk_size], params):
+                    yield row
+            return
+
+        # One generated function computes all the columns of a row
+        project = compile_projection(query_descriptor['projection'])
 
-                column_processor['compiled_expr'] = self.compile_expr( expr_string  )
-                
-                headers.append( column_processor['alias'] )
-                
-        results2.append( headers )
-        
-        # STEP2: Process data
-        c = {}
-        column_expr_contex = self.create_column_expr_contex(c)
-        
-        
-        
-        def bind_COUNT(data):
-            def _count_fun(vtype):
-                if vtype == '*': return data['count(*)']
-                return None
-            return _count_fun
-
-        def bind_AGGR(vtype, data):
-            def _aggr_fun(field_name):
-                k_stats = '%s(%s)' % (vtype,field_name)
-                return data[k_stats]['value'] 
-                 
-            return _aggr_fun
-        
         for row in results:
+            yield project(row, params)
 
-                column_expr_contex['count'] = bind_COUNT(row.get('stats'))
-                column_expr_contex['min'  ] = bind_AGGR('min', row.get('stats'))
-                column_expr_contex['avg'  ] = bind_AGGR('avg', row.get('stats'))
-                column_expr_contex['max'  ] = bind_AGGR('max', row.get('stats'))
-                column_expr_contex['sum'  ] = bind_AGGR('sum', row.get('stats'))
-        
-                column_values = []
-        
-                for colum_num, column_processor in enumerate(query_descriptor['columns_processors']):
-        
-                                compiled_expr = column_processor['compiled_expr']
-                                
-                                symbols = column_processor['used_symbols']
-        
-                                try:
-                                        for sym_name in symbols:            
-                                                
-                                                if '_source' in row:
-                                                    row = row['_source']
-                                                
-                                                if sym_name in row:  
-                                                    v = row[sym_name]
-                                                
-                                                    column_expr_contex[ sym_name ] = v
-                                                
-                                        computed_val = self.evaluate_expr(column_expr_contex, compiled_expr)
-        
-                                except Exception as e:
-                                        print(__file__, colum_num, type(e), str(e))
-                                        computed_val = None
-        
-                                column_values.append(computed_val)
-        
-                results2.append( column_values )
-        
-        return results2
+    # Lists of columns, chunk_size rows at a time; numeric columns are
+    # numpy arrays in vectorized mode
+    def iter_columns(self, results, query_descriptor):
 
-    def _process_aggregation(self, aggr_data, aggr_fields, level=0, field_values=[], stats=None):
-        
-        stats = stats if stats is not None else {}
-        
-        if level < (len(aggr_fields)):
-    
-            field_name = aggr_fields[level]
-            
-            if field_name.endswith(".keyword"):
-                field_name = field_name.replace(".keyword","")
-                  
-            field_data = aggr_data[field_name]
-                    
-            buckets = field_data['buckets']
-            
-            table = []
-            for b in buckets:
-                field_value = b['key']
-                
-                stats2 = dict(stats)
-
-                table += self._process_aggregation(b, aggr_fields, level+1, field_values + [ (field_name, field_value), ] , stats2)
-    
-            return table
-    
+        from .vectorize import project_columns, row_columns
+
+        params = query_descriptor.get('parameter_values', {})
+
+        for i in range(0, len(results), self.chunk_size):
+            chunk = results[i:i + self.chunk_size]
+
+            if self.vectorize:
+                yield project_columns(query_descriptor['columns_processors'], chunk, params, arrays=True)
+            else:
+                yield row_columns(query_descriptor['columns_processors'], chunk, params)
+
+    def _process_aggregation(self, aggr_data, aggr_fields):
+        return _flatten_buckets(aggr_data, aggr_fields)
+
+    def _mapping_request(self):
+        return (','.join(self.query_descriptor['indexes']) + '/_mapping', None, 'GET')
+
+    def _arrow_columns(self, pa, mapping=None):
+
+        # mapping: response of _mapping_request(), for the types of the
+        # plain fields
+        query_descriptor = self.query_descriptor
+
+        names = arrow.column_names(query_descriptor)
+        types = [ None ] * len(names)
+
+        if mapping is not None:
+            types = arrow.column_types(pa, query_descriptor, arrow.mapping_fields(mapping))
+
+        return names, types
+
+    def _page_batches(self, pa, names, types, page):
+
+        for columns in self.iter_columns(page, self.query_descriptor):
+            t0 = time.perf_counter()
+
+            batch = arrow.record_batch(pa, names, columns, types)
+
+            self.stats.add_rows(batch.num_rows, time.perf_counter() - t0)
+
+            yield batch
+
+class Executor(_BaseExecutor):
+
+    def __init__(self, base_uri, query_descriptor, vectorize=False, page_size=1000, transport=None, decoder=None, result_cache=None, cache_ttl=None):
+
+        super().__init__(base_uri, query_descriptor, vectorize, page_size, decoder, result_cache, cache_ttl)
+
+        # HTTP connections, shared by default with the other executors
+        self.transport = transport if transport is not None else default_transport()
+
+    def execute(self):
+
+        if self.result_cache is None:
+            return list(self.execute_iter())
+
+        key  = self.result_cache.key(self.base_uri, self.query_descriptor)
+        rows = self._cached_rows(key)
+
+        if rows is None:
+            rows = list(self.execute_iter())
+            self.result_cache.put(key, rows, self.query_descriptor['indexes'], self.cache_ttl)
+
+        # The cached rows are never handed out
+        return [ list(row) for row in rows ]
+
+    # Same rows as execute() in a results.ResultSet, stored by column
+    def execute_resultset(self, intern=True):
+
+        rows = self.execute_iter()
+        header = next(rows)
+
+        return ResultSet.from_rows(header, rows, intern)
+
+    # Arrow record batches of the rows (needs pyarrow), with the types of
+    # the index mapping for plain fields when mapping=True
+    def iter_arrow(self, mapping=False):
+
+        pa = arrow.import_pyarrow()
+
+        names, types = self._arrow_columns(pa, self._request(*self._mapping_request()) if mapping else None)
+
+        return self._iter_arrow(pa, names, types)
+
+    def execute_arrow(self, mapping=False):
+
+        pa = arrow.import_pyarrow()
+
+        names, types = self._arrow_columns(pa, self._request(*self._mapping_request()) if mapping else None)
+
+        return arrow.make_table(pa, names, types, list(self._iter_arrow(pa, names, types)))
+
+    def _iter_arrow(self, pa, names, types):
+
+        query_descriptor = self.query_descriptor
+
+        stats = self.stats = instrumentation.QueryStats(query_descriptor['indexes'])
+
+        try:
+            for page in self._iter_cursor( self._cursor(query_descriptor) ):
+                for batch in self._page_batches(pa, names, types, page):
+                    yield batch
+        finally:
+            _report('query', stats)
+
+    def to_pandas(self, mapping=False, **kwargs):
+        return arrow.to_pandas(self.execute_arrow(mapping), **kwargs)
+
+    # Header, then one row at a time
+    def execute_iter(self):
+
+        query_descriptor = self.query_descriptor
+
+        stats = self.stats = instrumentation.QueryStats(query_descriptor['indexes'])
+
+        try:
+            #
+            # PERFORM REQUEST
+            #
+
+            pages = self._iter_cursor( self._cursor(query_descriptor) )
+
+            # Errors of the first request are raised before the header
+            first_page = next(pages, [])
+
+            #
+            # PROCESS RESPONSE
+            #   
+
+            yield self.headers(query_descriptor)
+
+            for row in self._page_rows(first_page, query_descriptor):
+                yield row
+
+            del first_page
+
+            for page in pages:
+                for row in self._page_rows(page, query_descriptor):
+                    yield row
+        finally:
+            _report('query', stats)
+
+    def _iter_cursor(self, cursor):
+
+        try:
+            while True:
+                request = cursor.next_request()
+                if request is None:
+                    break
+
+                page = cursor.feed( self._request(*request) )
+
+                if page:
+                    yield page
+        finally:
+            request = cursor.close_request()
+            if request is not None:
+                # Best effort: a failed close must not hide the error
+                # being raised, nor escape from generator.close()
+                try:
+                    self._request(*request)
+                except Exception:
+                    pass
+
+    # Header, then the rows of all the matching documents, fetched by
+    # "slices" concurrent PIT slices. With ordered=True the slices are
+    # merged following ORDER BY, otherwise rows come as pages arrive.
+    def export(self, slices=4, ordered=False, queue_size=4):
+
+        query_descriptor = self.query_descriptor
+
+        dsl_obj = query_descriptor['dsl']
+
+        if 'aggs' in dsl_obj:
+            raise ExecutionError("GROUP BY queries can't be exported")
+
+        index = ','.join( query_descriptor['indexes'] )
+        limit = dsl_obj.get('size')
+
+        stats = self.stats = instrumentation.QueryStats(query_descriptor['indexes'])
+
+        pit_id = self._request( *_PitCursor.open_request(index, self.keep_alive) )['id']
+
+        stop = threading.Event()
+
+        # Bounded queues of pages: slow consumers block the slices
+        if ordered:
+            queues = [ queue.Queue(queue_size) for _ in range(slices) ]
+        else:
+            queues = [ queue.Queue(queue_size * slices) ] * slices
+
+        cursors = [
+            _PitCursor(index, dsl_obj, limit, self.page_size, self.keep_alive, pit_id, i, slices)
+            for i in range(slices)
+        ]
+
+        threads = [
+            threading.Thread(target=self._export_slice, args=(cursors[i], queues[i], stop), daemon=True)
+            for i in range(slices)
+        ]
+
+        try:
+            for t in threads:
+                t.start()
+
+            if ordered:
+                hits = heapq.merge(*[ _drain(q, 1) for q in queues ], key=_sort_key(_pit_sort(dsl_obj)))
+            else:
+                hits = _drain(queues[0], slices)
+
+            if limit is not None:
+                hits = itertools.islice(hits, limit)
+
+            # Errors of the first requests are raised before the header
+            chunk = list(itertools.islice(hits, self.page_size))
+
+            yield self.headers(query_descriptor)
+
+            while chunk:
+                for row in self._page_rows(chunk, query_descriptor):
+                    yield row
+                chunk = list(itertools.islice(hits, self.page_size))
+
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+            try:
+                self._request( *_PitCursor.close_pit_request(pit_id) )
+            except Exception:
+                pass
+            _report('query', stats)
+
+    def _export_slice(self, cursor, q, stop):
+
+        try:
+            for hits in self._iter_cursor(cursor):
+                if not _put(q, hits, stop):
+                    return
+        except Exception as e:
+            _put(q, e, stop)
+
+        _put(q, _DONE, stop)
+
+    # Header, then lists of up to batch_size rows
+    def stream(self, batch_size=1000):
+
+        rows = self.execute_iter()
+
+        yield next(rows)
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def _request(self, path, body, method='GET'):
+
+        uri = self.base_uri.rstrip('/') + '/' + path
+
+        t0 = time.perf_counter()
+
+        status, content = self.transport.request(method, uri, body)
+
+        t1 = time.perf_counter()
+
+        try:
+            return decode_response(uri, status, content, self.decoder, self.source_fields)
+        finally:
+            if self.stats is not None:
+                self.stats.add_request(t1 - t0, time.perf_counter() - t1, len(content))
+
+#----------------------------------------------------------------------#
+# Batches                                                              #
+#----------------------------------------------------------------------#
+
+# Runs many statements (SQL or query descriptors) sharing round trips: the
+# searches of all the statements go in one _msearch request, the following
+# pages in the next ones. Results are in the same order as the statements,
+# header and rows like execute(), or the exception of a failed statement.
+def execute_many(base_uri, statements, transport=None, plan_cache=None, **kwargs):
+
+    transport = transport if transport is not None else default_transport()
+    decoder   = get_decoder(kwargs.get('decoder'))
+
+    parser  = None
+    results = []
+    active  = []
+
+    # One report for the whole batch
+    stats = instrumentation.QueryStats([])
+
+    for i, statement in enumerate(statements):
+        try:
+            if not isinstance(statement, str):
+                query_descriptor = statement
+            elif plan_cache is not None:
+                query_descriptor = plan_cache.get_plan(statement)
+            else:
+                parser = parser or ComposerParser()
+                query_descriptor = parser.parse(statement).composeQuery()
+
+            executor = Executor(base_uri, query_descriptor, transport=transport, **kwargs)
+            cursor   = executor._cursor(query_descriptor)
+
+            executor.stats = stats
+            stats.indexes.extend(query_descriptor['indexes'])
+
+        except Exception as e:
+            results.append(e)
+            continue
+
+        results.append([ executor.headers(query_descriptor) ])
+        active.append((i, executor, cursor))
+
+    def fail(entry, error):
+        results[entry[0]] = error
+        _close_cursor(entry[1], entry[2])
+
+    def feed(entry, response):
+        i, executor, cursor = entry
+        page = cursor.feed(response)
+        if page:
+            results[i].extend(executor._page_rows(page, executor.query_descriptor))
+
+    try:
+        while active:
+
+            searches = []
+            running  = []
+
+            for entry in active:
+                i, executor, cursor = entry
+                try:
+                    request = cursor.next_request()
+                    if request is None:
+                        _close_cursor(executor, cursor)
+                    elif _msearch_header(request) is not None:
+                        searches.append((entry, request))
+                    else:
+                        # Point in time requests can't be batched
+                        feed(entry, executor._request(*request))
+                        running.append(entry)
+                except Exception as e:
+                    fail(entry, e)
+
+            if searches:
+                uri = base_uri.rstrip('/') + '/_msearch'
+
+                try:
+                    t0 = time.perf_counter()
+                    status, content = transport.request('POST', uri, _msearch_body([ request for _, request in searches ]))
+                    t1 = time.perf_counter()
+                    responses = decode_response(uri, status, content, decoder)['responses']
+                    stats.add_request(t1 - t0, time.perf_counter() - t1, len(content))
+                except Exception as e:
+                    for entry, _ in searches:
+                        fail(entry, e)
+                    responses = []
+
+                for (entry, request), response in zip(searches, responses):
+                    try:
+                        check_response(uri, response.get('status', 200), response)
+                        feed(entry, response)
+                        running.append(entry)
+                    except Exception as e:
+                        fail(entry, e)
+
+            active = [ entry for entry in running if not isinstance(results[entry[0]], Exception) ]
+
+    finally:
+        for _, executor, cursor in active:
+            _close_cursor(executor, cursor)
+
+        data = stats.as_dict()
+        data['statements'] = len(results)
+        _emit('batch', data)
+
+    return results
+
+def _report(event, stats):
+    _emit(event, stats.as_dict())
+
+def _emit(event, data):
+    if instrumentation.enabled():
+        instrumentation.emit(event, data)
+
+def _msearch_header(request):
+
+    # Header line of a search request, None for the other requests
+    path, body, method = request
+
+    path, _, query = path.partition('?')
+
+    if path == '_search':
+        header = {}
+    elif path.endswith('/_search'):
+        header = { 'index': path[:-len('/_search')] }
+    else:
+        return None
+
+    # filter_path only applies to the whole _msearch response
+    params = urllib.parse.parse_qs(query)
+    if 'request_cache' in params:
+        header['request_cache'] = params['request_cache'][0] == 'true'
+
+    return header
+
+def _msearch_body(requests):
+
+    lines = []
+    for request in requests:
+        lines.append(json.dumps(_msearch_header(request)))
+        lines.append(json.dumps(request[1] or {}))
+
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def _close_cursor(executor, cursor):
+
+    request = cursor.close_request()
+    if request is not None:
+        try:
+            executor._request(*request)
+        except Exception:
+            pass
+
+#----------------------------------------------------------------------#
+# Responses                                                            #
+#----------------------------------------------------------------------#
+
+def decode_response(uri, status, content, decoder=None, fields=None):
+
+    # CBOR responses, when the transport asks for them
+    binary = wire_decoder(content)
+
+    if binary is not None:
+        decoder = binary
+    elif decoder is None:
+        decoder = get_decoder()
+
+    try:
+        results = decoder.decode(content, fields)
+    except ValueError:
+        raise ExecutionError("Invalid response from %s (HTTP %d)" % (uri, status), status, content)
+
+    check_response(uri, status, results)
+
+    return results
+
+def check_response(uri, status, results):
+
+    if status >= 400 or 'error' in results:
+        error = results.get('error')
+        if isinstance(error, dict):
+            error = '%s: %s' % (error.get('type'), error.get('reason'))
+        raise ExecutionError("Request to %s failed (HTTP %d): %s" % (uri, status, error), status, results)
+
+def _source_fields(query_descriptor):
+
+    # The _source keys read by the columns, None when the projection uses
+    # the whole document (SELECT *)
+    columns_processors = query_descriptor.get('columns_processors', [])
+
+    if any('_src' in column_processor['expr_python'] for column_processor in columns_processors):
+        return None
+
+    fields = []
+    for column_processor in columns_processors:
+        for sym_name in column_processor['used_symbols']:
+            if sym_name not in fields:
+                fields.append(sym_name)
+
+    return fields
+
+#----------------------------------------------------------------------#
+# Cursors                                                              #
+#----------------------------------------------------------------------#
+
+def _search_path(index, request_params=None):
+
+    if not request_params:
+        return index + '/_search'
+
+    return index + '/_search?' + urllib.parse.urlencode(request_params, safe=',')
+
+# A cursor holds the paging state of a query and does no I/O: the executor
+# sends next_request() (path, body, method) until it is None, passes every
+# decoded response to feed() which returns the hits or rows of the page,
+# and finally sends close_request() if there is one.
+
+class _Cursor(object):
+
+    def next_request(self):
+        raise NotImplementedError()
+
+    def feed(self, results):
+        raise NotImplementedError()
+
+    def close_request(self):
+        return None
+
+class _SearchCursor(_Cursor):
+
+    def __init__(self, index, dsl_obj):
+        self.request = (_search_path(index), dsl_obj, 'GET')
+
+    def next_request(self):
+        request, self.request = self.request, None
+        return request
+
+    def feed(self, results):
+        return results['hits']['hits']
+
+class _NestedTermsCursor(_SearchCursor):
+
+    def __init__(self, index, dsl_obj, aggregation_fields, flatten):
+        super().__init__(index, dsl_obj)
+        self.aggregation_fields = aggregation_fields
+        self.flatten            = flatten
+
+    def feed(self, results):
+        return self.flatten(results['aggregations'], self.aggregation_fields)
+
+class _CompositeCursor(_Cursor):
+
+    def __init__(self, path, dsl_obj, limit, page_size, having, params):
+
+        self.path   = path
+        self.having = having
+        self.params = params
+        self.done   = False
+
+        # Bucket pages of page_size groups
+        aggs = dsl_obj['aggs']
+
+        group_by  = dict(aggs[GROUP_BY_AGGREGATION])
+        composite = dict(group_by['composite'], size=page_size)
+
+        group_by['composite'] = composite
+
+        self.composite = composite
+        self.names     = [ list(source)[0] for source in composite['sources'] ]
+
+        self.body = dict(dsl_obj)
+        self.body['aggs'] = dict(aggs)
+        self.body['aggs'][GROUP_BY_AGGREGATION] = group_by
+
+        # LIMIT applies to the groups
+        self.remaining = limit
+
+    def next_request(self):
+
+        if self.done or (self.remaining is not None and self.remaining <= 0):
+            return None
+
+        return (self.path, self.body, 'GET')
+
+    def feed(self, results):
+
+        group_data = results['aggregations'][GROUP_BY_AGGREGATION]
+
+        buckets = page = group_data['buckets']
+
+        if self.having is not None:
+            page = [ b for b in page if all(self.having(_composite_row(b), self.params)) ]
+
+        if self.remaining is not None:
+            page = page[:self.remaining]
+            self.remaining -= len(page)
+
+        after_key = group_data.get('after_key')
+
+        if after_key is None or len(buckets) < self.composite['size']:
+            self.done = True
         else:
-            field_name = aggr_fields[-1]
-
-            row = dict( field_values ) 
-
-            stats_name = 'count(*)'
-            v = aggr_data['doc_count']
-            stats[stats_name] = v
-            
-            
-            keys = set(aggr_data.keys()) - set(['doc_coount', 'key'])
-            for k in keys:
-                stats[k] = aggr_data[k]
-            
-            row['stats'] = stats
-            
-            return [ row ]
+            self.composite['after'] = after_key
+
+        # Columns for the vectorized evaluator, like nested terms
+        return _composite_columns(self.names, page)
+
+class _PitCursor(_Cursor):
+
+    # Opens its own point in time unless pit_id is given (export slices)
+    def __init__(self, index, dsl_obj, size, page_size, keep_alive, pit_id=None, slice_id=None, slices=None):
+
+        self.index      = index
+        self.page_size  = page_size
+        self.keep_alive = keep_alive
+        self.pit_id     = pit_id
+        self.own_pit    = pit_id is None
+        self.remaining  = size
+        self.done       = False
+
+        body = dict(dsl_obj)
+
+        # Without an explicit order, _shard_doc is the cheapest one;
+        # otherwise ES adds _shard_doc as tiebreaker itself
+        body['sort'] = _pit_sort(dsl_obj)
+        body['track_total_hits'] = False
+
+        if slices is not None and slices > 1:
+            body['slice'] = { 'id': slice_id, 'max': slices }
+
+        self.body = body
+
+    @staticmethod
+    def open_request(index, keep_alive):
+        return (index + '/_pit?keep_alive=' + keep_alive, None, 'POST')
+
+    @staticmethod
+    def close_pit_request(pit_id):
+        return ('_pit', { 'id': pit_id }, 'DELETE')
+
+    def next_request(self):
+
+        if self.pit_id is None:
+            return _PitCursor.open_request(self.index, self.keep_alive)
+
+        if self.done or (self.remaining is not None and self.remaining <= 0):
+            return None
+
+        body = self.body
+        body['size'] = self.page_size if self.remaining is None else min(self.page_size, self.remaining)
+        body['pit' ] = { 'id': self.pit_id, 'keep_alive': self.keep_alive }
+
+        return ('_search', body, 'GET')
+
+    def feed(self, results):
+
+        if self.pit_id is None:
+            self.pit_id = results['id']
+            return []
+
+        self.pit_id = results.get('pit_id', self.pit_id)
+
+        hits = results['hits']['hits']
+
+        if len(hits) < self.body['size']:
+            self.done = True
+
+        if hits:
+            if self.remaining is not None:
+                self.remaining -= len(hits)
+            self.body['search_after'] = hits[-1]['sort']
+
+        return hits
+
+    def close_request(self):
+
+        if self.own_pit and self.pit_id is not None:
+            return _PitCursor.close_pit_request(self.pit_id)
+
+        return None
+
+#----------------------------------------------------------------------#
+# Aggregation helpers                                                  #
+#----------------------------------------------------------------------#
+
+def _bucket_stats(bucket):
+
+    stats = {}
+    for k, v in bucket.items():
+        if k != 'key':
+            stats[k] = v
+    stats['count(*)'] = bucket['doc_count']
+
+    return stats
+
+def _composite_row(bucket):
+
+    # Same layout as the rows of _BucketColumns
+    row = dict(bucket['key'])
+    row['stats'] = _bucket_stats(bucket)
+
+    return row
+
+def _composite_columns(names, buckets):
+    return _BucketColumns(names, [ [ b['key'].get(name) for b in buckets ] for name in names ], buckets)
+
+def _flatten_buckets(aggr_data, aggr_fields):
+
+    # Nested terms aggregations, one level per field, walked once without
+    # recursion: the leaf buckets of a parent are added all together
+    names = [ field_name.replace('.keyword', '') for field_name in aggr_fields ]
+    depth = len(names)
+
+    keys    = [ [] for _ in names ]
+    buckets = []
+
+    path = [ None ] * depth
+
+    if depth == 1:
+        _add_leaves(keys, buckets, path, aggr_data[names[0]]['buckets'])
+        stack = []
+    else:
+        stack = [ (0, iter(aggr_data[names[0]]['buckets'])) ]
+
+    while stack:
+        level, parents = stack[-1]
+
+        bucket = next(parents, None)
+        if bucket is None:
+            stack.pop()
+            continue
+
+        path[level] = bucket['key']
+
+        children = bucket[names[level + 1]]['buckets']
+
+        if level + 2 < depth:
+            stack.append((level + 1, iter(children)))
+        else:
+            _add_leaves(keys, buckets, path, children)
+
+    return _BucketColumns(names, keys, buckets)
+
+def _add_leaves(keys, buckets, path, leaves):
+
+    n = len(leaves)
+
+    for i in range(len(keys) - 1):
+        keys[i].extend(itertools.repeat(path[i], n))
+
+    keys[-1].extend([ b['key'] for b in leaves ])
+    buckets.extend(leaves)
+
+class _BucketColumns(object):
+
+    # Flattened nested terms or a composite page: one list of keys per
+    # GROUP BY field and the leaf buckets. Rows ({ field: key, ..., 'stats': {...} }) are built
+    # only while iterating, the vectorized evaluator reads the columns.
+    def __init__(self, names, keys, buckets):
+        self.names   = names
+        self.keys    = keys
+        self.buckets = buckets
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def __iter__(self):
+
+        names = self.names
+
+        for values, bucket in zip(zip(*self.keys), self.buckets):
+            row = dict(zip(names, values))
+            row['stats'] = _bucket_stats(bucket)
+            yield row
+
+    def __getitem__(self, i):
+
+        if isinstance(i, slice):
+            return _BucketColumns(self.names, [ column[i] for column in self.keys ], self.buckets[i])
+
+        row = dict(zip(self.names, [ column[i] for column in self.keys ]))
+        row['stats'] = _bucket_stats(self.buckets[i])
+
+        return row
+
+    def field_values(self, path):
+
+        # Same values as vectorize.field_values on the rows, ('_stats', ...)
+        # for the statistics
+        name = path[0]
+
+        if name == '_stats':
+            stat = path[1]
+            if stat == 'count(*)':
+                values = [ b['doc_count'] for b in self.buckets ]
+            elif stat == 'key':
+                values = [ None ] * len(self.buckets)
+            else:
+                values = [ b.get(stat) for b in self.buckets ]
+            keys = path[2:]
+        elif name in self.names:
+            # The last one, like dict(zip(names, ...))
+            values = list(self.keys[len(self.names) - 1 - self.names[::-1].index(name)])
+            keys = path[1:]
+        else:
+            return [ None ] * len(self.buckets)
+
+        for key in keys:
+            values = [ v.get(key) if isinstance(v, dict) else None for v in values ]
+
+        return values
+
+#----------------------------------------------------------------------#
+# Export helpers                                                       #
+#----------------------------------------------------------------------#
+
+_DONE = object()
+
+def _put(q, item, stop):
+
+    # False when the consumer went away
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+def _drain(q, producers):
+
+    # Hits of the pages put by "producers" slices
+    while producers:
+        item = q.get()
+
+        if item is _DONE:
+            producers -= 1
+        elif isinstance(item, Exception):
+            raise item
+        else:
+            for hit in item:
+                yield hit
+
+def _pit_sort(dsl_obj):
+    return list(dsl_obj.get('sort') or [ { '_shard_doc': 'asc' } ])
+
+class _SortKey(object):
+
+    __slots__ = ('values', 'desc')
+
+    def __init__(self, values, desc):
+        self.values = values
+        self.desc   = desc
+
+    def __lt__(self, other):
+
+        for a, b, desc in zip(self.values, other.values, self.desc):
+            if a == b:
+                continue
+            # Missing values last, like ES does by default
+            if a is None:
+                return False
+            if b is None:
+                return True
+            return a > b if desc else a < b
+
+        return False
+
+def _sort_key(sort):
+
+    desc = []
+    for term in sort:
+        order = list(term.values())[0] if isinstance(term, dict) else 'asc'
+        if isinstance(order, dict):
+            order = order.get('order', 'asc')
+        desc.append(order == 'desc')
+
+    # The tiebreaker added by ES is ascending
+    desc.append(False)
+
+    return lambda hit: _SortKey(hit['sort'], desc)
 
 #----------------------------------------------------------------------#
 #                                                                      #
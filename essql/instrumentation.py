@@ -0,0 +1,101 @@
+import time
+import logging
+import threading
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+# Events are reported to the 'essql' logger at debug level and to the
+# listeners, callables taking (event, data):
+#
+#   parse    elapsed, backend, sql_length
+#   compose  elapsed, indexes
+#   query    QueryStats.as_dict(): indexes, requests, bytes, rows, the
+#            http, decode and rows_time seconds and cached
+#   batch    same as query, for execute_many, plus statements
+
+logger = logging.getLogger('essql')
+
+_listeners = []
+
+def add_listener(callback):
+    _listeners.append(callback)
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+def enabled():
+    return bool(_listeners) or logger.isEnabledFor(logging.DEBUG)
+
+def emit(event, data):
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('%s %s', event, ' '.join([ '%s=%s' % (k, _format(k, v)) for k, v in data.items() ]))
+
+    for callback in list(_listeners):
+        callback(event, data)
+
+def _format(key, value):
+    if isinstance(value, float):
+        return '%.3fms' % (value * 1000)
+    if isinstance(value, (list, tuple)):
+        return ','.join(map(str, value))
+    return value
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+class QueryStats(object):
+
+    # Updated by the export threads too
+    def __init__(self, indexes):
+
+        self.indexes   = indexes
+        self.requests  = 0
+        self.bytes     = 0
+        self.rows      = 0
+        self.http      = 0.0
+        self.decode    = 0.0
+        self.rows_time = 0.0
+
+        # Rows from the result cache, no request sent
+        self.cached    = False
+
+        self._lock = threading.Lock()
+
+    def add_request(self, http, decode, size):
+        with self._lock:
+            self.requests += 1
+            self.bytes    += size
+            self.http     += http
+            self.decode   += decode
+
+    def add_rows(self, count, elapsed):
+        with self._lock:
+            self.rows      += count
+            self.rows_time += elapsed
+
+    def as_dict(self):
+        return {
+            'indexes'  : self.indexes,
+            'requests' : self.requests,
+            'bytes'    : self.bytes,
+            'rows'     : self.rows,
+            'http'     : self.http,
+            'decode'   : self.decode,
+            'rows_time': self.rows_time,
+            'cached'   : self.cached,
+        }
+
+class timer(object):
+
+    # with timer() as t: ...; t.elapsed
+    def __enter__(self):
+        self.start   = time.perf_counter()
+        self.elapsed = None
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
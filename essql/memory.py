@@ -0,0 +1,1037 @@
+import re
+import json
+import uuid
+import heapq
+import bisect
+import fnmatch
+import itertools
+import threading
+import urllib.parse
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+# An in-memory stand-in for Elasticsearch with the Transport interface:
+# the DSL built by the composer runs on documents held in Python, no
+# network needed.
+#
+#   backend = MemoryTransport()
+#   backend.bulk('logs', docs)
+#
+#   Executor('memory://', query_descriptor, transport=backend).execute()
+#
+# Supported: _search (with size, from, sort, search_after, slice,
+# _source), point in time, _msearch; queries match_all, bool, term(s),
+# range, prefix, wildcard, regexp, exists, match and the basics of
+# query_string; aggregations terms, composite, the metrics and
+# bucket_selector. Nothing is scored.
+
+class RequestError(Exception):
+
+    def __init__(self, status, error_type, reason):
+        super().__init__(reason)
+        self.status     = status
+        self.error_type = error_type
+        self.reason     = reason
+
+    def as_dict(self):
+        error = { 'type': self.error_type, 'reason': self.reason }
+        return { 'error': dict(error, root_cause=[ error ]), 'status': self.status }
+
+class MemoryTransport(object):
+
+    def __init__(self):
+
+        # index name -> { id: document }
+        self.indices = {}
+
+        # point in time id -> documents
+        self.pits    = {}
+
+        # point in time id -> { search: (matching documents, sorted rows) },
+        # so that search_after pages don't go through all the documents
+        self.pit_searches = {}
+
+        self._seq  = itertools.count()
+        self._lock = threading.Lock()
+
+    #
+    # Documents
+    #
+
+    def index(self, index, source, id=None):
+
+        with self._lock:
+            docs = self.indices.setdefault(index, {})
+
+            if id is None:
+                id = uuid.uuid4().hex
+
+            # _seq orders the documents like _shard_doc
+            docs[str(id)] = { '_index': index, '_id': str(id), '_seq': next(self._seq), '_source': source }
+
+        return str(id)
+
+    def bulk(self, index, sources):
+        return [ self.index(index, source) for source in sources ]
+
+    def delete_index(self, index):
+        with self._lock:
+            self.indices.pop(index, None)
+
+    #
+    # Transport interface
+    #
+
+    def request(self, method, uri, body=None):
+
+        path, _, query = urllib.parse.urlsplit(uri)[2:5]
+
+        if isinstance(body, bytes) and not path.endswith('_msearch'):
+            body = json.loads(body)
+
+        try:
+            status, results = self.dispatch(method, path.strip('/').split('/'), urllib.parse.parse_qs(query), body)
+        except RequestError as e:
+            status, results = e.status, e.as_dict()
+
+        return status, json.dumps(results).encode('utf-8')
+
+    def close(self):
+        pass
+
+    def dispatch(self, method, parts, params, body):
+
+        if parts == [ '_search' ]:
+            return 200, self.search(None, body or {})
+
+        if parts == [ '_msearch' ]:
+            return 200, self.msearch(body)
+
+        if parts == [ '_pit' ] and method == 'DELETE':
+            with self._lock:
+                freed = self.pits.pop((body or {}).get('id'), None) is not None
+                self.pit_searches.pop((body or {}).get('id'), None)
+            return 200, { 'succeeded': True, 'num_freed': int(freed) }
+
+        if len(parts) == 2 and parts[1] == '_search':
+            return 200, self.search(parts[0], body or {})
+
+        if len(parts) == 2 and parts[1] == '_pit' and method == 'POST':
+            return 200, self.open_pit(parts[0])
+
+        if len(parts) == 2 and parts[1] == '_mapping':
+            return 200, self.mapping(parts[0])
+
+        raise RequestError(400, 'illegal_argument_exception', 'Unsupported request: %s /%s' % (method, '/'.join(parts)))
+
+    def documents(self, index):
+
+        with self._lock:
+            names = []
+            for pattern in index.split(','):
+                matching = sorted(fnmatch.filter(self.indices, pattern))
+                if not matching and not any(c in pattern for c in '*?'):
+                    raise RequestError(404, 'index_not_found_exception', 'no such index [%s]' % (pattern))
+                names.extend(n for n in matching if n not in names)
+
+            docs = [ doc for name in names for doc in self.indices[name].values() ]
+
+        return sorted(docs, key=lambda doc: doc['_seq'])
+
+    def mapping(self, index):
+
+        # What dynamic mapping would give for the documents
+        results = {}
+
+        for doc in self.documents(index):
+            properties = results.setdefault(doc['_index'], { 'mappings': { 'properties': {} } })['mappings']['properties']
+            _map_object(properties, doc['_source'])
+
+        return results
+
+    def open_pit(self, index):
+
+        docs = self.documents(index)
+
+        pit_id = uuid.uuid4().hex
+        with self._lock:
+            self.pits[pit_id] = docs
+
+        return { 'id': pit_id }
+
+    def msearch(self, body):
+
+        lines = [ json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip() ]
+
+        responses = []
+        for header, search_body in zip(lines[0::2], lines[1::2]):
+            try:
+                results = self.search(header.get('index'), search_body)
+                results['status'] = 200
+            except RequestError as e:
+                results = e.as_dict()
+            responses.append(results)
+
+        return { 'took': 0, 'responses': responses }
+
+    #
+    # Search
+    #
+
+    def search(self, index, body):
+
+        pit = body.get('pit')
+
+        if pit is not None:
+            docs, ordered = self.pit_search(pit['id'], body)
+        else:
+            docs = self.documents(index if index is not None else '*')
+            docs = [ doc for doc in docs if matches(body.get('query'), doc['_source']) ]
+
+        results = {
+            'took'     : 0,
+            'timed_out': False,
+            '_shards'  : { 'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0 },
+        }
+
+        if pit is not None:
+            results['pit_id'] = pit['id']
+
+        hits = { 'hits': self.hits(docs, body) if pit is None else _pit_hits(ordered, body) }
+
+        if body.get('track_total_hits', True) is not False:
+            hits['total'] = { 'value': len(docs), 'relation': 'eq' }
+
+        results['hits'] = hits
+
+        if body.get('aggs') or body.get('aggregations'):
+            results['aggregations'] = aggregate(body.get('aggs') or body.get('aggregations'), docs)
+
+        return results
+
+    def hits(self, docs, body):
+
+        sort = _sort_terms(body, False)
+        docs = _slice_docs(docs, body.get('slice'))
+
+        start = body.get('from', 0)
+        size  = body.get('size', 10)
+
+        rows = [ (doc, [ _sort_value(doc, field) for field, _ in sort ]) for doc in docs ]
+
+        if sort:
+            desc = [ d for _, d in sort ]
+
+            search_after = body.get('search_after')
+
+            # Plain tuples compare much faster, when they can be used
+            if _tuple_keys(rows, desc):
+                try:
+                    rows = _page(rows, search_after, start + size, tuple)
+                except TypeError:
+                    rows = _page(rows, search_after, start + size, lambda values: _SortKey(values, desc))
+            else:
+                rows = _page(rows, search_after, start + size, lambda values: _SortKey(values, desc))
+
+        return _hit_list(rows[start:start + size], body, sort)
+
+    def pit_search(self, pit_id, body):
+
+        # The documents of a point in time don't change: the matching ones
+        # are sorted once, the next pages are found by bisection
+        key = json.dumps([ body.get('query'), body.get('sort'), body.get('slice') ], sort_keys=True, default=str)
+
+        with self._lock:
+            docs = self.pits.get(pit_id)
+            if docs is not None:
+                searches = self.pit_searches.setdefault(pit_id, {})
+                if key in searches:
+                    return searches[key]
+
+        if docs is None:
+            raise RequestError(404, 'search_context_missing_exception', 'No search context found for id [%s]' % (pit_id))
+
+        docs = [ doc for doc in docs if matches(body.get('query'), doc['_source']) ]
+
+        sort = _sort_terms(body, True)
+        rows = [ (doc, [ _sort_value(doc, field) for field, _ in sort ]) for doc in _slice_docs(docs, body.get('slice')) ]
+
+        search = (docs, _sorted_rows(rows, sort))
+
+        with self._lock:
+            searches[key] = search
+
+        return search
+
+#----------------------------------------------------------------------#
+# Fields                                                               #
+#----------------------------------------------------------------------#
+
+def field_values(source, field):
+
+    # All the values of a dotted field, arrays flattened; name.keyword is
+    # the same as name
+    values = _path_values(source, field.split('.'))
+
+    if not values and field.endswith('.keyword'):
+        values = _path_values(source, field[:-len('.keyword')].split('.'))
+
+    return values
+
+def _path_values(obj, keys):
+
+    if not keys:
+        if isinstance(obj, list):
+            return [ v for item in obj for v in _path_values(item, keys) ]
+        return [] if obj is None else [ obj ]
+
+    if isinstance(obj, list):
+        return [ v for item in obj for v in _path_values(item, keys) ]
+
+    if not isinstance(obj, dict):
+        return []
+
+    # Flat "a.b" keys as well as nested objects
+    for i in range(len(keys), 0, -1):
+        key = '.'.join(keys[:i])
+        if key in obj:
+            return _path_values(obj[key], keys[i:])
+
+    return []
+
+def _map_object(properties, obj):
+
+    for key, value in obj.items():
+        values = value if isinstance(value, list) else [ value ]
+
+        for v in values:
+            if v is None:
+                continue
+            if isinstance(v, dict):
+                _map_object(properties.setdefault(key, { 'properties': {} }).setdefault('properties', {}), v)
+            elif key not in properties:
+                properties[key] = _field_mapping(v)
+
+def _field_mapping(value):
+
+    if isinstance(value, bool):
+        return { 'type': 'boolean' }
+    if isinstance(value, int):
+        return { 'type': 'long' }
+    if isinstance(value, float):
+        return { 'type': 'float' }
+
+    return { 'type': 'text', 'fields': { 'keyword': { 'type': 'keyword', 'ignore_above': 256 } } }
+
+def _filter_source(source, includes):
+
+    if includes is None or includes is True:
+        return source
+    if includes is False:
+        return None
+
+    if isinstance(includes, dict):
+        includes = includes.get('includes')
+    if isinstance(includes, str):
+        includes = [ includes ]
+    if not includes:
+        return source
+
+    result = {}
+    for key, value in source.items():
+        for pattern in includes:
+            if fnmatch.fnmatchcase(key, pattern):
+                result[key] = value
+                break
+            if pattern.startswith(key + '.') and isinstance(value, dict):
+                result[key] = _filter_source(value, [ pattern[len(key) + 1:] ])
+                break
+
+    return result
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [ value ]
+
+#----------------------------------------------------------------------#
+# Sort                                                                 #
+#----------------------------------------------------------------------#
+
+def _sort_terms(body, pit):
+
+    sort = [ _sort_term(term) for term in _as_list(body.get('sort')) ]
+
+    # A point in time adds _shard_doc as tiebreaker
+    if pit and not any(field in ('_shard_doc', '_doc') for field, _ in sort):
+        sort.append(('_shard_doc', False))
+
+    return sort
+
+def _slice_docs(docs, slice_obj):
+
+    if slice_obj is None:
+        return docs
+
+    return [ doc for doc in docs if doc['_seq'] % slice_obj['max'] == slice_obj['id'] ]
+
+def _tuple_keys(rows, desc):
+    return not any(desc) and all(v is not None for _, values in rows for v in values)
+
+def _sorted_rows(rows, sort):
+
+    # (rows, their sort keys, key function), all in sort order
+    desc = [ d for _, d in sort ]
+
+    def sort_key(values):
+        return _SortKey(values, desc)
+
+    if _tuple_keys(rows, desc):
+        try:
+            rows = sorted(rows, key=lambda row: tuple(row[1]))
+            return rows, [ tuple(values) for _, values in rows ], tuple
+        except TypeError:
+            pass
+
+    rows = sorted(rows, key=lambda row: sort_key(row[1]))
+
+    return rows, [ sort_key(values) for _, values in rows ], sort_key
+
+def _pit_hits(ordered, body):
+
+    rows, keys, sort_key = ordered
+
+    first = 0
+    if body.get('search_after') is not None:
+        first = bisect.bisect_right(keys, sort_key(body['search_after']))
+
+    start = first + body.get('from', 0)
+
+    return _hit_list(rows[start:start + body.get('size', 10)], body, True)
+
+def _hit_list(rows, body, sort):
+
+    hits = []
+    for doc, values in rows:
+        hit = {
+            '_index' : doc['_index'],
+            '_id'    : doc['_id'],
+            '_score' : None if sort else 1.0,
+            '_source': _filter_source(doc['_source'], body.get('_source')),
+        }
+        if sort:
+            hit['sort'] = values
+        hits.append(hit)
+
+    return hits
+
+def _page(rows, search_after, count, sort_key):
+
+    if search_after is not None:
+        after = sort_key(search_after)
+        rows  = [ row for row in rows if after < sort_key(row[1]) ]
+
+    # Only the page is sorted
+    return heapq.nsmallest(count, rows, key=lambda row: sort_key(row[1]))
+
+def _sort_term(term):
+
+    # 'field', { field: 'desc' } or { field: { 'order': 'desc' } }
+    if isinstance(term, str):
+        return term, False
+
+    field, order = list(term.items())[0]
+    if isinstance(order, dict):
+        order = order.get('order', 'asc')
+
+    return field, order == 'desc'
+
+def _sort_value(doc, field):
+
+    if field in ('_shard_doc', '_doc'):
+        return doc['_seq']
+    if field == '_score':
+        return None
+
+    values = field_values(doc['_source'], field)
+
+    return values[0] if values else None
+
+class _SortKey(object):
+
+    __slots__ = ('values', 'desc')
+
+    def __init__(self, values, desc):
+        self.values = values
+        self.desc   = desc
+
+    def __lt__(self, other):
+
+        for a, b, desc in zip(self.values, other.values, self.desc):
+            if a == b:
+                continue
+            # Missing values last
+            if a is None:
+                return False
+            if b is None:
+                return True
+            return _compare(a, b) > 0 if desc else _compare(a, b) < 0
+
+        return False
+
+    def __eq__(self, other):
+        return not (self < other or other < self)
+
+def _compare(a, b):
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        return (str(a) > str(b)) - (str(a) < str(b))
+
+#----------------------------------------------------------------------#
+# Queries                                                              #
+#----------------------------------------------------------------------#
+
+def matches(query, source):
+
+    if not query:
+        return True
+
+    kind, spec = list(query.items())[0]
+
+    handler = QUERIES.get(kind)
+    if handler is None:
+        raise RequestError(400, 'parsing_exception', 'unknown query [%s]' % (kind))
+
+    return handler(spec, source)
+
+def _field_spec(spec, key='value'):
+
+    # { field: value } or { field: { key: value, ... } }
+    field, value = [ (k, v) for k, v in spec.items() if k not in ('boost', '_name') ][0]
+    if isinstance(value, dict):
+        value = value.get(key)
+
+    return field, value
+
+def _equal(a, b):
+
+    if a == b:
+        return True
+
+    # Numbers may be sent as strings and the other way round
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return False
+
+def _bool_query(spec, source):
+
+    if not all(matches(q, source) for q in _as_list(spec.get('must')) + _as_list(spec.get('filter'))):
+        return False
+
+    if any(matches(q, source) for q in _as_list(spec.get('must_not'))):
+        return False
+
+    should = _as_list(spec.get('should'))
+    if not should:
+        return True
+
+    minimum = spec.get('minimum_should_match')
+    if minimum is None:
+        minimum = 0 if (spec.get('must') or spec.get('filter')) else 1
+
+    return sum(1 for q in should if matches(q, source)) >= int(minimum)
+
+def _term_query(spec, source):
+    field, value = _field_spec(spec)
+    return any(_equal(v, value) for v in field_values(source, field))
+
+def _terms_query(spec, source):
+    field, values = _field_spec(spec)
+    return any(_equal(v, value) for v in field_values(source, field) for value in values)
+
+def _range_query(spec, source):
+
+    field, bounds = list(spec.items())[0]
+
+    def in_range(v):
+        try:
+            if 'gt'  in bounds and not v >  _coerce(bounds['gt' ], v): return False
+            if 'gte' in bounds and not v >= _coerce(bounds['gte'], v): return False
+            if 'lt'  in bounds and not v <  _coerce(bounds['lt' ], v): return False
+            if 'lte' in bounds and not v <= _coerce(bounds['lte'], v): return False
+        except TypeError:
+            return False
+        return True
+
+    return any(in_range(v) for v in field_values(source, field))
+
+def _coerce(bound, value):
+
+    # Bounds compare with the type of the field
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(bound, str):
+        try:
+            return float(bound)
+        except ValueError:
+            return bound
+
+    return bound
+
+def _prefix_query(spec, source):
+    field, value = _field_spec(spec)
+    return any(isinstance(v, str) and v.startswith(value) for v in field_values(source, field))
+
+def _wildcard_regex(pattern):
+
+    regex = []
+    escape = False
+    for c in pattern:
+        if escape:
+            regex.append(re.escape(c))
+            escape = False
+        elif c == '\\':
+            escape = True
+        elif c == '*':
+            regex.append('.*')
+        elif c == '?':
+            regex.append('.')
+        else:
+            regex.append(re.escape(c))
+
+    return re.compile(''.join(regex), re.DOTALL)
+
+def _wildcard_query(spec, source):
+    field, value = _field_spec(spec)
+    regex = _wildcard_regex(value)
+    return any(isinstance(v, str) and regex.fullmatch(v) for v in field_values(source, field))
+
+def _regexp_query(spec, source):
+    field, value = _field_spec(spec)
+    regex = re.compile(value)
+    return any(isinstance(v, str) and regex.fullmatch(v) for v in field_values(source, field))
+
+def _exists_query(spec, source):
+    return bool(field_values(source, spec['field']))
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def _tokens(value):
+    return _TOKEN_RE.findall(str(value).lower())
+
+def _match_query(spec, source):
+
+    field, text = _field_spec(spec, 'query')
+
+    wanted = set(_tokens(text))
+    for v in field_values(source, field):
+        if isinstance(v, (int, float)) and _equal(v, text):
+            return True
+        if wanted & set(_tokens(v)):
+            return True
+
+    return False
+
+def _query_string_query(spec, source):
+    return QueryStringParser(spec['query'], spec.get('default_field')).parse()(source)
+
+QUERIES = {
+    'match_all'   : lambda spec, source: True,
+    'match_none'  : lambda spec, source: False,
+    'bool'        : _bool_query,
+    'term'        : _term_query,
+    'terms'       : _terms_query,
+    'range'       : _range_query,
+    'prefix'      : _prefix_query,
+    'wildcard'    : _wildcard_query,
+    'regexp'      : _regexp_query,
+    'exists'      : _exists_query,
+    'match'       : _match_query,
+    'query_string': _query_string_query,
+}
+
+#----------------------------------------------------------------------#
+# query_string                                                         #
+#----------------------------------------------------------------------#
+
+_QS_TOKEN_RE = re.compile(r"""
+      (?P<lpar>  \( )
+    | (?P<rpar>  \) )
+    | (?P<phrase>"(?:[^"\\]|\\.)*")
+    | (?P<range> [\[{][^\]}]*[\]}] )
+    | (?P<word>  (?:[^\s()"\[\]{}\\]|\\.)+ )
+""", re.VERBOSE)
+
+class QueryStringParser(object):
+
+    # [field:]value terms joined by AND, OR (the default), NOT, + and -,
+    # with groups, phrases, wildcards, ranges ([a TO b], {a TO b}, >n...)
+    # and _exists_:field. Returns a predicate on the _source.
+    def __init__(self, query, default_field=None):
+        self.tokens = [ (m.lastgroup, m.group(m.lastgroup)) for m in _QS_TOKEN_RE.finditer(query) ]
+        self.pos    = 0
+        self.default_field = default_field if default_field not in (None, '*') else None
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+
+        predicate = self.parse_or(self.default_field)
+
+        if self.pos < len(self.tokens):
+            raise RequestError(400, 'query_shard_exception', 'Failed to parse query_string near [%s]' % (self.peek()[1]))
+
+        return predicate
+
+    def parse_or(self, field):
+
+        terms = [ self.parse_and(field) ]
+
+        while True:
+            kind, value = self.peek()
+            if kind is None or kind == 'rpar':
+                break
+            if kind == 'word' and value in ('OR', '||'):
+                self.next()
+            terms.append(self.parse_and(field))
+
+        if len(terms) == 1:
+            return terms[0]
+
+        return lambda source: any(t(source) for t in terms)
+
+    def parse_and(self, field):
+
+        terms = [ self.parse_not(field) ]
+
+        while self.peek()[0] == 'word' and self.peek()[1] in ('AND', '&&'):
+            self.next()
+            terms.append(self.parse_not(field))
+
+        if len(terms) == 1:
+            return terms[0]
+
+        return lambda source: all(t(source) for t in terms)
+
+    def parse_not(self, field):
+
+        kind, value = self.peek()
+
+        if kind == 'word' and value in ('NOT', '!'):
+            self.next()
+            term = self.parse_not(field)
+            return lambda source: not term(source)
+
+        if kind == 'word' and len(value) > 1 and value[0] in '+-':
+            self.tokens[self.pos] = (kind, value[1:])
+            term = self.parse_not(field)
+            return term if value[0] == '+' else (lambda source: not term(source))
+
+        return self.parse_primary(field)
+
+    def parse_primary(self, field):
+
+        kind, value = self.next()
+
+        if kind == 'lpar':
+            term = self.parse_or(field)
+            if self.next()[0] != 'rpar':
+                raise RequestError(400, 'query_shard_exception', 'Failed to parse query_string: missing )')
+            return term
+
+        if kind == 'word':
+            name, sep, rest = _split_field(value)
+            if sep:
+                if not rest:
+                    return self.parse_primary(name)
+                if name == '_exists_':
+                    return lambda source: bool(field_values(source, rest))
+                return _qs_term(name, 'word', rest)
+
+        if kind in ('word', 'phrase', 'range'):
+            return _qs_term(field, kind, value)
+
+        raise RequestError(400, 'query_shard_exception', 'Failed to parse query_string near [%s]' % (value))
+
+def _split_field(word):
+
+    # field:value, the colon may be escaped in the value
+    m = re.match(r'((?:[^:\\]|\\.)+):(.*)$', word, re.DOTALL)
+    if m is None:
+        return word, '', ''
+
+    return m.group(1).replace('\\', ''), ':', m.group(2)
+
+def _qs_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def _qs_term(field, kind, value):
+
+    if kind == 'phrase':
+        phrase = _tokens(value[1:-1].replace('\\"', '"'))
+        return _qs_field(field, lambda v: _contains_phrase(_tokens(v), phrase))
+
+    if kind == 'range':
+        low, _, high = value[1:-1].partition(' TO ')
+        low, high = low.strip(), high.strip()
+        bounds = {}
+        if low != '*':
+            bounds['gte' if value[0] == '[' else 'gt'] = _qs_number(low)
+        if high != '*':
+            bounds['lte' if value[-1] == ']' else 'lt'] = _qs_number(high)
+        return _qs_range(field, bounds)
+
+    for op, bound in (('>=', 'gte'), ('<=', 'lte'), ('>', 'gt'), ('<', 'lt')):
+        if value.startswith(op):
+            return _qs_range(field, { bound: _qs_number(value[len(op):]) })
+
+    value = re.sub(r'\\(.)', r'\1', value)
+
+    if '*' in value or '?' in value:
+        regex = _wildcard_regex(value.lower())
+        return _qs_field(field, lambda v: bool(regex.fullmatch(str(v).lower())) or any(regex.fullmatch(t) for t in _tokens(v)))
+
+    text = value.lower()
+    return _qs_field(field, lambda v: _equal(v, value) or str(v).lower() == text or text in _tokens(v))
+
+def _qs_range(field, bounds):
+    return lambda source: _range_query({ field: bounds }, source) if field is not None else False
+
+def _qs_field(field, predicate):
+
+    if field is not None:
+        return lambda source: any(predicate(v) for v in field_values(source, field))
+
+    # Without a field every value of the document is searched
+    return lambda source: any(predicate(v) for v in _all_values(source))
+
+def _all_values(obj):
+
+    if isinstance(obj, dict):
+        return [ v for value in obj.values() for v in _all_values(value) ]
+    if isinstance(obj, list):
+        return [ v for value in obj for v in _all_values(value) ]
+
+    return [] if obj is None else [ obj ]
+
+def _contains_phrase(tokens, phrase):
+
+    n = len(phrase)
+    return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+#----------------------------------------------------------------------#
+# Aggregations                                                         #
+#----------------------------------------------------------------------#
+
+def aggregate(aggs, docs):
+
+    results = {}
+
+    for name, spec in aggs.items():
+
+        kind = [ k for k in spec if k not in ('aggs', 'aggregations', 'meta') ][0]
+
+        # Pipelines run on the buckets of the parent, see _apply_pipelines
+        if kind in PIPELINES:
+            continue
+
+        handler = AGGREGATIONS.get(kind)
+        if handler is None:
+            raise RequestError(400, 'parsing_exception', 'Unknown aggregation type [%s]' % (kind))
+
+        results[name] = handler(spec[kind], docs, spec.get('aggs') or spec.get('aggregations'))
+
+    return results
+
+def _sub_aggregations(bucket, docs, sub_aggs):
+
+    if sub_aggs:
+        bucket.update(aggregate(sub_aggs, docs))
+
+    return bucket
+
+def _apply_pipelines(buckets, sub_aggs):
+
+    # bucket_selector drops the buckets of its parent
+    for spec in (sub_aggs or {}).values():
+        for kind in spec:
+            if kind in PIPELINES:
+                buckets = PIPELINES[kind](spec[kind], buckets)
+
+    return buckets
+
+def _numeric_values(docs, field):
+    return [ v for doc in docs for v in field_values(doc['_source'], field) if isinstance(v, (int, float)) and not isinstance(v, bool) ]
+
+def _metric(fun):
+
+    def handler(spec, docs, sub_aggs):
+        return fun(_numeric_values(docs, spec['field']))
+
+    return handler
+
+def _stats(values):
+    return {
+        'count': len(values),
+        'min'  : min(values) if values else None,
+        'max'  : max(values) if values else None,
+        'avg'  : sum(values) / len(values) if values else None,
+        'sum'  : float(sum(values)),
+    }
+
+def _value_count(spec, docs, sub_aggs):
+    return { 'value': sum(len(field_values(doc['_source'], spec['field'])) for doc in docs) }
+
+def _cardinality(spec, docs, sub_aggs):
+    return { 'value': len(set(json.dumps(v, sort_keys=True) for doc in docs for v in field_values(doc['_source'], spec['field']))) }
+
+def _terms(spec, docs, sub_aggs):
+
+    groups = {}
+    for doc in docs:
+        values = field_values(doc['_source'], spec['field'])
+        if not values and 'missing' in spec:
+            values = [ spec['missing'] ]
+        for value in set(_hashable(v) for v in values):
+            groups.setdefault(value, []).append(doc)
+
+    # doc_count desc, key asc
+    keys = sorted(groups, key=lambda k: (-len(groups[k]), _SortKey([ k ], [ False ])))
+
+    size = spec.get('size', 10)
+
+    buckets = [ _sub_aggregations({ 'key': k, 'doc_count': len(groups[k]) }, groups[k], sub_aggs) for k in keys ]
+    buckets = _apply_pipelines(buckets, sub_aggs)
+
+    return {
+        'doc_count_error_upper_bound': 0,
+        'sum_other_doc_count'        : sum(b['doc_count'] for b in buckets[size:]),
+        'buckets'                    : buckets[:size],
+    }
+
+def _composite(spec, docs, sub_aggs):
+
+    sources = [ list(source.items())[0] for source in spec['sources'] ]
+
+    groups = {}
+    for doc in docs:
+        per_source = []
+        for name, source in sources:
+            terms  = source['terms']
+            values = set(_hashable(v) for v in field_values(doc['_source'], terms['field']))
+            if not values:
+                if not terms.get('missing_bucket'):
+                    break
+                values = [ None ]
+            per_source.append(values)
+        else:
+            for key in itertools.product(*per_source):
+                groups.setdefault(key, []).append(doc)
+
+    # Missing values first, like ES in ascending order
+    desc = [ source['terms'].get('order') == 'desc' for _, source in sources ]
+
+    def sort_key(key):
+        return _SortKey([ (v is not None, v) for v in key ], desc)
+
+    keys = sorted(groups, key=sort_key)
+
+    after = spec.get('after')
+    if after is not None:
+        after_key = sort_key(tuple(after.get(name) for name, _ in sources))
+        keys = [ k for k in keys if after_key < sort_key(k) ]
+
+    # Sub-aggregations only for the buckets of the page
+    keys = keys[:spec.get('size', 10)]
+
+    buckets = []
+    for key in keys:
+        bucket = { 'key': { name: v for (name, _), v in zip(sources, key) }, 'doc_count': len(groups[key]) }
+        buckets.append(_sub_aggregations(bucket, groups[key], sub_aggs))
+
+    results = {}
+    if buckets:
+        # Like ES, the key of the page even if pipelines remove its bucket
+        results['after_key'] = buckets[-1]['key']
+
+    # Pipelines run on the page
+    results['buckets'] = _apply_pipelines(buckets, sub_aggs)
+
+    return results
+
+def _hashable(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+def _bucket_selector(spec, buckets):
+
+    script = spec['script']
+    if isinstance(script, dict):
+        script = script.get('source') or script.get('inline')
+
+    expression = compile(_painless_to_python(script), '<bucket_selector>', 'eval')
+
+    selected = []
+    for bucket in buckets:
+        params = { var: _bucket_path(bucket, path) for var, path in spec['buckets_path'].items() }
+        if eval(expression, { '__builtins__': {} }, { 'params': _Params(params) }):
+            selected.append(bucket)
+
+    return selected
+
+PAINLESS_NAMES = { 'null': 'None', 'true': 'True', 'false': 'False' }
+
+def _painless_to_python(script):
+    script = script.replace('&&', ' and ').replace('||', ' or ')
+    script = re.sub(r'!(?!=)', ' not ', script)
+    # Whole words only: params.nullable stays as it is
+    return re.sub(r'\b(null|true|false)\b', lambda m: PAINLESS_NAMES[m.group(1)], script)
+
+class _Params(object):
+
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+    def __getitem__(self, key):
+        return self.__dict__[key]
+
+def _bucket_path(bucket, path):
+
+    if path == '_count':
+        return bucket['doc_count']
+
+    name, _, metric = path.partition('.')
+
+    value = bucket[name]
+    if isinstance(value, dict):
+        value = value.get(metric or 'value')
+
+    return value
+
+AGGREGATIONS = {
+    'terms'      : _terms,
+    'composite'  : _composite,
+    'sum'        : _metric(lambda v: { 'value': float(sum(v)) }),
+    'min'        : _metric(lambda v: { 'value': min(v) if v else None }),
+    'max'        : _metric(lambda v: { 'value': max(v) if v else None }),
+    'avg'        : _metric(lambda v: { 'value': sum(v) / len(v) if v else None }),
+    'stats'      : _metric(_stats),
+    'value_count': _value_count,
+    'cardinality': _cardinality,
+}
+
+PIPELINES = {
+    'bucket_selector': _bucket_selector,
+}
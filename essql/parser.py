@@ -1,11 +1,9 @@
 
-from abc import abstractmethod
+import threading
 
-#from pyparsing import *
-import pyparsing as pp
+from abc import abstractmethod
 
-# Required for parsing
-pp.ParserElement.enablePackrat()
+from . import instrumentation
 
 #----------------------------------------------------------------------#
 #                                                                      #
@@ -52,6 +50,29 @@ class ASTBoolLiteral(AST):
     def toString(self):
         return 'Bool(%s)' % (self.value)
 
+class ASTNullLiteral(AST):
+
+    def __init__(self):
+        self.value = None
+        
+    def toString(self):
+        return 'Null'
+
+class ASTBindParameter(AST):
+
+    # "?" placeholders are keyed by their position in the statement,
+    # ":name" ones by their name
+    def __init__(self, name, loc):
+        self.name = name
+        self.loc  = loc
+
+    @property
+    def key(self):
+        return ':%s' % (self.name) if self.name is not None else '?%d' % (self.loc)
+
+    def toString(self):
+        return 'Param(%s)' % (':' + self.name if self.name is not None else '?')
+
 class ASTIdentifier(AST):
 
     def __init__(self, value):
@@ -97,6 +118,14 @@ class ASTTernaryExpr(ASTExpr):
     def toString(self):
             return '(%s %s %s %s)' % ( self.op, self.expr1.toString() ,  self.expr2.toString() , self.expr3.toString() )        
 
+class ASTExprList(ASTExpr):
+
+    def __init__(self, exprs):
+        self.exprs = exprs
+        
+    def toString(self):
+        return 'List(%s)' % (','.join([e.toString() for e in self.exprs]))
+
 class ASTCall(ASTExpr):
 
     def __init__(self, identifier, params):
@@ -112,6 +141,8 @@ class ASTQueryString(ASTExpr):
         self.query_string = query_string
         
     def toString(self):
+        if isinstance(self.query_string, AST):
+            return 'querystring(%s)' % (self.query_string.toString())
         return 'querystring(%s)' % (self.query_string)
 
 #----------------------------------------------------------------------#
@@ -272,13 +303,88 @@ class ASTQuery(AST):
 #                                                                      #
 #----------------------------------------------------------------------#
 
+# Parser currently running on this thread. Grammars are shared between
+# instances so parse actions resolve factory methods through it.
+_active = threading.local()
+
+class _ActiveFactory(object):
+
+    def __getattr__(self, name):
+        return getattr(_active.parser, name)
+
 class Parser(object):
 
-    def __init__(self):
-        self._parser = self.create_parser()
+    # Grammars built so far, one per create_parser() implementation
+    _grammars      = {}
+    _grammars_lock = threading.Lock()
+
+    # Packrat memoization is global to pyparsing: once enabled it applies to
+    # every grammar of the process. The expression grammar is left-factored
+    # and does not need it, so it is off unless a parser asks for it.
+    #
+    #   packrat=False    leave pyparsing settings untouched
+    #   packrat=True     unbounded cache (reset on every parse)
+    #   packrat=<n>      cache limited to n entries
+    #
+    # Backends:
+    #
+    #   'pyparsing'     grammar built with pyparsing (default)
+    #   'pratt'         hand-written tokenizer and Pratt parser (essql.pratt),
+    #                   faster and with no dependency on pyparsing
+    #
+    def __init__(self, packrat=False, backend='pyparsing'):
+
+        self.backend = backend
+
+        if backend == 'pratt':
+            from .pratt import PrattParser
+            self._parser = PrattParser(self)
+            return
+
+        if backend != 'pyparsing':
+            raise ValueError("Unknown parser backend: %r" % (backend))
+
+        if packrat is not False:
+            import pyparsing as pp
+            pp.ParserElement.enablePackrat(None if packrat is True else packrat)
+
+        self._parser = self.get_grammar()
     
     def parse(self, s):
-        return self._parser.parseString(s)[0]
+
+        if not instrumentation.enabled():
+            return self._parse(s)
+
+        with instrumentation.timer() as t:
+            tree = self._parse(s)
+
+        instrumentation.emit('parse', { 'elapsed': t.elapsed, 'backend': self.backend, 'sql_length': len(s) })
+
+        return tree
+
+    def _parse(self, s):
+        if self.backend == 'pratt':
+            return self._parser.parse(s)
+
+        previous = getattr(_active, 'parser', None)
+        _active.parser = self
+        try:
+            return self._parser.parseString(s)[0]
+        finally:
+            _active.parser = previous
+
+    def get_grammar(self):
+
+        create_parser = type(self).create_parser
+
+        with Parser._grammars_lock:
+            grammar = Parser._grammars.get(create_parser)
+            if grammar is None:
+
+                grammar = create_parser(_ActiveFactory())
+                Parser._grammars[create_parser] = grammar
+
+        return grammar
     
     #
     # Factory methods
@@ -295,6 +401,12 @@ class Parser(object):
     def createNumericLiteral(self, s):
         return ASTNumericLiteral(s)
 
+    def createNullLiteral(self):
+        return ASTNullLiteral()
+
+    def createBindParameter(self, name, loc):
+        return ASTBindParameter(name, loc)
+
     def createIdentifier(self, symbol):
         return ASTIdentifier(symbol)
 
@@ -308,6 +420,9 @@ class Parser(object):
 
     def createASTTernaryExpr(self, op, e1, e2, e3):
         return ASTTernaryExpr(op, e1, e2, e3)
+
+    def createExprList(self, exprs):
+        return ASTExprList(exprs)
     
     def createCall(self, name, params):
         return ASTCall(name, params)
@@ -372,6 +487,8 @@ class Parser(object):
     # SQL Parser taken from pyparsing/examples/select_parser.py 
     #
     def create_parser(self):
+
+        import pyparsing as pp
         
         LPAR, RPAR, COMMA = map(pp.Suppress, "(),")
         
@@ -517,7 +634,18 @@ class Parser(object):
         
         quoted_identifier = pp.QuotedString('"', escQuote='""')
         
-        identifier = (~any_keyword + pp.Word(pp.alphas + '@', pp.alphanums + "_"))     .setParseAction( pp.pyparsing_common.downcaseTokens) | quoted_identifier
+        # Reserved words are rejected with a set lookup instead of trying
+        # every keyword in front of each identifier
+        reserved_words = set()
+        for k in keywords:
+            while not isinstance(k, pp.CaselessKeyword):
+                k = k.expr
+            reserved_words.add(k.match.upper())
+
+        plain_identifier = pp.Regex(r'[A-Za-z@][A-Za-z0-9_]*')             .setParseAction( pp.pyparsing_common.downcaseTokens)
+        plain_identifier.addCondition( lambda s, loc, toks: toks[0].upper() not in reserved_words )
+
+        identifier = plain_identifier | quoted_identifier
         
         
         #collation_name = identifier.copy()
@@ -561,14 +689,19 @@ class Parser(object):
         #    | blob_literal                                             
             | TRUE                                                      .setParseAction( lambda s, loc, toks: self.createBoolLiteral(True)  )
             | FALSE                                                     .setParseAction( lambda s, loc, toks: self.createBoolLiteral(False) )
-            | NULL                    
+            | NULL.copy()                                               .setParseAction( lambda s, loc, toks: self.createNullLiteral() )
   
             #| CURRENT_TIME            .setParseAction( lambda s, loc, toks: self.createIdentifier(toks[0])  )
             #| CURRENT_DATE            .setParseAction( lambda s, loc, toks: self.createIdentifier(toks[0])  )
             #| CURRENT_TIMESTAMP       .setParseAction( lambda s, loc, toks: self.createIdentifier(toks[0])  )
         )
         
-        #bind_parameter = Word("?", nums) | Combine(oneOf(": @ $") + parameter_name)
+        # The parse action goes on each alternative: a MatchFirst reports
+        # the location before the leading whitespace
+        bind_parameter = (
+              pp.Literal('?')                                           .setParseAction( lambda s, loc, toks: self.createBindParameter(None, loc) )
+            | pp.Combine(pp.Literal(':') + parameter_name)              .setParseAction( lambda s, loc, toks: self.createBindParameter(toks[0][1:], loc) )
+        )
         
         #type_name = oneOf("TEXT REAL INTEGER BLOB NULL")
         
@@ -605,9 +738,12 @@ class Parser(object):
             )                                                           .setParseAction( _op_function  )
             |
             (pp.Optional(QUERYSTRING).suppress() + query_string_literal)   .setParseAction( _op_query_string  )
+            |
+            (QUERYSTRING.suppress() + bind_parameter)                  .setParseAction( _op_query_string  )
             | 
             literal_value
-            #| bind_parameter
+            | 
+            bind_parameter
             | 
             
             #Group(
@@ -625,95 +761,134 @@ class Parser(object):
               
         )
         
-        NOT_NULL    = pp.Group(NOT + NULL)
-        NOT_BETWEEN = pp.Group(NOT + BETWEEN)
-        NOT_IN      = pp.Group(NOT + IN)
-        NOT_LIKE    = pp.Group(NOT + LIKE)
-        NOT_MATCH   = pp.Group(NOT + MATCH)
-        NOT_GLOB    = pp.Group(NOT + GLOB)
-        NOT_REGEXP  = pp.Group(NOT + REGEXP)
-        
-        UNARY, BINARY, TERNARY = 1, 2, 3
-
+        #
+        # Operators
+        #
+        # The expression grammar is left-factored: every level reads
+        # "operand (operator operand)*" and never parses an operand twice.
+        # Binary operators sharing a level are folded by PRECEDENCE in the
+        # parse action, so few grammar levels are crossed for each nested
+        # expression and parse time grows linearly with the query length.
+        #
 
+        def _op_words(*words):
+            # NOT LIKE, IS NOT, NOT NULL, ... as a single operator token
+            return pp.And(list(words))                                  .setParseAction( lambda s, loc, toks: ' '.join(toks) )
+
+        # Binding power of the binary operators folded by _op_handle_binary
+        PRECEDENCE = {
+            '||' : 6,
+            '*'  : 5, '/'  : 5, '%' : 5,
+            '+'  : 4, '-'  : 4,
+            '<<' : 3, '>>' : 3, '&' : 3, '|' : 3,
+            '<'  : 2, '<=' : 2, '>' : 2, '>=' : 2,
+            'AND': 1,
+            'OR' : 0,
+        }
 
         def _op_handle_unary(s, loc, toks):
-            toks = list(toks[0])
-            
-            op = toks.pop(0)
-            e1 = toks.pop(0)
-            
-            expr = self.createASTUnaryExpr(op, e1)
+            toks = list(toks)
+
+            # op op ... e1
+            expr1 = toks.pop()
+
+            while toks:
+                op = toks.pop()
+                expr1 = self.createASTUnaryExpr(op, expr1)
 
-            return [ expr ]
+            return expr1
             
         def _op_handle_binary(s, loc, toks):
-            toks = list(toks[0])
+            toks = list(toks)
+
+            # e1 op e2 op e3 op e3, all operators are left associative
+            operands  = [ toks.pop(0) ]
+            operators = []
+
+            def _reduce():
+                op    = operators.pop()
+                expr2 = operands.pop()
+                expr1 = operands.pop()
+                operands.append(self.createBinaryExpr(op, expr1, expr2))
 
-            # e1 op e2 op e3 op e3
-            expr1 = toks.pop(0)
-            if not toks:
-                return expr1
-                
             while toks:
-                op = toks.pop(0)
+                op    = toks.pop(0)
                 expr2 = toks.pop(0)
-                expr1 = self.createBinaryExpr(op, expr1, expr2)
-            
-            return [ expr1 ]
 
-        def _op_handle_ternary(s, loc, toks):
-            toks = list(toks[0])
-            
-            # 0  1       2  3   4
-            # e1 between e2 and e3
-            expr1 = toks[0]
-            expr2 = toks[2]
-            expr3 = toks[4]
+                while operators and PRECEDENCE[operators[-1]] >= PRECEDENCE[op]:
+                    _reduce()
+
+                operators.append(op)
+                operands .append(expr2)
+
+            while operators:
+                _reduce()
             
-            expr = self.createASTTernaryExpr('between', expr1, expr2, expr3)
-            return [ expr ]
-
-
-        expr << pp.infixNotation(
-            expr_term                                                       
-            ,
-            [
-                (pp.oneOf("- + ~") | NOT       , UNARY , pp.opAssoc.RIGHT     , _op_handle_unary ),
-                (ISNULL | NOTNULL | NOT_NULL   , UNARY , pp.opAssoc.LEFT      , _op_handle_unary ),
-                ("||"                          , BINARY, pp.opAssoc.LEFT      , _op_handle_binary),
-                (pp.oneOf("* / %")             , BINARY, pp.opAssoc.LEFT      , _op_handle_binary),
-                (pp.oneOf("+ -")               , BINARY, pp.opAssoc.LEFT      , _op_handle_binary),
-                (pp.oneOf("<< >> & |")         , BINARY, pp.opAssoc.LEFT      , _op_handle_binary),
-                (pp.oneOf("< <= > >=")         , BINARY, pp.opAssoc.LEFT      , _op_handle_binary),
-                (
-                    pp.oneOf("= == != <>")
-                    | IS
-                    | IN
-                    | LIKE
-                    | GLOB
-                    | MATCH
-                    | REGEXP
-                    | NOT_IN
-                    | NOT_LIKE
-                    | NOT_GLOB
-                    | NOT_MATCH
-                    | NOT_REGEXP,
-                                               BINARY, pp.opAssoc.LEFT     , _op_handle_binary ),
-                ((BETWEEN | NOT_BETWEEN, AND), TERNARY, pp.opAssoc.LEFT    , _op_handle_ternary),       
-                (
-                    (IN | NOT_IN) + 
-                    LPAR + 
-                    pp.Group(
-                     #select_stmt | 
-                     pp.delimitedList(expr)
-                    ) + 
-                    RPAR
-                                            , UNARY, pp.opAssoc.LEFT       , _op_handle_unary ),
-                (AND                        , BINARY, pp.opAssoc.LEFT      , _op_handle_binary),
-                (OR                         , BINARY, pp.opAssoc.LEFT      , _op_handle_binary),
-            ],
-        )                                                              
+            return operands[0]
+
+        def _op_handle_comparison(s, loc, toks):
+            toks = list(toks)
+
+            # e1 [op e2] [ISNULL] [IN (e2, ...)] [BETWEEN e2 AND e3] ...
+            expr1 = toks.pop(0)
+
+            for suffix in toks:
+                suffix = list(suffix)
+                op     = suffix.pop(0)
+
+                if op in ('IN', 'NOT IN'):
+                    expr1 = self.createBinaryExpr(op, expr1, self.createExprList(list(suffix[0])))
+                elif op in ('BETWEEN', 'NOT BETWEEN'):
+                    expr1 = self.createASTTernaryExpr(op.lower(), expr1, suffix[0], suffix[1])
+                elif suffix:
+                    expr1 = self.createBinaryExpr(op, expr1, suffix[0])
+                else:
+                    expr1 = self.createASTUnaryExpr(op, expr1)
+
+            return expr1
+
+        operand_expr = expr_term | (LPAR + expr + RPAR)
+
+        unary_expr   = (pp.ZeroOrMore(pp.oneOf("- + ~")) + operand_expr)                  .setParseAction( _op_handle_unary )
+
+        arith_op     = pp.Regex(r"\|\||<<|>>|<=|>=|<(?!>)|>|[-+*/%&|]")
+
+        arith_expr   = (unary_expr + pp.ZeroOrMore(arith_op + unary_expr))                .setParseAction( _op_handle_binary )
+
+        compare_op = (
+              pp.oneOf("= == != <>")
+            | _op_words(IS, NOT)
+            | IS
+            | _op_words(NOT, LIKE)
+            | _op_words(NOT, GLOB)
+            | _op_words(NOT, MATCH)
+            | _op_words(NOT, REGEXP)
+            | LIKE
+            | GLOB
+            | MATCH
+            | REGEXP
+        )
+
+        compare_expr = (
+            arith_expr
+            + pp.ZeroOrMore(pp.Group(
+                  (compare_op + arith_expr)
+                | ((_op_words(NOT, IN) | IN) + LPAR + pp.Group(pp.delimitedList(expr)) + RPAR)
+                | ((_op_words(NOT, BETWEEN) | BETWEEN) + arith_expr + AND.suppress() + arith_expr)
+                | ISNULL
+                | NOTNULL
+                | _op_words(NOT, NULL)
+            ))
+        )                                                                           .setParseAction( _op_handle_comparison )
+
+        not_expr     = (pp.ZeroOrMore(NOT) + compare_expr)                          .setParseAction( _op_handle_unary )
+
+        logic_expr   = (not_expr + pp.ZeroOrMore((AND | OR) + not_expr))           .setParseAction( _op_handle_binary )
+
+        expr << logic_expr
+
+        # An expression is always a single AST node, also when it is named
+        expr.saveAsList = False
         
         #compound_operator = UNION + Optional(ALL) | INTERSECT | EXCEPT
         
@@ -786,7 +961,7 @@ class Parser(object):
         
         # result_column = "*" | table_name + "." + "*" | Group(expr + Optional(Optional(AS) + column_alias))
         result_column = (
-            STAR("expr")                                                   
+            STAR("expr")                                                .addParseAction( _op_col_alias_callback )
             | 
             #table_name("col_table") + DOT + STAR("col")                .setParseAction( _op_col_alias_callback )
             #| 
@@ -0,0 +1,427 @@
+import re
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+class ParseError(Exception):
+
+    def __init__(self, msg, s, loc):
+        self.msg = msg
+        self.loc = loc
+        self.line   = s.count('\n', 0, loc) + 1
+        self.column = loc - (s.rfind('\n', 0, loc) + 1) + 1
+        super().__init__('%s (at char %d), (line:%d, col:%d)' % (msg, loc, self.line, self.column))
+
+#----------------------------------------------------------------------#
+# Tokenizer                                                            #
+#----------------------------------------------------------------------#
+
+RESERVED_WORDS = set([
+    'AND', 'ASC', 'DESC', 'NATURAL', 'AS', 'NOT', 'SELECT', 'FROM', 'WHERE',
+    'GROUP', 'BY', 'HAVING', 'ORDER', 'LIMIT', 'OR', 'ISNULL', 'NOTNULL', 'NULL',
+    'IS', 'BETWEEN', 'IN', 'LIKE', 'GLOB', 'REGEXP', 'MATCH', 'ESCAPE',
+    'QUERYSTRING', 'TRUE', 'FALSE',
+])
+
+_TOKEN_RE = re.compile(r"""
+      (?P<space>  [ \t\n\r]+ | --[^\n]* )
+    | (?P<number> (?:\d+[eE][+-]?\d+) | (?:(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?) | \d+ )
+    | (?P<word>   [A-Za-z@][A-Za-z0-9_]* )
+    | (?P<quoted> "(?:""|[^"\n\r])*" )
+    | (?P<string> '(?:''|[^'\n\r])*' )
+    | (?P<qstring> `(?:\\`|[^`\n\r])*` )
+    | (?P<param>  \? | :(?=[A-Za-z@"]) )
+    | (?P<op>     \|\| | << | >> | <= | >= | <> | == | != | [-+*/%&|~<>=(),.] )
+""", re.VERBOSE)
+
+_NAME_RE = re.compile(r"""[A-Za-z@][A-Za-z0-9_]*|"(?:""|[^"\n\r])*\"""")
+
+# Token kinds
+NUM, STR, QSTR, PARAM, IDENT, KW, OP, END = 'number', 'string', 'querystring', 'parameter', 'identifier', 'keyword', 'operator', 'end of text'
+
+def _name_value(text):
+    # Plain names are case insensitive, quoted ones are kept verbatim
+    if text[0] == '"':
+        return text[1:-1].replace('""', '"')
+    return text.lower()
+
+def tokenize(s):
+
+    tokens = []
+    pos    = 0
+    end    = len(s)
+
+    while pos < end:
+
+        m = _TOKEN_RE.match(s, pos)
+        if m is None:
+            raise ParseError("Unexpected character %r" % (s[pos]), s, pos)
+
+        kind  = m.lastgroup
+        text  = m.group()
+        start = pos
+        pos   = m.end()
+
+        if kind == 'space':
+            continue
+
+        if kind == 'number':
+            if '.' in text or 'e' in text or 'E' in text:
+                tokens.append((NUM, float(text), start, False))
+            else:
+                tokens.append((NUM, int(text), start, False))
+
+        elif kind == 'word' or kind == 'quoted':
+
+            if kind == 'word' and text.upper() in RESERVED_WORDS:
+                tokens.append((KW, text.upper(), start, False))
+                continue
+
+            # <identifier>.<identifier>.<identifier> with no blanks in between
+            names  = [ _name_value(text) ]
+            while pos < end and s[pos] == '.':
+                n = _NAME_RE.match(s, pos + 1)
+                if n is None or (n.group()[0] != '"' and n.group().upper() in RESERVED_WORDS):
+                    break
+                names.append(_name_value(n.group()))
+                pos = n.end()
+
+            tokens.append((IDENT, '.'.join(names), start, len(names) > 1))
+
+        elif kind == 'string':
+            tokens.append((STR, text[1:-1].replace("''", "'"), start, False))
+
+        elif kind == 'qstring':
+            tokens.append((QSTR, text[1:-1].replace('\\`', '`'), start, False))
+
+        elif kind == 'param':
+
+            if text == '?':
+                tokens.append((PARAM, None, start, False))
+                continue
+
+            # :<name>, the name follows the identifier rules
+            n = _NAME_RE.match(s, pos)
+            if n is None or (n.group()[0] != '"' and n.group().upper() in RESERVED_WORDS):
+                raise ParseError("Expected parameter name", s, pos)
+            tokens.append((PARAM, _name_value(n.group()), start, False))
+            pos = n.end()
+
+        else:
+            tokens.append((OP, text, start, False))
+
+    tokens.append((END, None, end, False))
+
+    return tokens
+
+#----------------------------------------------------------------------#
+# Parser                                                               #
+#----------------------------------------------------------------------#
+
+# Binding powers, from the loosest to the tightest
+BP_OR      = 1
+BP_AND     = 2
+BP_NOT     = 3
+BP_COMPARE = 4
+
+BINARY_BP = {
+    '<' : 5, '<=': 5, '>' : 5, '>=': 5,
+    '<<': 6, '>>': 6, '&' : 6, '|' : 6,
+    '+' : 7, '-' : 7,
+    '*' : 8, '/' : 8, '%' : 8,
+    '||': 9,
+}
+
+COMPARE_OPS     = set([ '=', '==', '!=', '<>' ])
+COMPARE_WORDS   = set([ 'IS', 'LIKE', 'GLOB', 'MATCH', 'REGEXP', 'IN', 'BETWEEN', 'ISNULL', 'NOTNULL' ])
+NEGATED_WORDS   = set([ 'LIKE', 'GLOB', 'MATCH', 'REGEXP', 'IN', 'BETWEEN', 'NULL' ])
+PREFIX_OPS      = set([ '-', '+', '~' ])
+
+class PrattParser(object):
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def parse(self, s):
+        return _ParseState(self.factory, s).query()
+
+class _ParseState(object):
+
+    def __init__(self, factory, s):
+        self.f      = factory
+        self.s      = s
+        self.tokens = tokenize(s)
+        self.i      = 0
+
+    #
+    # Token helpers
+    #
+
+    def peek(self, offset=0):
+        return self.tokens[self.i + offset]
+
+    def next(self):
+        tok = self.tokens[self.i]
+        self.i += 1
+        return tok
+
+    def at(self, kind, value=None, offset=0):
+        tok = self.tokens[self.i + offset]
+        return tok[0] == kind and (value is None or tok[1] == value)
+
+    def accept(self, kind, value=None):
+        if self.at(kind, value):
+            return self.next()
+        return None
+
+    def expect(self, kind, value=None):
+        if not self.at(kind, value):
+            self.error("Expected %s" % (repr(value) if value is not None else kind))
+        return self.next()
+
+    def error(self, msg):
+        tok = self.peek()
+        found = tok[0] if tok[0] == END else repr(self.s[tok[2]:].split(None, 1)[0])
+        raise ParseError('%s, found %s' % (msg, found), self.s, tok[2])
+
+    #
+    # SELECT ... FROM ... WHERE ... GROUP BY ... HAVING ... ORDER BY ... LIMIT ...
+    #
+
+    def query(self):
+        f = self.f
+
+        self.expect(KW, 'SELECT')
+
+        s = f.createASTSelect(self.delimited(self.result_column))
+
+        frm = where = group = having = order = limit = None
+
+        if self.accept(KW, 'FROM'):
+            frm = f.createASTFrom(self.delimited(self.single_source))
+
+        if self.accept(KW, 'WHERE'):
+            where = f.createASTWhere(self.expr())
+
+        if self.accept(KW, 'GROUP'):
+            self.expect(KW, 'BY')
+            group = f.createASTGroup(self.delimited(self.dotted_identifier))
+
+            if self.accept(KW, 'HAVING'):
+                having = f.createASTHaving(self.delimited(self.expr))
+
+        body = f.createSelectBody(s, frm, where, group, having)
+
+        if self.accept(KW, 'ORDER'):
+            self.expect(KW, 'BY')
+            order = f.createASTOrder(self.delimited(self.ordering_term))
+
+        if self.accept(KW, 'LIMIT'):
+            limit = f.createASTLimit(self.expr())
+
+        self.expect(END)
+
+        return f.createQuery(body, order, limit)
+
+    def delimited(self, item):
+        items = [ item() ]
+        while self.accept(OP, ','):
+            items.append(item())
+        return items
+
+    def name(self):
+        tok = self.peek()
+        if tok[0] != IDENT or tok[3]:
+            self.error("Expected identifier")
+        return self.next()[1]
+
+    def optional_alias(self):
+        if self.accept(KW, 'AS'):
+            return self.f.createStringLiteral(self.name())
+        if self.at(IDENT) and not self.peek()[3]:
+            return self.f.createStringLiteral(self.name())
+        return None
+
+    def result_column(self):
+        if self.at(OP, '*'):
+            self.next()
+            return self.f.createASTSelectColumn(self.f.createIdentifier('*'), None)
+
+        expr = self.expr()
+        return self.f.createASTSelectColumn(expr, self.optional_alias())
+
+    def single_source(self):
+        table = self.f.createStringLiteral(self.name())
+        return self.f.createASTTable(table, self.optional_alias())
+
+    def dotted_identifier(self):
+        return self.f.createIdentifier(self.expect(IDENT)[1])
+
+    def ordering_term(self):
+        expr      = self.expr()
+        direction = None
+        if self.at(KW, 'ASC') or self.at(KW, 'DESC'):
+            direction = self.next()[1]
+        return self.f.createOrderTerm(expr, direction)
+
+    #
+    # Expressions
+    #
+
+    def expr(self, rbp=0):
+
+        # Binding power of the last operator applied to "left": a postfix
+        # comparison (ISNULL, IN (...), ...) closes the operand for tighter
+        # operators, NOT leaves only AND and OR.
+        limit = BP_NOT if self.at(KW, 'NOT') else None
+
+        left  = self.prefix(rbp)
+
+        while True:
+            tok = self.peek()
+
+            if tok[0] == OP and tok[1] in BINARY_BP:
+                lbp = BINARY_BP[tok[1]]
+            elif tok[0] == KW and tok[1] == 'AND':
+                lbp = BP_AND
+            elif tok[0] == KW and tok[1] == 'OR':
+                lbp = BP_OR
+            elif self.at_comparison():
+                lbp = BP_COMPARE
+            else:
+                break
+
+            if lbp <= rbp or (limit is not None and lbp > limit):
+                break
+
+            if lbp == BP_COMPARE:
+                left = self.comparison(left)
+            else:
+                self.next()
+                left = self.f.createBinaryExpr(tok[1], left, self.expr(lbp))
+
+            limit = lbp
+
+        return left
+
+    def at_comparison(self):
+        tok = self.peek()
+
+        if tok[0] == OP:
+            return tok[1] in COMPARE_OPS
+
+        if tok[0] == KW:
+            if tok[1] in COMPARE_WORDS:
+                return True
+            if tok[1] == 'NOT':
+                nxt = self.peek(1)
+                return nxt[0] == KW and nxt[1] in NEGATED_WORDS
+
+        return False
+
+    def comparison(self, left):
+        f   = self.f
+        tok = self.next()
+        op  = tok[1]
+
+        if tok[0] == OP:
+            return f.createBinaryExpr(op, left, self.expr(BP_COMPARE))
+
+        if op == 'NOT':
+            op = 'NOT ' + self.next()[1]
+        elif op == 'IS' and self.accept(KW, 'NOT'):
+            op = 'IS NOT'
+
+        if op in ('ISNULL', 'NOTNULL', 'NOT NULL'):
+            return f.createASTUnaryExpr(op, left)
+
+        if op in ('IN', 'NOT IN'):
+            self.expect(OP, '(')
+            exprs = self.delimited(self.expr)
+            self.expect(OP, ')')
+            return f.createBinaryExpr(op, left, f.createExprList(exprs))
+
+        if op in ('BETWEEN', 'NOT BETWEEN'):
+            low = self.expr(BP_COMPARE)
+            self.expect(KW, 'AND')
+            high = self.expr(BP_COMPARE)
+            return f.createASTTernaryExpr(op.lower(), left, low, high)
+
+        return f.createBinaryExpr(op, left, self.expr(BP_COMPARE))
+
+    def prefix(self, rbp):
+        if self.at(KW, 'NOT'):
+            if rbp > BP_NOT:
+                self.error("Expected expression")
+            self.next()
+            return self.f.createASTUnaryExpr('NOT', self.expr(BP_NOT))
+
+        return self.unary()
+
+    def unary(self):
+        if self.peek()[0] == OP and self.peek()[1] in PREFIX_OPS:
+            op = self.next()[1]
+            return self.f.createASTUnaryExpr(op, self.unary())
+
+        return self.primary()
+
+    def primary(self):
+        f   = self.f
+        tok = self.peek()
+        kind, value = tok[0], tok[1]
+
+        if kind == IDENT:
+            self.next()
+
+            # <function>(<params>)
+            if not tok[3] and self.at(OP, '('):
+                self.next()
+                if self.accept(OP, '*'):
+                    params = [ f.createIdentifier('*') ]
+                elif self.at(OP, ')'):
+                    params = []
+                else:
+                    params = self.delimited(self.expr)
+                self.expect(OP, ')')
+                return f.createCall(f.createIdentifier(value), params)
+
+            return f.createIdentifier(value)
+
+        if kind == NUM:
+            self.next()
+            return f.createNumericLiteral(value)
+
+        if kind == STR:
+            self.next()
+            return f.createStringLiteral(value)
+
+        if kind == QSTR:
+            self.next()
+            return f.createQueryString(value)
+
+        if kind == PARAM:
+            self.next()
+            return f.createBindParameter(value, tok[2])
+
+        if kind == KW:
+            if value == 'QUERYSTRING':
+                self.next()
+                if self.at(PARAM):
+                    param = self.next()
+                    return f.createQueryString(f.createBindParameter(param[1], param[2]))
+                return f.createQueryString(self.expect(QSTR)[1])
+            if value == 'TRUE' or value == 'FALSE':
+                self.next()
+                return f.createBoolLiteral(value == 'TRUE')
+            if value == 'NULL':
+                self.next()
+                return f.createNullLiteral()
+
+        if kind == OP and value == '(':
+            self.next()
+            expr = self.expr()
+            self.expect(OP, ')')
+            return expr
+
+        self.error("Expected expression")
@@ -0,0 +1,195 @@
+import sys
+
+from array import array
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+# Query results stored by column instead of one list per row:
+#
+#   ints, floats     array('q'), array('d')
+#   strings          dictionary encoded (distinct values + array of codes)
+#                    when they repeat, interned otherwise
+#   anything else    tuple
+#
+# Rows are tuples built while iterating.
+
+class ResultSet(object):
+
+    def __init__(self, header, columns, intern=True):
+        self.header  = header
+        self.columns = columns
+
+        # Slices are compacted the same way
+        self.intern  = intern
+
+    @classmethod
+    def from_rows(cls, header, rows, intern=True):
+
+        # rows: any iterable of rows, consumed once
+        builder = _ResultSetBuilder(header, intern)
+        builder.add(rows)
+
+        return builder.result()
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self):
+        return zip(*self.columns)
+
+    def __getitem__(self, i):
+
+        if isinstance(i, slice):
+            return ResultSet(self.header, [ _compact_column(list(column[i]), self.intern) for column in self.columns ], self.intern)
+
+        return tuple([ column[i] for column in self.columns ])
+
+    def column(self, name):
+
+        # Alias or position
+        if not isinstance(name, int):
+            if name not in self.header:
+                raise KeyError(name)
+            name = self.header.index(name)
+
+        return list(self.columns[name])
+
+    def to_rows(self):
+        # Same layout as Executor.execute()
+        return [ list(self.header) ] + [ list(row) for row in self ]
+
+    def memory_usage(self):
+
+        columns = [
+            { 'name': name, 'storage': column.storage, 'bytes': column.nbytes() }
+            for name, column in zip(self.header, self.columns)
+        ]
+
+        return {
+            'rows'   : len(self),
+            'bytes'  : sum(c['bytes'] for c in columns) + sys.getsizeof(self.columns),
+            'columns': columns,
+        }
+
+class _ResultSetBuilder(object):
+
+    # Rows added in as many batches as needed, then compacted
+    def __init__(self, header, intern=True):
+        self.header   = list(header)
+        self.intern   = intern
+        self.values   = [ [] for _ in header ]
+        self.interned = [ {} for _ in header ] if intern else None
+
+    def add(self, rows):
+
+        values   = self.values
+        interned = self.interned
+
+        for row in rows:
+            for i, v in enumerate(row):
+                if interned is not None and type(v) is str:
+                    v = interned[i].setdefault(v, v)
+                values[i].append(v)
+
+    def result(self):
+        return ResultSet(self.header, [ _compact_column(column, self.intern) for column in self.values ], self.intern)
+
+#----------------------------------------------------------------------#
+# Columns                                                              #
+#----------------------------------------------------------------------#
+
+INT64_MIN = -2 ** 63
+INT64_MAX =  2 ** 63 - 1
+
+def _compact_column(values, intern=True):
+
+    types = set(map(type, values))
+
+    if types == { int } and INT64_MIN <= min(values) and max(values) <= INT64_MAX:
+        return _ArrayColumn(array('q', values))
+
+    if types == { float }:
+        return _ArrayColumn(array('d', values))
+
+    if intern and types and types <= { str, type(None) }:
+        distinct = {}
+        for v in values:
+            distinct.setdefault(v, len(distinct))
+
+        # Worth it only for repeated values
+        if len(distinct) * 2 <= len(values):
+            typecode = 'B' if len(distinct) <= 0xff else 'H' if len(distinct) <= 0xffff else 'I'
+            return _DictColumn(array(typecode, map(distinct.__getitem__, values)), list(distinct))
+
+    return _ObjectColumn(tuple(values))
+
+def _objects_size(values):
+
+    # Shared objects (interned strings, small ints) are counted once
+    seen = {}
+    for v in values:
+        seen[id(v)] = v
+
+    return sum(map(sys.getsizeof, seen.values()))
+
+class _ArrayColumn(object):
+
+    storage = 'array'
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def nbytes(self):
+        return sys.getsizeof(self.values)
+
+class _DictColumn(object):
+
+    storage = 'dictionary'
+
+    def __init__(self, codes, values):
+        self.codes  = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self.values[code] for code in self.codes[i] ]
+        return self.values[self.codes[i]]
+
+    def nbytes(self):
+        return sys.getsizeof(self.codes) + sys.getsizeof(self.values) + _objects_size(self.values)
+
+class _ObjectColumn(object):
+
+    storage = 'objects'
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def nbytes(self):
+        return sys.getsizeof(self.values) + _objects_size(self.values)
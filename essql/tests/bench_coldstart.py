@@ -0,0 +1,97 @@
+
+#
+# Cold start benchmark: import time, grammar construction and first parse.
+#
+# Every measure runs in a fresh interpreter:
+#
+#   python -m 'essql.tests.bench_coldstart' [runs]
+#
+
+import os
+import sys
+import json
+import subprocess
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+QUERY = open(os.path.join(os.path.dirname(__file__), '..', '..', 'examples', 'query_test_01.txt')).read()
+
+SCRIPT = '''
+import sys, json, time
+
+query = sys.argv[1]
+
+t0 = time.perf_counter()
+
+if %(eager)r:
+    import pyparsing
+    import requests
+
+import essql.composer
+import essql.execution
+
+t1 = time.perf_counter()
+
+parser = essql.composer.ComposerParser()
+parser.parse(query)
+
+t2 = time.perf_counter()
+
+parser = essql.composer.ComposerParser()
+parser.parse(query)
+
+t3 = time.perf_counter()
+
+parser.create_parser()
+
+t4 = time.perf_counter()
+
+print(json.dumps({
+    'import'         : t1 - t0,
+    'first_parse'    : t2 - t1,
+    'new_instance'   : t3 - t2,
+    'grammar_rebuild': t4 - t3,
+}))
+'''
+
+def run(eager):
+
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+
+    out = subprocess.check_output(
+        [ sys.executable, '-W', 'ignore', '-c', SCRIPT % { 'eager': eager }, QUERY ],
+        cwd=root,
+    )
+
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+def best_of(runs, eager):
+
+    best = {}
+
+    for _ in range(runs):
+        for k, v in run(eager).items():
+            best[k] = min(best.get(k, v), v)
+
+    return best
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    lazy  = best_of(runs, False)
+    eager = best_of(runs, True)
+
+    print("%-40s %10s" % ("stage (best of %d)" % runs, "ms"))
+    print("-" * 51)
+    print("%-40s %10.2f" % ("import essql (lazy dependencies)"      , lazy ['import'] * 1000))
+    print("%-40s %10.2f" % ("import essql + pyparsing + requests"   , eager['import'] * 1000))
+    print("%-40s %10.2f" % ("first ComposerParser() + parse"        , lazy ['first_parse'] * 1000))
+    print("%-40s %10.2f" % ("second ComposerParser() + parse"       , lazy ['new_instance'] * 1000))
+    print("%-40s %10.2f" % ("grammar rebuild (cost before sharing)" , lazy ['grammar_rebuild'] * 1000))
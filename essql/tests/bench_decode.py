@@ -0,0 +1,80 @@
+
+#
+# Response decoding benchmark: the available decoders on a synthetic
+# search response, all the _source fields or only the queried ones:
+#
+#   python -m 'essql.tests.bench_decode' [hits]
+#
+
+import sys
+import json
+import time
+import random
+
+from essql.decoders import DECODERS, get_decoder
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+def make_response(n, seed=0):
+
+    rnd = random.Random(seed)
+
+    hits = [
+        {
+            '_index' : 't',
+            '_id'    : str(i),
+            '_score' : None,
+            'sort'   : [ i ],
+            '_source': {
+                'x'      : rnd.randint(0, 1000),
+                'y'      : rnd.random() * 100,
+                'host'   : 'web-%02d' % (rnd.randint(0, 40)),
+                'message': ' '.join([ rnd.choice(['GET', 'POST', '/index', '/api', '200', '404']) for _ in range(20) ]),
+                'log'    : { 'level': { 'descr': rnd.choice(['INFO', 'WARN', 'ERROR']) } },
+            },
+        }
+        for i in range(n)
+    ]
+
+    return json.dumps({ 'took': 3, 'timed_out': False, 'hits': { 'total': { 'value': n }, 'hits': hits } }).encode('utf-8')
+
+def bench(decoder, content, fields, repeat=5):
+
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        decoder.decode(content, fields)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    content = make_response(n)
+
+    print("%-12s %-20s %10s %10s" % ("decoder", "fields", "ms", "MB/s"))
+    print("-" * 55)
+
+    for name in DECODERS:
+        try:
+            decoder = get_decoder(name)
+        except ImportError:
+            print("%-12s (not installed)" % (name))
+            continue
+
+        # CBOR: see bench_wire
+        if decoder.content_type != 'application/json':
+            continue
+
+        for fields in (None, [ 'x', 'host' ]):
+            elapsed = bench(decoder, content, fields)
+            print("%-12s %-20s %10.1f %10.1f" % (name, fields or 'all', elapsed * 1000, len(content) / elapsed / 1e6))
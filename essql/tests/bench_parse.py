@@ -0,0 +1,104 @@
+
+#
+# Parse latency over queries with increasing expression depth.
+#
+# Packrat memoization is global to pyparsing, so every mode runs in a
+# fresh interpreter:
+#
+#   python -m 'essql.tests.bench_parse' [max_depth]
+#
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+def arithmetic_expr(depth):
+    e = 'x'
+    for i in range(depth):
+        e = '(%s + %d) * y%d' % (e, i, i)
+    return e
+
+def boolean_expr(depth):
+    e = 'a0 = 0'
+    for i in range(1, depth + 1):
+        e = '(a%d > %d AND (%s) OR b%d <> %d)' % (i, i, e, i, i)
+    return e
+
+def build_query(kind, depth):
+    if kind == 'arithmetic':
+        e = arithmetic_expr(depth)
+        return 'SELECT %s AS c FROM t WHERE %s > 0' % (e, e)
+    else:
+        e = boolean_expr(depth)
+        return 'SELECT x FROM t WHERE %s' % (e)
+
+def measure(packrat, depths, min_time=0.2):
+
+    from essql.composer import ComposerParser
+
+    parser = ComposerParser(packrat=packrat)
+
+    results = []
+
+    for kind in ('arithmetic', 'boolean'):
+        for depth in depths:
+            query = build_query(kind, depth)
+
+            try:
+                parser.parse(query)
+            except RecursionError:
+                results.append((kind, depth, len(query), None))
+                continue
+
+            n  = 0
+            t0 = time.perf_counter()
+            while True:
+                parser.parse(query)
+                n += 1
+                elapsed = time.perf_counter() - t0
+                if elapsed >= min_time:
+                    break
+
+            results.append((kind, depth, len(query), elapsed / n))
+
+    return results
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 2 and sys.argv[1] == '--worker':
+        packrat = json.loads(sys.argv[2])
+        depths  = json.loads(sys.argv[3])
+        print(json.dumps(measure(packrat, depths)))
+        sys.exit(0)
+
+    max_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+
+    depths = [ d for d in (1, 2, 4, 8, 16, 32, 64) if d <= max_depth ]
+
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+
+    print("%-10s %-11s %6s %7s %12s %12s" % ("packrat", "expression", "depth", "chars", "ms/parse", "us/char"))
+    print("-" * 63)
+
+    for packrat in (False, True):
+
+        out = subprocess.check_output(
+            [ sys.executable, '-W', 'ignore', '-m', 'essql.tests.bench_parse', '--worker', json.dumps(packrat), json.dumps(depths) ],
+            cwd=root,
+        )
+
+        for kind, depth, chars, seconds in json.loads(out.decode('utf-8').strip().splitlines()[-1]):
+            if seconds is None:
+                print("%-10s %-11s %6d %7d %12s %12s" % (packrat, kind, depth, chars, "recursion", "-"))
+            else:
+                print("%-10s %-11s %6d %7d %12.3f %12.2f" % (packrat, kind, depth, chars, seconds * 1000, seconds * 1e6 / chars))
@@ -0,0 +1,76 @@
+
+#
+# Row projection benchmark: Executor.process_result over synthetic hits,
+# per row and vectorized (numpy), no cluster needed:
+#
+#   python -m 'essql.tests.bench_projection' [hits]
+#
+
+import sys
+import time
+import random
+
+from essql.composer import ComposerParser
+from essql.execution import Executor
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+QUERIES = [
+    "SELECT x, y FROM t",
+    "SELECT x * 2 + y AS a, abs(z) AS b, pow(x, 2) AS c, log.level.descr FROM t",
+    "SELECT (x * 2 + y * 3 - z / 4) * abs(z) + pow(x, 2) - pow(y, 3) / (1 + abs(x)) AS a FROM t",
+    "SELECT x / (y - y) AS div_by_zero, missing + 1 AS missing FROM t",
+]
+
+def make_hits(n, seed=0):
+
+    rnd = random.Random(seed)
+
+    return [
+        {
+            '_index' : 't',
+            '_id'    : str(i),
+            '_source': {
+                'x'  : rnd.randint(0, 1000),
+                'y'  : rnd.random() * 100,
+                'z'  : rnd.randint(-500, 500),
+                'log': { 'level': { 'descr': rnd.choice(['INFO', 'WARN', 'ERROR']) } },
+            },
+        }
+        for i in range(n)
+    ]
+
+def bench(sql, hits, vectorize, repeat=3):
+
+    query_descriptor = ComposerParser().parse(sql).composeQuery()
+
+    executor = Executor('http://localhost:9200', query_descriptor, vectorize=vectorize)
+
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        executor.process_result(hits, query_descriptor)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    hits = make_hits(n)
+
+    print("%-80s %-10s %10s %12s" % ("query (%d hits)" % n, "mode", "ms", "rows/s"))
+    print("-" * 115)
+
+    for sql in QUERIES:
+        for vectorize in (False, True):
+            elapsed = bench(sql, hits, vectorize)
+            print("%-80s %-10s %10.1f %12.0f" % (sql, "numpy" if vectorize else "per-row", elapsed * 1000, n / elapsed))
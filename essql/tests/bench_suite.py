@@ -0,0 +1,358 @@
+
+#
+# Offline benchmark suite, no cluster needed: parse, compose, decode,
+# process_result and aggregation flattening on a corpus of statements
+# and on recorded or generated responses, and whole queries run on the
+# in-memory backend, with throughput and peak memory.
+#
+#   python -m 'essql.tests.bench_suite' [--full] [--save results.json] [--compare baseline.json]
+#                                       [--responses dir] [--threshold 0.1]
+#
+# --full adds the 1M hits response; the Arrow stages need pyarrow.
+# Recorded responses are the JSON bodies of _search requests saved as
+# <name>.json, with the statement that produced them in <name>.sql. With
+# --compare the exit status is 1 when a stage is slower than the baseline
+# by more than the threshold.
+#
+
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+
+import essql
+
+from essql.composer import ComposerParser
+from essql.decoders import DECODERS, get_decoder
+from essql.execution import Executor, _composite_columns
+from essql.memory import MemoryTransport
+from essql import arrow
+
+try:
+    pa = arrow.import_pyarrow()
+except ImportError:
+    pa = None
+from essql.tests.bench_projection import make_hits
+
+#----------------------------------------------------------------------#
+# Corpus                                                               #
+#----------------------------------------------------------------------#
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(essql.__file__)), 'examples')
+
+STATEMENTS = [
+    ("simple"     , "SELECT x, y FROM t"),
+    ("projection" , "SELECT x * 2 + y AS a, abs(z) AS b, pow(x, 2) AS c, log.level.descr FROM t"),
+    ("filters"    , "SELECT x FROM t WHERE a = 1 AND b BETWEEN 1 AND 3 AND c LIKE 'ab%' AND d IN (1, 2, 3) AND e IS NOT NULL"),
+    ("boolean"    , "SELECT x FROM t WHERE (a = 1 OR b > 2) AND NOT (c < 3 OR d <> 4) AND QUERYSTRING `x:>1000`"),
+    ("group_by"   , "SELECT a, b, count(*), sum(z), max(z) + 1 FROM t GROUP BY a.keyword, b HAVING sum(z) > 10 LIMIT 100"),
+    ("parameters" , "SELECT host, bytes / ? AS kb FROM logs WHERE status >= :status AND QUERYSTRING :q LIMIT :n"),
+]
+
+def corpus():
+
+    statements = list(STATEMENTS)
+
+    for file_name in sorted(glob.glob(os.path.join(EXAMPLES, '*.txt'))):
+        with open(file_name) as f:
+            statements.append((os.path.splitext(os.path.basename(file_name))[0], f.read()))
+
+    return statements
+
+#----------------------------------------------------------------------#
+# Responses                                                            #
+#----------------------------------------------------------------------#
+
+HITS_SQL = "SELECT x, y * 2 AS y2, abs(z) AS az, log.level.descr FROM t"
+
+GROUP_SQL = "SELECT a, b, count(*), sum(z), max(z) + 1 FROM t GROUP BY a, b"
+
+def hits_response(n):
+    return json.dumps({ 'took': 1, 'timed_out': False, 'hits': { 'total': { 'value': n }, 'hits': make_hits(n) } }).encode('utf-8')
+
+def nested_buckets(fields, fanout, level=0):
+
+    # Nested terms aggregations, fanout buckets per level
+    buckets = []
+    for i in range(fanout):
+        bucket = { 'key': '%s%d' % (fields[level], i), 'doc_count': fanout ** (len(fields) - level) }
+        if level + 1 < len(fields):
+            bucket[fields[level + 1]] = nested_buckets(fields, fanout, level + 1)
+        else:
+            bucket['sum(z)'] = { 'value': float(i) }
+        buckets.append(bucket)
+
+    return { 'buckets': buckets }
+
+def composite_buckets(n):
+    return [
+        { 'key': { 'a': 'a%d' % (i // 50), 'b': i % 50 }, 'doc_count': i + 1, 'sum(z)': { 'value': i * 2.5 }, 'max(z)': { 'value': i } }
+        for i in range(n)
+    ]
+
+def recorded_responses(path):
+
+    responses = []
+
+    for file_name in sorted(glob.glob(os.path.join(path, '*.json'))):
+        name = os.path.splitext(os.path.basename(file_name))[0]
+
+        with open(file_name, 'rb') as f:
+            content = f.read()
+
+        sql = None
+        if os.path.exists(os.path.join(path, name + '.sql')):
+            with open(os.path.join(path, name + '.sql')) as f:
+                sql = f.read()
+
+        responses.append((name, content, sql))
+
+    return responses
+
+#----------------------------------------------------------------------#
+# Measures                                                             #
+#----------------------------------------------------------------------#
+
+def measure(fun, min_time=0.2, rounds=5):
+
+    # Best seconds per call over a few rounds, and peak memory of one
+    # traced call
+    fun()
+
+    best = None
+    for _ in range(rounds):
+        n  = 0
+        t0 = time.perf_counter()
+        while True:
+            fun()
+            n += 1
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_time / rounds:
+                break
+        best = elapsed / n if best is None else min(best, elapsed / n)
+
+    tracemalloc.start()
+    try:
+        fun()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+class Suite(object):
+
+    def __init__(self, min_time=0.2):
+        self.min_time = min_time
+        self.results  = {}
+
+    def run(self, key, fun, items, unit):
+
+        seconds, peak = measure(fun, self.min_time)
+
+        self.results[key] = {
+            'seconds'   : seconds,
+            'throughput': items / seconds,
+            'unit'      : unit,
+            'peak_bytes': peak,
+        }
+
+        print("%-52s %12.3f %14.0f %-8s %10.1f" % (key, seconds * 1000, items / seconds, unit, peak / 1e6))
+
+    def statements(self):
+
+        for backend in ('pyparsing', 'pratt'):
+            parser = ComposerParser(backend=backend)
+
+            for name, sql in corpus():
+                self.run('parse/%s/%s' % (backend, name), lambda: parser.parse(sql), 1, 'stmt/s')
+
+        parser = ComposerParser(backend='pratt')
+
+        for name, sql in corpus():
+            tree = parser.parse(sql)
+            self.run('compose/%s' % (name), lambda: tree.composeQuery(), 1, 'stmt/s')
+
+    def hits(self, sizes):
+
+        query_descriptor = ComposerParser().parse(HITS_SQL).composeQuery()
+
+        for n in sizes:
+            content = hits_response(n)
+
+            for name in DECODERS:
+                try:
+                    decoder = get_decoder(name)
+                except ImportError:
+                    continue
+                if decoder.content_type != 'application/json':
+                    continue
+                self.run('decode/%s/%d' % (name, n), lambda: decoder.decode(content), len(content) / 1e6, 'MB/s')
+
+            hits = get_decoder().decode(content)['hits']['hits']
+
+            for vectorize in (False, True):
+                executor = Executor('http://localhost:9200', query_descriptor, vectorize=vectorize)
+                mode = 'numpy' if vectorize else 'per-row'
+                self.run('process_result/%s/%d' % (mode, n), lambda: executor.process_result(hits, query_descriptor), n, 'rows/s')
+
+                if pa is not None:
+                    names = arrow.column_names(query_descriptor)
+                    types = [ None ] * len(names)
+                    fun = lambda: [ arrow.record_batch(pa, names, columns, types) for columns in executor.iter_columns(hits, query_descriptor) ]
+                    self.run('arrow/%s/%d' % (mode, n), fun, n, 'rows/s')
+
+            del content, hits
+
+    def aggregations(self, fanouts, composite_sizes):
+
+        executor = Executor('http://localhost:9200', ComposerParser().parse(HITS_SQL).composeQuery())
+
+        fields = [ 'a', 'b', 'c' ]
+
+        query_descriptor = ComposerParser().parse(GROUP_SQL).composeQuery()
+
+        for fanout in fanouts:
+            n = fanout ** len(fields)
+
+            aggr_data = { fields[0]: nested_buckets(fields, fanout) }
+            self.run('process_aggregation/nested/%d' % (n), lambda: executor._process_aggregation(aggr_data, fields), n, 'rows/s')
+
+            # Flattening and the column expressions
+            for vectorize in (False, True):
+                nested = Executor('http://localhost:9200', query_descriptor, vectorize=vectorize)
+                mode   = 'numpy' if vectorize else 'per-row'
+                fun    = lambda: nested.process_result(nested._process_aggregation(aggr_data, fields), query_descriptor)
+                self.run('process_aggregation/nested/%s/%d' % (mode, n), fun, n, 'rows/s')
+
+        # Composite pages are column tables too
+        for n in composite_sizes:
+            buckets = composite_buckets(n)
+            for vectorize in (False, True):
+                composite = Executor('http://localhost:9200', query_descriptor, vectorize=vectorize)
+                mode      = 'numpy' if vectorize else 'per-row'
+                fun       = lambda: composite.process_result(_composite_columns(fields[:2], buckets), query_descriptor)
+                self.run('process_aggregation/composite/%s/%d' % (mode, n), fun, n, 'rows/s')
+
+    def end_to_end(self, n):
+
+        # The whole pipeline, the requests served by the in-memory backend
+        transport = MemoryTransport()
+        transport.bulk('t', [ hit['_source'] for hit in make_hits(n) ])
+
+        statements = [
+            ('hits'    , HITS_SQL + ' LIMIT %d' % (n)),
+            ('filters' , "SELECT x, y FROM t WHERE x > 100 AND log.level.descr IN ('INFO', 'WARN') LIMIT %d" % (n)),
+            ('group_by', "SELECT log.level.descr, count(*), sum(x), max(y) FROM t GROUP BY log.level.descr"),
+        ]
+
+        for name, sql in statements:
+            query_descriptor = ComposerParser().parse(sql).composeQuery()
+            executor         = Executor('memory://', query_descriptor, transport=transport)
+            self.run('end_to_end/%s/%d' % (name, n), executor.execute, n, 'docs/s')
+
+    def recorded(self, path):
+
+        for name, content, sql in recorded_responses(path):
+
+            decoder = get_decoder()
+            self.run('recorded/decode/%s' % (name), lambda: decoder.decode(content), len(content) / 1e6, 'MB/s')
+
+            if sql is None:
+                continue
+
+            query_descriptor = ComposerParser().parse(sql).composeQuery()
+            executor         = Executor('http://localhost:9200', query_descriptor)
+            cursor           = executor._cursor(query_descriptor)
+            results          = decoder.decode(content)
+
+            # The cursor turns the response into hits or aggregation rows
+            rows = cursor.feed(results)
+            self.run('recorded/process_result/%s' % (name), lambda: executor.process_result(cursor.feed(results), query_descriptor), max(len(rows), 1), 'rows/s')
+
+#----------------------------------------------------------------------#
+# Results                                                              #
+#----------------------------------------------------------------------#
+
+def save(file_name, results):
+
+    data = {
+        'version': essql.__version__,
+        'python' : platform.python_version(),
+        'date'   : time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+
+    with open(file_name, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+def compare(file_name, results, threshold):
+
+    with open(file_name) as f:
+        baseline = json.load(f)
+
+    print()
+    print("Compared with %s (essql %s, %s)" % (file_name, baseline.get('version'), baseline.get('date')))
+    print("%-52s %12s %12s %8s" % ("stage", "baseline ms", "ms", "ratio"))
+    print("-" * 87)
+
+    regressions = []
+
+    for key, result in sorted(results.items()):
+
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+
+        ratio = result['seconds'] / before['seconds']
+        flag  = ''
+        if ratio > 1 + threshold:
+            flag = '  SLOWER'
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+
+        print("%-52s %12.3f %12.3f %8.2f%s" % (key, before['seconds'] * 1000, result['seconds'] * 1000, ratio, flag))
+
+    return regressions
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    args = argparse.ArgumentParser(description="essql offline benchmarks")
+    args.add_argument('--full'     , action='store_true', help="include the 1M hits response")
+    args.add_argument('--save'     , metavar='FILE', help="store the results as JSON")
+    args.add_argument('--compare'  , metavar='FILE', help="compare with results stored by --save")
+    args.add_argument('--responses', metavar='DIR' , help="recorded <name>.json responses, <name>.sql statements")
+    args.add_argument('--threshold', type=float, default=0.1, help="slowdown reported as a regression (0.1 = 10%%)")
+    args.add_argument('--min-time' , type=float, default=0.2, help="seconds spent on every stage")
+    args = args.parse_args()
+
+    sizes = [ 10, 1000, 100000 ] + ([ 1000000 ] if args.full else [])
+
+    suite = Suite(args.min_time)
+
+    print("%-52s %12s %14s %-8s %10s" % ("stage", "ms/op", "throughput", "", "peak MB"))
+    print("-" * 100)
+
+    suite.statements()
+    suite.hits(sizes)
+    suite.aggregations([ 5, 20, 50 ], [ 1000, 100000 ])
+    suite.end_to_end(10000)
+
+    if args.responses:
+        suite.recorded(args.responses)
+
+    if args.save:
+        save(args.save, suite.results)
+
+    if args.compare:
+        if compare(args.compare, suite.results, args.threshold):
+            sys.exit(1)
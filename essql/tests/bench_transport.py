@@ -0,0 +1,79 @@
+
+#
+# Transport benchmark: one requests.get() per query against a shared
+# keep-alive Transport, on a local HTTP/1.1 server answering like a search:
+#
+#   python -m 'essql.tests.bench_transport' [requests]
+#
+
+import sys
+import json
+import time
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from essql.transport import Transport
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+RESPONSE = json.dumps({
+    'hits': { 'hits': [ { '_source': { 'x': i, 'msg': 'message %d' % i } } for i in range(100) ] }
+}).encode('utf-8')
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body go out in separate writes
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d/t/_search' % (server.server_port)
+
+def bench(fun, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fun()
+    return (time.perf_counter() - t0) / n
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    import requests
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    server, uri = start_server()
+
+    body = { 'query': { 'match_all': {} }, 'size': 100 }
+
+    transport = Transport()
+
+    no_session = bench(lambda: requests.get(uri, json=body).content, n)
+    pooled     = bench(lambda: transport.request('GET', uri, body), n)
+
+    print("%-40s %10s" % ("%d requests" % n, "us/request"))
+    print("-" * 51)
+    print("%-40s %10.0f" % ("requests.get (new connection)", no_session * 1e6))
+    print("%-40s %10.0f" % ("Transport (keep-alive pool)"  , pooled * 1e6))
+
+    server.shutdown()
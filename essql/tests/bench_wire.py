@@ -0,0 +1,94 @@
+
+#
+# Wire format benchmark: size (plain and gzipped) and decode time of the
+# same responses as JSON and CBOR, when its encoder is installed (cbor2):
+#
+#   python -m 'essql.tests.bench_wire' [hits] [recorded.json ...]
+#
+# Recorded responses are the JSON bodies of real _search requests, saved
+# to files; without them synthetic hit and aggregation responses are used.
+#
+
+import sys
+import gzip
+import json
+import time
+
+from essql.decoders import get_decoder, wire_decoder
+from essql.tests.bench_decode import make_response
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+def make_aggregation_response(n):
+
+    buckets = [
+        {
+            'key'      : { 'host': 'web-%04d' % (i), 'status': 200 + i % 5 },
+            'doc_count': 1000 + i,
+            'sum(bytes)': { 'value': i * 1234.5 },
+            'max(took)' : { 'value': i % 977 },
+        }
+        for i in range(n)
+    ]
+
+    return json.dumps({
+        'aggregations': { '_group_by': { 'after_key': buckets[-1]['key'], 'buckets': buckets } }
+    }).encode('utf-8')
+
+def encoders():
+
+    formats = [ ('json', lambda obj: json.dumps(obj).encode('utf-8')) ]
+
+    try:
+        import cbor2
+        formats.append(('cbor', cbor2.dumps))
+    except ImportError:
+        pass
+
+    return formats
+
+def bench(content, repeat=5):
+
+    decoder = wire_decoder(content) or get_decoder()
+
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        decoder.decode(content)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    return decoder.name, best
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    if len(sys.argv) > 2:
+        responses = []
+        for file_name in sys.argv[2:]:
+            with open(file_name, 'rb') as f:
+                responses.append((file_name, f.read()))
+    else:
+        responses = [
+            ('hits (%d)' % (n)        , make_response(n)),
+            ('aggregation (%d)' % (n) , make_aggregation_response(n)),
+        ]
+
+    print("%-24s %-8s %-10s %12s %12s %10s" % ("response", "format", "decoder", "bytes", "gzip bytes", "decode ms"))
+    print("-" * 81)
+
+    for name, content in responses:
+
+        obj = json.loads(content)
+
+        for fmt, encode in encoders():
+            data = encode(obj)
+            decoder_name, elapsed = bench(data)
+            print("%-24s %-8s %-10s %12d %12d %10.1f" % (name, fmt, decoder_name, len(data), len(gzip.compress(data)), elapsed * 1000))
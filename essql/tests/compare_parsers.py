@@ -0,0 +1,173 @@
+
+#
+# Differential check between the pyparsing and the Pratt parser backends.
+#
+# Every statement of the corpus must give the same AST and the same query
+# descriptor with both backends, or be rejected by both:
+#
+#   python -m 'essql.tests.compare_parsers' [--bench]
+#
+# The same check runs under pytest in test_parsers.
+#
+
+import io
+import os
+import sys
+import glob
+import time
+import contextlib
+
+from essql.composer import ComposerParser
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+ACCEPTED = [
+    "SELECT x",
+    "select X, Y AS b, z c FROM t",
+    "SELECT * FROM \"test-index\"",
+    "SELECT x FROM a, \"b-2\" AS bb, c cc",
+    "SELECT log.level.descr, \"Mixed Case\".Sub FROM t",
+    "SELECT fun1(x) AS fun_x, y, sum(x) AS SUM FROM \"test-index\" WHERE QUERYSTRING `  x:>1000  AND  log.level.descr:3  ` GROUP BY x,y HAVING SUM(z) > 100 ORDER BY x, y DESC LIMIT 10000",
+    "SELECT count(*), max(x), min(y), avg(z) FROM t GROUP BY a.keyword",
+    "SELECT f(), g(1, 'two', 3.5, TRUE, FALSE, NULL), h(i(j(k)))",
+    "SELECT -x, +x, ~x, - - x, -5, x-5, x - -5, x--5\n, 1",
+    "SELECT 1.5e3, 1e3, .5, 1., 42, 'it''s', \"q\"\"uote\"",
+    "SELECT a || b * c - d / e % f + g << 1 >> 2 & 3 | 4",
+    "SELECT x FROM t WHERE a < 1 AND b <= 2 OR c > 3 AND d >= 4",
+    "SELECT x FROM t WHERE a = 1 OR b == 2 AND c != 3 OR d <> 4",
+    "SELECT x FROM t WHERE NOT a = 1 AND NOT NOT b",
+    "SELECT x FROM t WHERE x IN (1, 2, 3) AND y NOT IN ('a') OR z IN ((1+2), f(3))",
+    "SELECT x FROM t WHERE x BETWEEN 1 AND 2 AND y NOT BETWEEN a + 1 AND b * 2",
+    "SELECT x FROM t WHERE x IS NULL AND y IS NOT NULL OR z ISNULL OR w NOTNULL OR v NOT NULL",
+    "SELECT x FROM t WHERE x LIKE 'a%' AND y NOT LIKE 'b' AND z GLOB 'c*' AND w NOT REGEXP 'd' AND v MATCH 'e'",
+    "SELECT x FROM t WHERE `a:1` AND QUERYSTRING `b:\\`2\\``",
+    "SELECT x FROM t WHERE ((a + 1) * (b - 2)) / 3 > (c)",
+    "SELECT x FROM t WHERE a = b = c AND a < b = c",
+    "SELECT x -- comment\nFROM t -- another one\nWHERE a = 1",
+    "SELECT x FROM t ORDER BY x ASC, y DESC, z LIMIT 10",
+    "SELECT x FROM t ORDER BY x + 1 LIMIT 1 + 2",
+    "SELECT @timestamp, x_1 FROM t",
+    "SELECT \"select\" FROM \"from\"",
+    "SELECT x AS \"Alias With Space\" FROM t",
+    "SELECT x + ?, :Lim * 2 AS y FROM t WHERE QUERYSTRING ? LIMIT :lim",
+    "SELECT x FROM t WHERE a = :\"Quoted Name\" AND b IN (?, ?) OR c BETWEEN ? AND :hi",
+    "SELECT f(?, :a) FROM t ORDER BY x LIMIT ?",
+    "SELECT x GROUP BY x HAVING sum(x) > ?",
+    "SELECT x FROM t WHERE NOT a ISNULL AND b OR NOT c IN (1) OR NOT d BETWEEN 1 AND 2",
+]
+
+# Rejected by the parser or by the composer
+REJECTED = [
+    "SELECT",
+    "SELECT x FROM",
+    "SELECT x FROM t WHERE",
+    "SELECT select",
+    "SELECT x WHERE x IN y",
+    "SELECT x WHERE x = NOT y",
+    "SELECT x WHERE x ISNULL + 1",
+    "SELECT x WHERE x NOT",
+    "SELECT x AS",
+    "SELECT f(* 2)",
+    "SELECT x HAVING y > 1",
+    "SELECT x WHERE 'unterminated",
+    "SELECT a.b(1)",
+    "SELECT x LIMIT 1 ORDER BY x",
+    "SELECT x FROM t GROUP BY x + 1",
+    "SELECT x $",
+    "SELECT :select",
+    "SELECT : x",
+    "SELECT x FROM t WHERE NOT a ISNULL * 2",
+    "SELECT x FROM t WHERE NOT 's' IN (1) & y",
+    "SELECT x FROM t WHERE NOT a = 1 + NOT b",
+]
+
+CORPUS = ACCEPTED + REJECTED
+
+def load_corpus():
+    corpus = list(CORPUS)
+    examples = os.path.join(os.path.dirname(__file__), '..', '..', 'examples', '*.txt')
+    for name in sorted(glob.glob(examples)):
+        with open(name) as f:
+            corpus.append(f.read())
+    return corpus
+
+def run(parser, sql):
+    try:
+        tree = parser.parse(sql)
+    except Exception as e:
+        return ('error', type(e).__name__)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            query_descriptor = tree.composeQuery()
+        except Exception as e:
+            query_descriptor = ('error', type(e).__name__)
+
+    return (tree.toString(), query_descriptor)
+
+def same_result(r1, r2):
+    # Error messages differ between backends, only agreement matters
+    if 'error' in (r1[0], r2[0]):
+        return (r1[0] == 'error') == (r2[0] == 'error')
+    return r1 == r2
+
+def compare(corpus):
+
+    reference = ComposerParser(backend='pyparsing')
+    candidate = ComposerParser(backend='pratt')
+
+    failures = 0
+
+    for sql in corpus:
+        r1 = run(reference, sql)
+        r2 = run(candidate, sql)
+
+        if not same_result(r1, r2):
+            failures += 1
+            print("MISMATCH: %r" % (sql))
+            print("  pyparsing: %r" % (r1,))
+            print("  pratt    : %r" % (r2,))
+
+    print("%d statements, %d mismatches" % (len(corpus), failures))
+
+    return failures
+
+def bench(corpus, min_time=0.5):
+
+    valid = []
+    for sql in corpus:
+        try:
+            ComposerParser(backend='pratt').parse(sql)
+            valid.append(sql)
+        except Exception:
+            pass
+
+    for backend in ('pyparsing', 'pratt'):
+        parser = ComposerParser(backend=backend)
+
+        n  = 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < min_time:
+            for sql in valid:
+                parser.parse(sql)
+            n += len(valid)
+        elapsed = time.perf_counter() - t0
+
+        print("%-10s %10.1f us/statement" % (backend, elapsed / n * 1e6))
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+if __name__ == "__main__":
+
+    corpus = load_corpus()
+
+    failures = compare(corpus)
+
+    if '--bench' in sys.argv[1:]:
+        bench(corpus)
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,80 @@
+
+#
+# Arrow tables and pandas DataFrames from Executor and AsyncExecutor, on
+# MemoryTransport (needs pyarrow, pandas for to_pandas).
+#
+#   python -m pytest essql/tests/test_arrow.py
+#
+
+import asyncio
+
+import pytest
+
+from essql.memory import MemoryTransport
+from essql.composer import ComposerParser
+from essql.execution import Executor
+from essql.async_execution import AsyncExecutor
+from essql.tests.test_execution import MemorySession
+
+pa = pytest.importorskip('pyarrow')
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+STATEMENTS = [
+    "SELECT x, y, host, x * 2 AS x2 FROM t ORDER BY x LIMIT 300",
+    "SELECT host, count(*) AS n, sum(y) AS total FROM t GROUP BY host",
+    "SELECT x FROM t WHERE x < 0",
+]
+
+@pytest.fixture(scope='module')
+def transport():
+    transport = MemoryTransport()
+    transport.bulk('t', [ dict({ 'x': i, 'host': 'web-%d' % (i % 4) }, **({ 'y': i * 0.5 } if i % 3 else {})) for i in range(300) ])
+    return transport
+
+def _executors(transport, sql, **kwargs):
+
+    qd = ComposerParser().parse(sql).composeQuery()
+
+    return (
+        Executor('memory://', qd, transport=transport, page_size=50, **kwargs),
+        AsyncExecutor('memory://', qd, session=MemorySession(transport), page_size=50, **kwargs),
+    )
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+@pytest.mark.parametrize('sql', STATEMENTS)
+@pytest.mark.parametrize('mapping', [ False, True ])
+def test_execute_arrow(transport, sql, mapping):
+
+    executor, async_executor = _executors(transport, sql)
+
+    table = executor.execute_arrow(mapping)
+
+    assert _run(async_executor.execute_arrow(mapping)).equals(table)
+    assert table.to_pylist() == [ dict(zip(table.column_names, row)) for row in executor.execute()[1:] ]
+
+@pytest.mark.parametrize('vectorize', [ False, True ])
+def test_iter_arrow(transport, vectorize):
+
+    executor, async_executor = _executors(transport, STATEMENTS[0], vectorize=vectorize)
+
+    async def batches():
+        return [ batch async for batch in async_executor.iter_arrow() ]
+
+    expected = list(executor.iter_arrow())
+
+    assert [ batch.num_rows for batch in expected ] == [ 50 ] * 6
+    assert pa.Table.from_batches(_run(batches())).equals(pa.Table.from_batches(expected))
+    assert async_executor.stats.rows == 300
+
+def test_to_pandas(transport):
+
+    pytest.importorskip('pandas')
+
+    executor, async_executor = _executors(transport, STATEMENTS[1])
+
+    assert _run(async_executor.to_pandas(mapping=True)).equals(executor.to_pandas(mapping=True))
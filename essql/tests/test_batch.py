@@ -0,0 +1,115 @@
+
+#
+# execute_many on MemoryTransport: failures isolated per statement, pages
+# over several _msearch rounds, _msearch headers.
+#
+#   python -m pytest essql/tests/test_batch.py
+#
+
+import json
+
+import pytest
+
+from essql.memory import MemoryTransport
+from essql.composer import ComposerParser
+from essql.execution import Executor, ExecutionError, execute_many
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+class RecordingTransport(MemoryTransport):
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def request(self, method, uri, body=None):
+        self.requests.append((method, uri, body))
+        return super().request(method, uri, body)
+
+    def msearch_headers(self):
+
+        # Header lines of every _msearch request
+        rounds = []
+        for method, uri, body in self.requests:
+            if uri.endswith('/_msearch'):
+                lines = [ json.loads(line) for line in body.decode('utf-8').splitlines() ]
+                rounds.append(lines[0::2])
+
+        return rounds
+
+@pytest.fixture
+def transport():
+    transport = RecordingTransport()
+    transport.bulk('t', [ { 'x': i, 'g': 'g%02d' % (i % 9) } for i in range(100) ])
+    return transport
+
+def _expected(transport, sql, **kwargs):
+    qd = ComposerParser().parse(sql).composeQuery()
+    return Executor('memory://', qd, transport=transport, **kwargs).execute()
+
+def test_failures_are_isolated(transport):
+
+    statements = [
+        "SELECT x FROM t ORDER BY x LIMIT 5",
+        "SELECT FROM WHERE",
+        "SELECT x FROM missing",
+        "SELECT g, count(*) AS n FROM t GROUP BY g",
+    ]
+
+    results = execute_many('memory://', statements, transport=transport)
+
+    assert results[0] == _expected(transport, statements[0])
+    assert isinstance(results[1], Exception)
+    assert isinstance(results[2], ExecutionError) and results[2].status == 404
+    assert results[3] == _expected(transport, statements[3])
+
+    # Only the valid statements go in the one _msearch request
+    assert len(transport.msearch_headers()[0]) == 3
+
+def test_several_rounds(transport):
+
+    statements = [
+        "SELECT x FROM t ORDER BY x LIMIT 35",
+        "SELECT g, count(*) AS n, sum(x) AS s FROM t GROUP BY g",
+        "SELECT x FROM t WHERE x < 3 ORDER BY x",
+    ]
+
+    results = execute_many('memory://', statements, transport=transport, page_size=10)
+
+    pit_requests = [ method for method, uri, _ in transport.requests if '/_pit' in uri ]
+
+    for statement, result in zip(statements, results):
+        assert result == _expected(transport, statement, page_size=10)
+
+    # First round: the point in time is opened, the other two searches
+    # are done (9 groups < page_size); then the 4 pages of the point in
+    # time
+    rounds = transport.msearch_headers()
+    assert [ len(headers) for headers in rounds ] == [ 2, 1, 1, 1, 1 ]
+
+    # Point in time searches carry no index, and are closed at the end
+    assert rounds[1] == [ {} ]
+    assert transport.pits == {}
+    assert pit_requests == [ 'POST', 'DELETE' ]
+
+def test_composite_pages(transport):
+
+    results = execute_many('memory://', [ "SELECT g, count(*) AS n FROM t GROUP BY g" ], transport=transport, page_size=2)
+
+    assert results[0] == _expected(transport, "SELECT g, count(*) AS n FROM t GROUP BY g", page_size=2)
+    assert len(transport.msearch_headers()) == 5
+
+def test_msearch_headers(transport):
+
+    execute_many('memory://', [ "SELECT g, count(*) FROM t GROUP BY g", "SELECT x FROM t" ], transport=transport)
+
+    headers = transport.msearch_headers()[0]
+
+    # request_cache goes to the header, filter_path only applies to the
+    # whole _msearch response and is dropped
+    assert headers[0] == { 'index': 't', 'request_cache': True }
+    assert headers[1] == { 'index': 't' }
+
+    assert all('filter_path' not in uri for _, uri, _ in transport.requests)
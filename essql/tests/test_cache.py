@@ -0,0 +1,190 @@
+
+#
+# Plan cache: on-disk tier (JSON) and misses on unreadable files. Result
+# cache: expiry, eviction, invalidation and keys, on MemoryTransport.
+#
+#   python -m pytest essql/tests/test_cache.py
+#
+
+import os
+
+import pytest
+
+from essql.cache import PlanCache, ResultCache
+from essql.memory import MemoryTransport
+from essql.execution import Executor
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+STATEMENTS = [
+    "SELECT x, count(*) FROM t GROUP BY x HAVING count(*) > 1",
+    "SELECT x FROM t WHERE x > ? AND y LIKE 'a%' LIMIT :n",
+    "SELECT x FROM t WHERE y NOT LIKE :p",
+]
+
+def test_disk_round_trip(tmp_path):
+
+    plans = [ PlanCache(path=str(tmp_path)).get_plan(sql) for sql in STATEMENTS ]
+
+    cache = PlanCache(path=str(tmp_path))
+
+    assert [ cache.get_plan(sql) for sql in STATEMENTS ] == plans
+    assert cache.info().disk_hits == len(STATEMENTS)
+
+    # Bind parameters survive the round trip
+    assert cache.prepare(STATEMENTS[1]).bind(3, n=5)['dsl']['query']['bool']['filter'][0] == { 'range': { 'x': { 'gt': 3 } } }
+    assert cache.prepare(STATEMENTS[2]).bind(p='a%')['dsl']['query']['bool']['filter'][0]['bool']['must_not'] == [ { 'prefix': { 'y': 'a' } } ]
+
+def test_unreadable_files_are_misses(tmp_path):
+
+    plan = PlanCache(path=str(tmp_path)).get_plan(STATEMENTS[0])
+
+    for file_name in os.listdir(str(tmp_path)):
+        with open(os.path.join(str(tmp_path), file_name), 'w') as f:
+            f.write('{ not json')
+
+    cache = PlanCache(path=str(tmp_path))
+
+    assert cache.get_plan(STATEMENTS[0]) == plan
+    assert cache.info().misses == 1
+
+#----------------------------------------------------------------------#
+# Result cache                                                         #
+#----------------------------------------------------------------------#
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class CountingTransport(MemoryTransport):
+
+    def __init__(self):
+        super().__init__()
+        self.searches = 0
+
+    def request(self, method, uri, body=None):
+        if '_search' in uri:
+            self.searches += 1
+        return super().request(method, uri, body)
+
+@pytest.fixture
+def transport():
+    transport = CountingTransport()
+    transport.bulk('logs', [ { 'x': i } for i in range(10) ])
+    return transport
+
+def _executor(transport, sql, result_cache, *args, **kwargs):
+    query_descriptor = PlanCache().prepare(sql).bind(*args)
+    return Executor('memory://', query_descriptor, transport=transport, result_cache=result_cache, **kwargs)
+
+def test_ttl(transport):
+
+    clock = Clock()
+    cache = ResultCache(ttl=10, clock=clock)
+
+    rows = _executor(transport, "SELECT x FROM logs ORDER BY x", cache).execute()
+
+    clock.now = 9.9
+    assert _executor(transport, "SELECT x FROM logs ORDER BY x", cache).execute() == rows
+    assert transport.searches == 1
+
+    clock.now = 10.0
+    assert _executor(transport, "SELECT x FROM logs ORDER BY x", cache).execute() == rows
+    assert transport.searches == 2
+
+    assert cache.info()[:2] == (1, 2)
+
+def test_cache_ttl_per_executor(transport):
+
+    clock = Clock()
+    cache = ResultCache(ttl=10, clock=clock)
+
+    _executor(transport, "SELECT x FROM logs", cache, cache_ttl=60).execute()
+    _executor(transport, "SELECT x FROM logs LIMIT 3", cache).execute()
+
+    clock.now = 30
+
+    _executor(transport, "SELECT x FROM logs", cache).execute()
+    _executor(transport, "SELECT x FROM logs LIMIT 3", cache).execute()
+    assert transport.searches == 3
+
+    # 0 never caches
+    _executor(transport, "SELECT x FROM logs LIMIT 4", cache, cache_ttl=0).execute()
+    _executor(transport, "SELECT x FROM logs LIMIT 4", cache, cache_ttl=0).execute()
+    assert transport.searches == 5
+
+def test_lru_eviction():
+
+    rows  = [ [ 'x' ] ] + [ [ i ] for i in range(100) ]
+    cache = ResultCache()
+
+    cache.put('a', rows, [ 't' ])
+    size = cache.info().currbytes
+
+    cache = ResultCache(max_bytes=size * 3)
+    for key in 'abc':
+        cache.put(key, rows, [ 't' ])
+
+    # 'a' used last, 'b' is the least recently used
+    assert cache.get('a') is not None
+    cache.put('d', rows, [ 't' ])
+
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in 'acd')
+    assert cache.info().evictions == 1
+    assert cache.info().currbytes == size * 3
+
+    # Bigger than the whole cache: not kept, nothing evicted
+    cache.put('e', rows * 4, [ 't' ])
+    assert cache.get('e') is None
+    assert cache.info().currsize == 3
+
+@pytest.mark.parametrize('index, invalidated', [
+    ('logs-1'  , [ 'logs-1', 'logs-*', '*' ]),
+    ('logs-*'  , [ 'logs-1', 'logs-*', '*' ]),
+    ('logs-2'  , [ 'logs-*', '*' ]),
+    ('metrics' , [ 'metrics', '*' ]),
+    (None      , [ 'logs-1', 'logs-*', 'metrics', '*' ]),
+])
+def test_invalidate(index, invalidated):
+
+    cache = ResultCache()
+
+    patterns = [ 'logs-1', 'logs-*', 'metrics', '*' ]
+    for pattern in patterns:
+        cache.put(pattern, [ [ 'x' ] ], [ pattern ])
+
+    assert cache.invalidate(index) == len(invalidated)
+    assert [ pattern for pattern in patterns if cache.get(pattern) is None ] == invalidated
+
+def test_key_bound_parameters(transport):
+
+    cache = ResultCache()
+    sql   = "SELECT x FROM logs WHERE x < ? ORDER BY x"
+
+    assert _executor(transport, sql, cache, 3).execute() == [ [ 'x' ], [ 0 ], [ 1 ], [ 2 ] ]
+    assert _executor(transport, sql, cache, 2).execute() == [ [ 'x' ], [ 0 ], [ 1 ] ]
+    assert _executor(transport, sql, cache, 3).execute() == [ [ 'x' ], [ 0 ], [ 1 ], [ 2 ] ]
+
+    assert transport.searches == 2
+    assert cache.info().currsize == 2
+
+def test_rows_are_copies(transport):
+
+    cache = ResultCache()
+
+    rows = _executor(transport, "SELECT x FROM logs ORDER BY x", cache).execute()
+    rows[1][0] = 'changed'
+    rows.append([ 'added' ])
+
+    again = _executor(transport, "SELECT x FROM logs ORDER BY x", cache).execute()
+    again[2][0] = 'changed'
+
+    assert _executor(transport, "SELECT x FROM logs ORDER BY x", cache).execute() == [ [ 'x' ] ] + [ [ i ] for i in range(10) ]
+    assert transport.searches == 1
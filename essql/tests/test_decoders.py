@@ -0,0 +1,46 @@
+
+#
+# Response formats: JSON and CBOR bodies decode to the same results.
+#
+#   python -m pytest essql/tests/test_decoders.py
+#
+
+import json
+
+import pytest
+
+from essql.decoders import wire_decoder
+from essql.execution import decode_response
+from essql.transport import Transport
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+RESPONSE = {
+    'hits': { 'hits': [ { '_id': str(i), '_source': { 'x': i, 'host': 'web-%d' % (i), 'y': i / 2 } } for i in range(100) ] },
+    'aggregations': { '_group_by': { 'after_key': { 'host': 'b' }, 'buckets': [ { 'key': { 'host': 'a' }, 'doc_count': 3 } ] } },
+}
+
+def test_json():
+
+    content = json.dumps(RESPONSE).encode('utf-8')
+
+    assert wire_decoder(content) is None
+    assert decode_response('memory://t/_search', 200, content) == RESPONSE
+
+def test_cbor():
+
+    cbor2 = pytest.importorskip('cbor2')
+
+    content = cbor2.dumps(RESPONSE)
+
+    assert wire_decoder(content).name == 'cbor'
+    assert decode_response('memory://t/_search', 200, content) == RESPONSE
+
+def test_wire_formats():
+
+    assert Transport(wire_format='cbor').wire_format == 'cbor'
+
+    with pytest.raises(ValueError):
+        Transport(wire_format='smile')
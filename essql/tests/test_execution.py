@@ -0,0 +1,162 @@
+
+#
+# Executor and AsyncExecutor on MemoryTransport: cleanup of point in
+# time searches, GROUP BY pages, same results from both executors.
+#
+#   python -m pytest essql/tests/test_execution.py
+#
+
+import asyncio
+
+import pytest
+
+from essql.memory import MemoryTransport
+from essql.composer import ComposerParser
+from essql.execution import Executor, _BucketColumns
+from essql.async_execution import AsyncExecutor
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+class FailingClose(MemoryTransport):
+
+    # DELETE _pit fails, so does a search_after page when failing_search
+    failing_search = False
+
+    def request(self, method, uri, body=None):
+        if method == 'DELETE':
+            raise ConnectionError('connection lost')
+        if self.failing_search and body and body.get('search_after'):
+            raise RuntimeError('search failed')
+        return super().request(method, uri, body)
+
+def _executor(transport):
+    qd = ComposerParser().parse("SELECT x FROM t LIMIT 50").composeQuery()
+    return Executor('memory://', qd, transport=transport, page_size=10)
+
+def _transport():
+    transport = FailingClose()
+    transport.bulk('t', [ { 'x': i } for i in range(50) ])
+    return transport
+
+def test_failed_close_is_ignored():
+
+    rows = _executor(_transport()).execute_iter()
+    next(rows)
+    next(rows)
+
+    # generator.close() runs the PIT close
+    rows.close()
+
+def test_failed_close_keeps_the_error():
+
+    transport = _transport()
+    transport.failing_search = True
+
+    with pytest.raises(RuntimeError, match='search failed'):
+        _executor(transport).execute()
+
+#----------------------------------------------------------------------#
+# GROUP BY                                                             #
+#----------------------------------------------------------------------#
+
+GROUP_BY = [
+    "SELECT h, count(*) AS n, sum(x) / count(*) AS mean, max(x) - min(x) AS spread FROM t GROUP BY h",
+    "SELECT h, g, count(*) * 2 AS n2, sum(x) AS s FROM t GROUP BY h, g HAVING sum(x) > 100 LIMIT 9",
+    "SELECT h, g, count(*) * 2 AS n2, sum(x) AS s FROM t GROUP BY h, g HAVING count(*) > 2",
+]
+
+@pytest.mark.parametrize('sql', GROUP_BY)
+@pytest.mark.parametrize('page_size', [ 4, 1000 ])
+def test_group_by_vectorized(sql, page_size):
+
+    transport = MemoryTransport()
+    transport.bulk('t', [ { 'x': i, 'h': 'h%d' % (i % 7), 'g': i % 3 } for i in range(120) ])
+
+    qd = ComposerParser().parse(sql).composeQuery()
+
+    rows       = Executor('memory://', qd, transport=transport, page_size=page_size).execute()
+    vectorized = Executor('memory://', qd, transport=transport, page_size=page_size, vectorize=True).execute()
+
+    assert vectorized == rows
+    assert len(rows) > 1
+
+def test_group_by_pages_are_columns():
+
+    transport = _transport()
+    qd = ComposerParser().parse("SELECT x, count(*) FROM t GROUP BY x").composeQuery()
+
+    executor = Executor('memory://', qd, transport=transport, page_size=10)
+    pages = list(executor._iter_cursor(executor._cursor(qd)))
+
+    assert [ len(page) for page in pages ] == [ 10 ] * 5
+    assert all(isinstance(page, _BucketColumns) for page in pages)
+    assert pages[1].field_values(('x',)) == list(range(10, 20))
+    assert pages[1].field_values(('_stats', 'count(*)')) == [ 1 ] * 10
+
+#----------------------------------------------------------------------#
+# asyncio                                                              #
+#----------------------------------------------------------------------#
+
+class MemorySession(object):
+
+    # The part of aiohttp.ClientSession used by AsyncExecutor
+    def __init__(self, transport):
+        self.transport = transport
+
+    def request(self, method, uri, json=None):
+        return _MemoryResponse(*self.transport.request(method, uri, json))
+
+class _MemoryResponse(object):
+
+    def __init__(self, status, content):
+        self.status  = status
+        self.content = content
+
+    async def read(self):
+        return self.content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_async_executor_rows():
+
+    transport = _transport()
+    qd = ComposerParser().parse("SELECT x, x * 2 AS y FROM t ORDER BY x LIMIT 50").composeQuery()
+
+    expected = Executor('memory://', qd, transport=transport, page_size=10).execute()
+
+    async def rows():
+        return await AsyncExecutor('memory://', qd, session=MemorySession(transport), page_size=10).execute()
+
+    assert _run(rows()) == expected
+    assert len(expected) == 51
+
+def test_async_executor_is_not_an_executor():
+
+    # Coroutines don't substitute for the methods of Executor
+    assert not issubclass(AsyncExecutor, Executor)
+    assert not hasattr(AsyncExecutor, 'export')
+
+def test_async_executor_resultset():
+
+    transport = _transport()
+    qd = ComposerParser().parse("SELECT x, x * 2 AS y FROM t ORDER BY x LIMIT 50").composeQuery()
+
+    expected = Executor('memory://', qd, transport=transport, page_size=10).execute_resultset(intern=False)
+
+    async def resultset():
+        return await AsyncExecutor('memory://', qd, session=MemorySession(transport), page_size=10).execute_resultset(intern=False)
+
+    results = _run(resultset())
+
+    assert results.to_rows() == expected.to_rows()
+    assert results.intern is False
+    assert len(results) == 50
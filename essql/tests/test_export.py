@@ -0,0 +1,116 @@
+
+#
+# Executor.export on MemoryTransport: ordered and unordered slices, LIMIT,
+# errors of a slice, early close.
+#
+#   python -m pytest essql/tests/test_export.py
+#
+
+import threading
+
+import pytest
+
+from essql.memory import MemoryTransport
+from essql.composer import ComposerParser
+from essql.execution import Executor
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+N = 500
+
+class SliceTransport(MemoryTransport):
+
+    # The pages of slice failing_slice after the first one fail
+    failing_slice = None
+
+    def request(self, method, uri, body=None):
+        slice_obj = body.get('slice') if isinstance(body, dict) else None
+        if slice_obj is not None and body.get('search_after') and slice_obj['id'] == self.failing_slice:
+            raise RuntimeError('slice %d failed' % (self.failing_slice))
+        return super().request(method, uri, body)
+
+@pytest.fixture
+def transport():
+    transport = SliceTransport()
+    transport.bulk('t', [ { 'x': (i * 7919) % N, 'g': i % 3 } for i in range(N) ])
+    return transport
+
+def _executor(transport, sql):
+    qd = ComposerParser().parse(sql).composeQuery()
+    return Executor('memory://', qd, transport=transport, page_size=20)
+
+def _export(transport, sql, **kwargs):
+    return list(_executor(transport, sql).export(**kwargs))
+
+def test_unordered(transport):
+
+    rows = _export(transport, "SELECT x, g FROM t", slices=4)
+
+    assert rows[0] == [ 'x', 'g' ]
+    assert sorted(rows[1:]) == sorted([ (i * 7919) % N, i % 3 ] for i in range(N))
+    assert transport.pits == {}
+
+@pytest.mark.parametrize('order', [ 'x', 'x DESC', 'g DESC, x' ])
+def test_ordered(transport, order):
+
+    sql = "SELECT x, g FROM t ORDER BY %s" % (order)
+
+    rows = _export(transport, sql, slices=4, ordered=True)
+
+    expected = sorted(rows[1:], key=lambda row: {
+        'x'        : (row[0], ),
+        'x DESC'   : (-row[0], ),
+        'g DESC, x': (-row[1], row[0]),
+    }[order])
+
+    assert len(rows) == N + 1
+    assert rows[1:] == expected
+
+    # Same as one point in time
+    assert rows == _executor(transport, sql + " LIMIT %d" % (N)).execute()
+
+@pytest.mark.parametrize('ordered', [ False, True ])
+def test_limit_across_slices(transport, ordered):
+
+    rows = _export(transport, "SELECT x FROM t ORDER BY x DESC LIMIT 55", slices=4, ordered=ordered)
+
+    assert len(rows) == 56
+    if ordered:
+        assert rows[1:] == [ [ x ] for x in range(N - 1, N - 56, -1) ]
+
+@pytest.mark.parametrize('ordered', [ False, True ])
+def test_failing_slice(transport, ordered):
+
+    transport.failing_slice = 2
+
+    threads = threading.active_count()
+
+    with pytest.raises(RuntimeError, match='slice 2 failed'):
+        _export(transport, "SELECT x FROM t ORDER BY x", slices=4, ordered=ordered)
+
+    assert threading.active_count() == threads
+    assert transport.pits == {}
+
+def test_early_close(transport):
+
+    threads = threading.active_count()
+
+    rows = _executor(transport, "SELECT x FROM t").export(slices=4, queue_size=1)
+
+    assert next(rows) == [ 'x' ]
+    next(rows)
+
+    # The slices are blocked on their full queues
+    assert threading.active_count() > threads
+
+    rows.close()
+
+    assert threading.active_count() == threads
+    assert transport.pits == {}
+
+def test_group_by_rejected(transport):
+
+    with pytest.raises(Exception, match="can't be exported"):
+        _export(transport, "SELECT g, count(*) FROM t GROUP BY g")
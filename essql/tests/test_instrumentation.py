@@ -0,0 +1,118 @@
+
+#
+# Instrumentation: listener events and Executor.stats, on MemoryTransport.
+#
+#   python -m pytest essql/tests/test_instrumentation.py
+#
+
+import pytest
+
+from essql import instrumentation
+from essql.memory import MemoryTransport
+from essql.cache import ResultCache
+from essql.composer import ComposerParser
+from essql.execution import Executor, execute_many
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+QUERY_KEYS = set([ 'indexes', 'requests', 'bytes', 'rows', 'http', 'decode', 'rows_time', 'cached' ])
+
+class RecordingTransport(MemoryTransport):
+
+    def __init__(self):
+        super().__init__()
+        self.sizes = []
+
+    def request(self, method, uri, body=None):
+        status, content = super().request(method, uri, body)
+        self.sizes.append(len(content))
+        return status, content
+
+@pytest.fixture
+def transport():
+    transport = RecordingTransport()
+    transport.bulk('t', [ { 'x': i, 'g': i % 4 } for i in range(25) ])
+    return transport
+
+@pytest.fixture
+def events():
+
+    events = []
+    listener = lambda event, data: events.append((event, data))
+
+    instrumentation.add_listener(listener)
+    yield events
+    instrumentation.remove_listener(listener)
+
+def _executor(transport, sql, **kwargs):
+    return Executor('memory://', ComposerParser().parse(sql).composeQuery(), transport=transport, **kwargs)
+
+def test_events(transport, events):
+
+    rows = _executor(transport, "SELECT x FROM t ORDER BY x LIMIT 100", page_size=10).execute()
+
+    assert [ event for event, _ in events ] == [ 'parse', 'compose', 'query' ]
+
+    parse, compose, query = [ data for _, data in events ]
+
+    assert set(parse) == set([ 'elapsed', 'backend', 'sql_length' ])
+    assert parse['sql_length'] == len("SELECT x FROM t ORDER BY x LIMIT 100")
+
+    assert compose == { 'elapsed': compose['elapsed'], 'indexes': [ 't' ] }
+
+    assert set(query) == QUERY_KEYS
+    assert query['rows'] == len(rows) - 1 == 25
+    assert query['cached'] is False
+
+def test_batch_event(transport, events):
+
+    execute_many('memory://', [ "SELECT x FROM t LIMIT 100", "SELECT g, count(*) FROM t GROUP BY g" ], transport=transport)
+
+    batch = [ data for event, data in events if event == 'batch' ]
+
+    assert len(batch) == 1
+    assert set(batch[0]) == QUERY_KEYS | set([ 'statements' ])
+    assert batch[0]['statements'] == 2
+    assert batch[0]['indexes'] == [ 't', 't' ]
+    assert batch[0]['rows'] == 25 + 4
+    assert batch[0]['requests'] == len(transport.sizes)
+    assert batch[0]['bytes'] == sum(transport.sizes)
+
+def test_no_listener():
+
+    # Nothing is timed without a listener or debug logging
+    assert not instrumentation.enabled()
+
+@pytest.mark.parametrize('sql, rows', [
+    ("SELECT x FROM t ORDER BY x LIMIT 100", 25),
+    ("SELECT x FROM t ORDER BY x LIMIT 7", 7),
+    ("SELECT g, count(*) FROM t GROUP BY g", 4),
+])
+def test_stats(transport, sql, rows):
+
+    executor = _executor(transport, sql, page_size=3)
+    executor.execute()
+
+    stats = executor.stats
+
+    assert stats.requests == len(transport.sizes) > 1
+    assert stats.bytes == sum(transport.sizes)
+    assert stats.rows == rows
+    assert stats.cached is False
+
+def test_stats_cached(transport, events):
+
+    cache = ResultCache()
+
+    _executor(transport, "SELECT x FROM t LIMIT 100", result_cache=cache).execute()
+
+    executor = _executor(transport, "SELECT x FROM t LIMIT 100", result_cache=cache)
+    executor.execute()
+
+    assert executor.stats.cached is True
+    assert (executor.stats.requests, executor.stats.bytes, executor.stats.rows) == (0, 0, 25)
+
+    query = [ data for event, data in events if event == 'query' ]
+    assert [ data['cached'] for data in query ] == [ False, True ]
@@ -0,0 +1,133 @@
+
+#
+# MemoryTransport: point in time pages, composite pages and bucket_selector
+# scripts.
+#
+#   python -m pytest essql/tests/test_memory.py
+#
+
+import json
+
+import pytest
+
+from essql import memory
+from essql.memory import MemoryTransport
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+def _request(transport, method, path, body=None):
+
+    status, content = transport.request(method, 'memory://localhost/' + path, body)
+    assert status == 200, content
+
+    return json.loads(content)
+
+def _transport(n):
+
+    transport = MemoryTransport()
+    transport.bulk('t', [ dict({ 'x': i % 7, 'k': 'k%02d' % (i % 13) }, **({ 'y': i } if i % 5 else {})) for i in range(n) ])
+
+    return transport
+
+#----------------------------------------------------------------------#
+# Point in time                                                        #
+#----------------------------------------------------------------------#
+
+def _pit_ids(transport, sort, page_size, query=None):
+
+    pit_id = _request(transport, 'POST', 't/_pit?keep_alive=1m')['id']
+
+    ids = []
+    body = { 'size': page_size, 'sort': sort, 'pit': { 'id': pit_id }, 'query': query or { 'match_all': {} } }
+
+    while True:
+        hits = _request(transport, 'POST', '_search', body)['hits']['hits']
+        if not hits:
+            break
+        ids.extend(hit['_id'] for hit in hits)
+        body['search_after'] = hits[-1]['sort']
+
+    _request(transport, 'DELETE', '_pit', { 'id': pit_id })
+
+    return ids
+
+@pytest.mark.parametrize('sort', [
+    [ 'x' ],
+    [ { 'x': 'desc' } ],
+    [ { 'y': 'desc' }, 'x' ],
+    [ 'k', { 'y': { 'order': 'asc' } } ],
+])
+def test_pit_pages(sort):
+
+    transport = _transport(200)
+
+    # One page with all the documents gives the reference order
+    assert _pit_ids(transport, sort, 7) == _pit_ids(transport, sort, 1000)
+    assert len(_pit_ids(transport, sort, 7)) == 200
+
+def test_pit_pages_match_once(monkeypatch):
+
+    transport = _transport(200)
+
+    calls = []
+    matches = memory.matches
+    monkeypatch.setattr(memory, 'matches', lambda query, source: calls.append(1) or matches(query, source))
+
+    assert len(_pit_ids(transport, [ 'x' ], 10, { 'range': { 'x': { 'gte': 3 } } })) == len([ i for i in range(200) if i % 7 >= 3 ])
+
+    # The documents are matched for the first page only
+    assert len(calls) == 200
+
+    assert transport.pit_searches == {}
+
+#----------------------------------------------------------------------#
+# Composite                                                            #
+#----------------------------------------------------------------------#
+
+def _composite_body(size, after=None, having=None):
+
+    composite = { 'size': size, 'sources': [ { 'k': { 'terms': { 'field': 'k' } } } ] }
+    if after is not None:
+        composite['after'] = after
+
+    aggs = { 's': { 'sum': { 'field': 'y' } } }
+    if having is not None:
+        aggs['having'] = { 'bucket_selector': { 'buckets_path': { 's': 's' }, 'script': having } }
+
+    return { 'size': 0, 'aggs': { 'g': { 'composite': composite, 'aggs': aggs } } }
+
+def test_composite_page_sub_aggregations(monkeypatch):
+
+    transport = _transport(200)
+
+    calls = []
+    sub_aggregations = memory._sub_aggregations
+    monkeypatch.setattr(memory, '_sub_aggregations', lambda *args: calls.append(1) or sub_aggregations(*args))
+
+    results = _request(transport, 'POST', 't/_search', _composite_body(3, { 'k': 'k04' }))['aggregations']['g']
+
+    assert [ bucket['key']['k'] for bucket in results['buckets'] ] == [ 'k05', 'k06', 'k07' ]
+    assert results['after_key'] == { 'k': 'k07' }
+    assert len(calls) == 3
+
+def test_composite_after_key_of_filtered_page():
+
+    transport = _transport(200)
+
+    # No bucket of the first page is selected, the next page still comes
+    results = _request(transport, 'POST', 't/_search', _composite_body(3, having='params.s < 0'))['aggregations']['g']
+
+    assert results['buckets'] == []
+    assert results['after_key'] == { 'k': 'k02' }
+
+#----------------------------------------------------------------------#
+# bucket_selector scripts                                              #
+#----------------------------------------------------------------------#
+
+def test_painless_to_python():
+
+    script = "params.nullable != null && params.truecount > 0 || !false"
+
+    assert memory._painless_to_python(script).split() == [ 'params.nullable', '!=', 'None', 'and', 'params.truecount', '>', '0', 'or', 'not', 'False' ]
@@ -0,0 +1,47 @@
+
+#
+# Differential check between the pyparsing and the Pratt parser backends,
+# on the corpus of compare_parsers and the examples.
+#
+#   python -m pytest essql/tests/test_parsers.py
+#
+
+import pytest
+
+from essql.composer import ComposerParser
+from essql.tests.compare_parsers import ACCEPTED, REJECTED, load_corpus, run, same_result
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+BACKENDS = ('pyparsing', 'pratt')
+
+@pytest.fixture(scope='module')
+def parsers():
+    return { backend: ComposerParser(backend=backend) for backend in BACKENDS }
+
+@pytest.mark.parametrize('sql', load_corpus())
+def test_same_result(parsers, sql):
+
+    r1, r2 = [ run(parsers[backend], sql) for backend in BACKENDS ]
+
+    assert same_result(r1, r2), (r1, r2)
+
+@pytest.mark.parametrize('sql', ACCEPTED)
+def test_accepted(parsers, sql):
+
+    # Parsed; some WHERE expressions are not translated to the DSL
+    for backend in BACKENDS:
+        tree, query_descriptor = run(parsers[backend], sql)
+
+        assert tree != 'error', (backend, query_descriptor)
+
+@pytest.mark.parametrize('sql', REJECTED)
+def test_rejected(parsers, sql):
+
+    # At parse or compose time
+    for backend in BACKENDS:
+        tree, query_descriptor = run(parsers[backend], sql)
+
+        assert tree == 'error' or isinstance(query_descriptor, tuple), backend
@@ -0,0 +1,58 @@
+
+#
+# Generated row projection: missing fields, errors per column, SELECT *,
+# field names that are not Python names.
+#
+#   python -m pytest essql/tests/test_projection.py
+#
+
+import pytest
+
+from essql.composer import ComposerParser, compile_projection, projection_source, python_name
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+def _project(sql, source, params=None):
+
+    qd = ComposerParser().parse(sql).composeQuery()
+
+    project = compile_projection(projection_source(qd['columns_processors']))
+
+    return project({ '_source': source }, params or {})
+
+def test_fields():
+    assert _project("SELECT x, a.b, a.c.d FROM t", { 'x': 1, 'a': { 'b': 2, 'c': { 'd': 3 } } }) == [ 1, 2, 3 ]
+
+def test_missing_fields():
+
+    assert _project("SELECT x, a.b, a.c.d, x + 1 FROM t", {}) == [ None, None, None, None ]
+    assert _project("SELECT a.b, a.c.d FROM t", { 'a': 5 }) == [ None, None ]
+
+def test_errors_per_column():
+
+    # Only the failing column is None
+    assert _project("SELECT x / y, x, x + 'a', y * 2 FROM t", { 'x': 1, 'y': 0 }) == [ None, 1, None, 0 ]
+
+def test_select_star():
+
+    source = { 'x': 1, 'a': { 'b': 2 } }
+
+    assert _project("SELECT *, x FROM t", source) == [ source, 1 ]
+
+@pytest.mark.parametrize('name', [ '"@timestamp"', '"my field"', '"class"', '"_x"', '"it\'s"', '"é"' ])
+def test_mangled_names(name):
+
+    key = name.strip('"')
+
+    assert python_name(key) != key or key.isidentifier()
+    assert _project("SELECT %s, %s * 2 FROM t" % (name, name), { key: 21 }) == [ 21, 42 ]
+
+@pytest.mark.parametrize('key', [ "it's", 'say "hi"', "x'] + str(1) + ['", 'back\\slash' ])
+def test_quoted_path_keys(key):
+
+    # Keys are Python literals in the generated source, never code
+    quoted = '"%s"' % (key.replace('"', '""'))
+
+    assert _project("SELECT a.b, a.%s FROM t" % (quoted), { 'a': { 'b': 1, key: 2 } }) == [ 1, 2 ]
@@ -0,0 +1,32 @@
+
+#
+# ResultSet: column storage, slices.
+#
+#   python -m pytest essql/tests/test_results.py
+#
+
+from essql.results import ResultSet
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+HEADER = [ 'n', 'x', 'host' ]
+ROWS   = [ [ i, i / 2, 'web-%d' % (i % 3) ] for i in range(100) ]
+
+def test_columns():
+
+    results = ResultSet.from_rows(HEADER, ROWS)
+
+    assert [ c['storage'] for c in results.memory_usage()['columns'] ] == [ 'array', 'array', 'dictionary' ]
+    assert results.to_rows() == [ HEADER ] + ROWS
+    assert results[5] == tuple(ROWS[5])
+
+def test_slices_keep_intern():
+
+    for intern, storage in ((True, 'dictionary'), (False, 'objects')):
+        results = ResultSet.from_rows(HEADER, ROWS, intern)[10:40]
+
+        assert results.intern == intern
+        assert results.memory_usage()['columns'][2]['storage'] == storage
+        assert [ list(row) for row in results ] == ROWS[10:40]
@@ -0,0 +1,58 @@
+
+#
+# Transport.encode_body: content types and gzip request bodies.
+#
+#   python -m pytest essql/tests/test_transport.py
+#
+
+import gzip
+import json
+
+import pytest
+
+from essql.transport import Transport
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+BODY = { 'query': { 'match_all': {} }, 'size': 1000 }
+
+NDJSON = b'{"index": "t"}\n{"size": 10}\n'
+
+def test_json_body():
+
+    data, headers = Transport().encode_body(BODY)
+
+    assert headers == { 'Content-Type': 'application/json' }
+    assert json.loads(data) == BODY
+
+def test_ndjson_body():
+
+    data, headers = Transport().encode_body(NDJSON)
+
+    assert headers == { 'Content-Type': 'application/x-ndjson' }
+    assert data is NDJSON
+
+def test_no_body():
+    assert Transport(compress_requests=True).encode_body(None) == (None, {})
+
+@pytest.mark.parametrize('body', [ BODY, NDJSON ])
+def test_gzip_above_min_size(body):
+
+    size = len(Transport().encode_body(body)[0])
+
+    # Not compressed unless enabled
+    data, headers = Transport(compress_min_size=0).encode_body(body)
+    assert 'Content-Encoding' not in headers
+
+    # Below the threshold
+    data, headers = Transport(compress_requests=True, compress_min_size=size + 1).encode_body(body)
+    assert 'Content-Encoding' not in headers
+    assert len(data) == size
+
+    # At the threshold
+    data, headers = Transport(compress_requests=True, compress_min_size=size).encode_body(body)
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Content-Type'] == Transport().encode_body(body)[1]['Content-Type']
+    assert gzip.decompress(data) == Transport().encode_body(body)[0]
@@ -0,0 +1,68 @@
+
+#
+# Vectorized evaluation: same values and types as the per-row projection.
+#
+#   python -m pytest essql/tests/test_vectorize.py
+#
+
+import pytest
+
+from essql.memory import MemoryTransport
+from essql.composer import ComposerParser
+from essql.execution import Executor
+
+pytest.importorskip('numpy')
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+COLUMNS = {
+    'mixed'    : [ 2 ** 53 + 1, 0.5, 3, 4, -7, 2.25, None, 10 ** 15 + 3 ] * 3,
+    'large_int': [ 2 ** 53 + 1, 2 ** 62, 2 ** 63 - 1, -2 ** 63, 2 ** 40 + 7, 1, 0, -3 ] * 3,
+    'huge_int' : [ 2 ** 64, 5, 6, 7, 8, 9, 10, 11 ] * 3,
+    'ints'     : [ 1, 2, 3, 0, -4, 5, 6, 7 ] * 3,
+    'floats'   : [ 0.5, 1.5, -2.0, 0.0, 3.25, 1e300, 2.0, 8.5 ] * 3,
+}
+
+EXPRESSIONS = [
+    "x + 0", "x * 2", "x - 1", "x / 2", "x % 3", "-x", "x > 3", "x = 3",
+    "x + y", "x * y", "abs(x)", "x * x * x", "x / y", "float(x)", "int(x)",
+]
+
+@pytest.fixture(scope='module')
+def transport():
+
+    transport = MemoryTransport()
+
+    for name, values in COLUMNS.items():
+        ys = [ 3, 0, 2.5, None, 1, 7, -2, 4 ] * 3
+        transport.bulk(name, [ dict({ 'x': x } if x is not None else {}, **({ 'y': y } if y is not None else {})) for x, y in zip(values, ys) ])
+
+    return transport
+
+def _typed(rows):
+    return [ [ (type(v), v) for v in row ] for row in rows ]
+
+@pytest.mark.parametrize('index', sorted(COLUMNS))
+def test_same_as_per_row(transport, index):
+
+    sql = "SELECT %s FROM %s LIMIT 100" % (', '.join('%s AS c%d' % (e, i) for i, e in enumerate(EXPRESSIONS)), index)
+
+    qd = ComposerParser().parse(sql).composeQuery()
+
+    rows       = Executor('memory://', qd, transport=transport).execute()
+    vectorized = Executor('memory://', qd, transport=transport, vectorize=True).execute()
+
+    assert _typed(vectorized) == _typed(rows)
+
+def test_mixed_column():
+
+    transport = MemoryTransport()
+    transport.bulk('t', [ { 'x': v } for v in [ 2 ** 53 + 1, 0.5, 3, 4 ] ])
+
+    qd = ComposerParser().parse("SELECT x + 0 AS a, x * 2 AS b FROM t LIMIT 20").composeQuery()
+
+    rows = Executor('memory://', qd, transport=transport, vectorize=True).execute()
+
+    assert _typed(rows[1:]) == _typed([ [ 2 ** 53 + 1, 2 ** 54 + 2 ], [ 0.5, 1.0 ], [ 3, 6 ], [ 4, 8 ] ])
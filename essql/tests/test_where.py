@@ -0,0 +1,188 @@
+
+#
+# WHERE conditions (README 2.11), composite GROUP BY and bind parameters,
+# executed on MemoryTransport.
+#
+#   python -m pytest essql/tests/test_where.py
+#
+
+import pytest
+
+from essql.memory import MemoryTransport
+from essql.composer import ComposerParser, BindParameter, _substitute
+from essql.execution import Executor
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+HOSTS = [ 'web-1', 'web-2', 'web-10', 'db-1', 'a*c', None ]
+
+DOCS = [
+    dict({ 'status': 200 + (i % 5) * 100, 'bytes': i * 10 }, **({ 'host': HOSTS[i % len(HOSTS)] } if HOSTS[i % len(HOSTS)] else {}))
+    for i in range(60)
+]
+
+@pytest.fixture(scope='module')
+def transport():
+    transport = MemoryTransport()
+    transport.bulk('logs', DOCS)
+    return transport
+
+def _plan(sql):
+    return ComposerParser().parse(sql).composeQuery()
+
+def _rows(transport, query_descriptor, **kwargs):
+    return Executor('memory://', query_descriptor, transport=transport, **kwargs).execute()[1:]
+
+def _kinds(obj):
+
+    # Query types used anywhere in a DSL query
+    kinds = set()
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            kinds.add(k)
+            kinds |= _kinds(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            kinds |= _kinds(v)
+
+    return kinds
+
+#----------------------------------------------------------------------#
+# SQL -> DSL                                                           #
+#----------------------------------------------------------------------#
+
+WHERE = [
+    ("status = 300"                     , 'term'    , lambda d: d['status'] == 300),
+    ("host IS 'db-1'"                   , 'term'    , lambda d: d.get('host') == 'db-1'),
+    ("status IN (200, 400)"             , 'terms'   , lambda d: d['status'] in (200, 400)),
+    ("status > 400"                     , 'range'   , lambda d: d['status'] > 400),
+    ("bytes BETWEEN 100 AND 250"        , 'range'   , lambda d: 100 <= d['bytes'] <= 250),
+    ("host LIKE 'web-%'"                , 'prefix'  , lambda d: d.get('host', '').startswith('web-')),
+    ("host LIKE 'web-_'"                , 'wildcard', lambda d: d.get('host') in ('web-1', 'web-2')),
+    ("host LIKE 'a*%'"                  , 'prefix'  , lambda d: d.get('host') == 'a*c'),
+    ("host LIKE 'a*_'"                  , 'wildcard', lambda d: d.get('host') == 'a*c'),
+    ("host GLOB 'web-1*'"               , 'wildcard', lambda d: d.get('host') in ('web-1', 'web-10')),
+    ("host REGEXP 'web-[0-9]'"          , 'regexp'  , lambda d: d.get('host') in ('web-1', 'web-2')),
+    ("host IS NULL"                     , 'exists'  , lambda d: 'host' not in d),
+    ("host IS NOT NULL"                 , 'exists'  , lambda d: 'host' in d),
+    ("status = 200 OR status = 600"     , 'should'  , lambda d: d['status'] in (200, 600)),
+    ("NOT status = 200"                 , 'must_not', lambda d: d['status'] != 200),
+    ("host <> 'db-1'"                   , 'must_not', lambda d: 'host' in d and d['host'] != 'db-1'),
+    ("host NOT IN ('db-1', 'web-1')"    , 'must_not', lambda d: 'host' in d and d['host'] not in ('db-1', 'web-1')),
+    ("host NOT LIKE 'web-%'"            , 'must_not', lambda d: 'host' in d and not d['host'].startswith('web-')),
+    ("bytes NOT BETWEEN 100 AND 500"    , 'must_not', lambda d: not 100 <= d['bytes'] <= 500),
+]
+
+@pytest.mark.parametrize('where, kind, predicate', WHERE)
+def test_where(transport, where, kind, predicate):
+
+    query_descriptor = _plan("SELECT bytes FROM logs WHERE %s LIMIT 100" % (where))
+
+    assert kind in _kinds(query_descriptor['dsl']['query'])
+
+    expected = sorted([ d['bytes'] ] for d in DOCS if predicate(d))
+
+    assert sorted(_rows(transport, query_descriptor)) == expected
+
+def test_and_is_filter():
+
+    dsl = _plan("SELECT bytes FROM logs WHERE status >= 500 AND host LIKE 'web-%'")['dsl']
+
+    assert dsl['query'] == { 'bool': { 'filter': [ { 'range': { 'status': { 'gte': 500 } } }, { 'prefix': { 'host': 'web-' } } ] } }
+
+def test_like_requires_a_string():
+
+    with pytest.raises(ValueError):
+        _plan("SELECT bytes FROM logs WHERE host LIKE 5")
+
+#----------------------------------------------------------------------#
+# GROUP BY                                                             #
+#----------------------------------------------------------------------#
+
+def _groups(predicate=lambda d: True):
+
+    # Documents without a host are in a null group, sorted first
+    groups = {}
+    for d in DOCS:
+        if predicate(d):
+            count, total = groups.get(d.get('host'), (0, 0))
+            groups[d.get('host')] = (count + 1, total + d['bytes'])
+
+    return [ [ host, count, total ] for host, (count, total) in sorted(groups.items(), key=lambda g: (g[0] is not None, g[0] or '')) ]
+
+@pytest.mark.parametrize('page_size', [ 2, 1000 ])
+def test_composite_group_by(transport, page_size):
+
+    query_descriptor = _plan("SELECT host, count(*) AS n, sum(bytes) AS total FROM logs GROUP BY host")
+
+    rows = _rows(transport, query_descriptor, page_size=page_size)
+
+    assert [ [ host, n, total ] for host, n, total in rows ] == _groups()
+
+@pytest.mark.parametrize('page_size', [ 2, 1000 ])
+def test_composite_having_limit(transport, page_size):
+
+    query_descriptor = _plan("SELECT host, count(*) AS n, sum(bytes) AS total FROM logs WHERE status < 600 GROUP BY host HAVING sum(bytes) > 3000 LIMIT 2")
+
+    expected = [ g for g in _groups(lambda d: d['status'] < 600) if g[2] > 3000 ][:2]
+
+    assert [ [ host, n, total ] for host, n, total in _rows(transport, query_descriptor, page_size=page_size) ] == expected
+
+#----------------------------------------------------------------------#
+# Bind parameters                                                      #
+#----------------------------------------------------------------------#
+
+def test_substitute():
+
+    obj = { 'a': [ BindParameter('?1'), { 'b': BindParameter(':x') } ], 'c': 1 }
+
+    assert _substitute(obj, { '?1': 5, ':x': 'y' }) == { 'a': [ 5, { 'b': 'y' } ], 'c': 1 }
+
+    # The placeholders are left in place
+    assert obj['a'][0] == BindParameter('?1')
+
+def test_bind():
+
+    statement = ComposerParser().prepare("SELECT bytes * ? AS b FROM logs WHERE status = :status LIMIT :n")
+
+    query_descriptor = statement.bind(2, status=300, n=3)
+
+    assert query_descriptor['dsl']['query'] == { 'bool': { 'filter': [ { 'term': { 'status': 300 } } ] } }
+    assert query_descriptor['dsl']['size'] == 3
+
+    with pytest.raises(ValueError):
+        statement.bind(status=300, n=3)
+    with pytest.raises(ValueError):
+        statement.bind(2, status=300)
+    with pytest.raises(ValueError):
+        statement.bind(2, status=300, n=3, other=1)
+
+def test_bind_rows(transport):
+
+    statement = ComposerParser().prepare("SELECT bytes * ? AS b FROM logs WHERE status = :status ORDER BY bytes LIMIT 100")
+
+    rows = _rows(transport, statement.bind(2, status=300))
+
+    assert rows == [ [ d['bytes'] * 2 ] for d in DOCS if d['status'] == 300 ]
+
+@pytest.mark.parametrize('pattern', [ 'web-%', 'web-_', 'db-1', 'a*_' ])
+def test_bind_like(transport, pattern):
+
+    statement = ComposerParser().prepare("SELECT bytes FROM logs WHERE host LIKE ? AND status > 0 LIMIT 100")
+    literal   = _plan("SELECT bytes FROM logs WHERE host LIKE '%s' AND status > 0 LIMIT 100" % (pattern))
+
+    query_descriptor = statement.bind(pattern)
+
+    assert query_descriptor['dsl'] == literal['dsl']
+    assert sorted(_rows(transport, query_descriptor)) == sorted(_rows(transport, literal))
+
+def test_bind_not_like(transport):
+
+    statement = ComposerParser().prepare("SELECT bytes FROM logs WHERE host NOT LIKE :p LIMIT 100")
+
+    assert sorted(_rows(transport, statement.bind(p='web-%'))) == sorted([ d['bytes'] ] for d in DOCS if 'host' in d and not d['host'].startswith('web-'))
+
+    with pytest.raises(ValueError):
+        statement.bind(p=1)
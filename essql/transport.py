@@ -0,0 +1,117 @@
+import gzip
+import json
+import threading
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+# Response formats, see decoders.wire_decoder
+WIRE_FORMATS = {
+    'json' : 'application/json',
+    'cbor' : 'application/cbor',
+}
+
+class Transport(object):
+
+    # One requests.Session: connections are kept alive and reused by every
+    # executor sharing the transport, up to pool_size per host.
+    def __init__(self, pool_size=10, compress_requests=False, compress_min_size=1024, timeout=None, headers=None, wire_format='json'):
+
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError("Unknown wire format: %s" % (wire_format))
+
+        self.pool_size         = pool_size
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        self.timeout           = timeout
+        self.headers           = headers or {}
+        self.wire_format       = wire_format
+
+        self._session = None
+        self._lock    = threading.Lock()
+
+    @property
+    def session(self):
+
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+
+        return self._session
+
+    def _create_session(self):
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('http://' , adapter)
+        session.mount('https://', adapter)
+
+        session.headers.update({
+            'Accept'         : WIRE_FORMATS[self.wire_format],
+            'Accept-Encoding': 'gzip',
+            'Connection'     : 'keep-alive',
+        })
+        session.headers.update(self.headers)
+
+        return session
+
+    def encode_body(self, body):
+
+        headers = {}
+
+        if body is None:
+            return None, headers
+
+        # Bytes are already encoded NDJSON (_msearch, _bulk)
+        if isinstance(body, bytes):
+            data = body
+            headers['Content-Type'] = 'application/x-ndjson'
+        else:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        # ES accepts gzip request bodies when http.compression is enabled
+        if self.compress_requests and len(data) >= self.compress_min_size:
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+
+        return data, headers
+
+    # (status, raw body) of the response, decompressed by requests
+    def request(self, method, uri, body=None):
+
+        data, headers = self.encode_body(body)
+
+        response = self.session.request(method, uri, data=data, headers=headers, timeout=self.timeout)
+
+        return response.status_code, response.content
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+#----------------------------------------------------------------------#
+# Shared transport                                                     #
+#----------------------------------------------------------------------#
+
+_default_transport = None
+_default_lock      = threading.Lock()
+
+def default_transport():
+
+    global _default_transport
+
+    if _default_transport is None:
+        with _default_lock:
+            if _default_transport is None:
+                _default_transport = Transport()
+
+    return _default_transport
@@ -0,0 +1,405 @@
+import ast
+
+from operator import methodcaller
+
+from .composer import python_name, projection_source, compile_projection
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+class NotVectorizable(Exception):
+    pass
+
+#----------------------------------------------------------------------#
+# Field extraction                                                     #
+#----------------------------------------------------------------------#
+
+def field_values(sources, path):
+
+    values = list(map(methodcaller('get', path[0]), sources))
+
+    for key in path[1:]:
+        values = [ v.get(key) if isinstance(v, dict) else None for v in values ]
+
+    return values
+
+def numeric_array(np, values):
+
+    # Only numeric fields are vectorized: bools, strings and objects keep
+    # their Python semantics through the per-row projection
+    types = set(map(type, values))
+
+    has_missing = type(None) in types
+    types.discard(type(None))
+
+    if not types or not types <= set([ int, float ]):
+        raise NotVectorizable(types)
+
+    dtype = float if float in types else 'int64'
+
+    # Mixed columns: the ints keep their Python results (exact above 2**53,
+    # int types) through the per-row projection, like the missing values
+    if int in types and float in types:
+        missing = np.fromiter((type(v) is not float for v in values), dtype=bool, count=len(values))
+        values  = [ v if type(v) is float else 0.0 for v in values ]
+    elif has_missing:
+        missing = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        values  = [ 0 if v is None else v for v in values ]
+    else:
+        missing = None
+
+    try:
+        array = np.array(values, dtype=dtype)
+    except OverflowError:
+        raise NotVectorizable(values)
+
+    return array, missing
+
+#----------------------------------------------------------------------#
+# Evaluation                                                           #
+#----------------------------------------------------------------------#
+
+# Results that may not fit in an int64 are checked against the float
+# computation, rows that would overflow go to the per-row projection
+INT_LIMIT = 2.0 ** 62
+
+def _or(np, *masks):
+
+    result = None
+
+    for m in masks:
+        if m is None:
+            continue
+        result = m if result is None else np.logical_or(result, m)
+
+    return result
+
+# Python < 3.9 wraps subscripts in ast.Index
+_INDEX = getattr(ast, 'Index', ())
+
+def _is_int(np, v):
+    return np.asarray(v).dtype.kind in 'iu'
+
+def _sign_overflow(np, v, invalid):
+    # -x and abs(x) of the smallest int64 don't fit in an int64
+    if _is_int(np, v):
+        invalid = _or(np, invalid, np.equal(v, np.iinfo('int64').min))
+    return invalid
+
+class _Evaluator(object):
+
+    def __init__(self, np, rows, params, symbols):
+        self.np      = np
+        self.params  = params
+        self.symbols = symbols
+        self.rows    = rows
+        self.size    = len(rows)
+        self.sources = None
+        self.values  = {}
+        self.arrays  = {}
+
+        self.BINARY = {
+            ast.Add     : np.add,
+            ast.Sub     : np.subtract,
+            ast.Mult    : np.multiply,
+            ast.Div     : np.true_divide,
+            ast.FloorDiv: np.floor_divide,
+            ast.Mod     : np.mod,
+            ast.Pow     : np.power,
+        }
+
+        self.COMPARE = {
+            ast.Eq   : np.equal,
+            ast.NotEq: np.not_equal,
+            ast.Lt   : np.less,
+            ast.LtE  : np.less_equal,
+            ast.Gt   : np.greater,
+            ast.GtE  : np.greater_equal,
+        }
+
+    def field(self, path):
+
+        if path not in self.values:
+            # Column tables (flattened aggregations) have their own
+            if hasattr(self.rows, 'field_values'):
+                self.values[path] = self.rows.field_values(path)
+            elif path[0] == '_stats':
+                self.values[path] = field_values(self.rows, ('stats', ) + path[1:])
+            else:
+                if self.sources is None:
+                    self.sources = [ row.get('_source', row) for row in self.rows ]
+                self.values[path] = field_values(self.sources, path)
+
+        return self.values[path]
+
+    def column(self, path):
+
+        if path not in self.arrays:
+            self.arrays[path] = numeric_array(self.np, self.field(path))
+
+        return self.arrays[path]
+
+    def field_path(self, node):
+
+        # <field>['key']['key']... or None
+        keys = []
+        while isinstance(node, ast.Subscript):
+            key = node.slice
+            if isinstance(key, _INDEX):
+                key = key.value
+            if not isinstance(key, ast.Constant) or not isinstance(key.value, str):
+                return None
+            keys.insert(0, key.value)
+            node = node.value
+
+        # _stats['sum(z)']['value']: the 'stats' of aggregation rows
+        if isinstance(node, ast.Name) and node.id == '_stats' and keys:
+            return tuple([ '_stats' ] + keys)
+
+        if not isinstance(node, ast.Name) or node.id not in self.symbols:
+            return None
+
+        return tuple([ self.symbols[node.id] ] + keys)
+
+    def evaluate(self, column_processor, arrays=False):
+        np = self.np
+
+        n    = self.size
+        tree = ast.parse(column_processor['expr_python'], mode='eval')
+
+        # Plain fields are copied as they are
+        path = self.field_path(tree.body)
+        if path is not None:
+            return list(self.field(path)), []
+
+        with np.errstate(all='ignore'):
+            values, invalid = self.eval(tree)
+
+            values = np.broadcast_to(values, (n, ))
+
+            if values.dtype.kind == 'f':
+                invalid = _or(np, invalid, np.logical_not(np.isfinite(values)))
+
+        if invalid is None:
+            return (values if arrays else values.tolist()), []
+
+        return values.tolist(), np.broadcast_to(invalid, (n, )).nonzero()[0].tolist()
+
+    # Every node gives (values, invalid): invalid marks the rows whose
+    # value has to be computed by the per-row projection
+
+    def eval(self, node):
+
+        method = getattr(self, 'eval_' + type(node).__name__, None)
+        if method is None:
+            raise NotVectorizable(ast.dump(node))
+
+        return method(node)
+
+    def eval_Expression(self, node):
+        return self.eval(node.body)
+
+    def eval_Constant(self, node):
+        if type(node.value) not in (int, float) or (type(node.value) is int and abs(node.value) >= INT_LIMIT):
+            raise NotVectorizable(node.value)
+        return node.value, None
+
+    def eval_Name(self, node):
+        return self.eval_Subscript(node)
+
+    def eval_Subscript(self, node):
+
+        # _params['key']
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == '_params':
+            key = node.slice.value if isinstance(node.slice, _INDEX) else node.slice
+            value = self.params.get(key.value) if isinstance(key, ast.Constant) else None
+            if type(value) not in (int, float):
+                raise NotVectorizable(ast.dump(node))
+            return value, None
+
+        path = self.field_path(node)
+        if path is None:
+            raise NotVectorizable(ast.dump(node))
+
+        return self.column(path)
+
+    def eval_UnaryOp(self, node):
+        np = self.np
+
+        v, invalid = self.eval(node.operand)
+
+        if isinstance(node.op, ast.USub):
+            return np.negative(v), _sign_overflow(np, v, invalid)
+        if isinstance(node.op, ast.UAdd):
+            return np.positive(v), invalid
+        if isinstance(node.op, ast.Not):
+            return np.logical_not(v), invalid
+
+        raise NotVectorizable(ast.dump(node))
+
+    def binary(self, op, a, b):
+        np = self.np
+
+        (a, invalid_a), (b, invalid_b) = a, b
+
+        fun = self.BINARY.get(type(op))
+        if fun is None:
+            raise NotVectorizable(op)
+
+        invalid = _or(np, invalid_a, invalid_b)
+
+        # Python raises on a zero divisor and on negative integer exponents
+        if isinstance(op, (ast.Div, ast.FloorDiv, ast.Mod)):
+            invalid = _or(np, invalid, np.equal(b, 0))
+
+        if isinstance(op, ast.Pow) and _is_int(np, b):
+            invalid = _or(np, invalid, np.less(b, 0))
+            b = np.where(np.less(b, 0), 0, b)
+
+        result = fun(a, b)
+
+        if _is_int(np, result) and isinstance(op, (ast.Add, ast.Sub, ast.Mult, ast.Pow)):
+            check = fun(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+            invalid = _or(np, invalid, np.logical_not(np.less(np.abs(check), INT_LIMIT)))
+
+        return result, invalid
+
+    def eval_BinOp(self, node):
+        return self.binary(node.op, self.eval(node.left), self.eval(node.right))
+
+    def eval_Compare(self, node):
+        np = self.np
+
+        left = self.eval(node.left)
+
+        result  = None
+        invalid = left[1]
+
+        # a < b < c -> (a < b) & (b < c)
+        for op, comparator in zip(node.ops, node.comparators):
+
+            fun = self.COMPARE.get(type(op))
+            if fun is None:
+                raise NotVectorizable(op)
+
+            right = self.eval(comparator)
+
+            r = fun(left[0], right[0])
+
+            result  = r if result is None else np.logical_and(result, r)
+            invalid = _or(np, invalid, right[1])
+
+            left = right
+
+        return result, invalid
+
+    def eval_Call(self, node):
+        np = self.np
+
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise NotVectorizable(ast.dump(node))
+
+        name = node.func.id
+        args = [ self.eval(a) for a in node.args ]
+
+        if name == 'abs' and len(args) == 1:
+            return np.abs(args[0][0]), _sign_overflow(np, args[0][0], args[0][1])
+
+        if name == 'pow' and len(args) == 2:
+            return self.binary(ast.Pow(), args[0], args[1])
+
+        if name == 'float' and len(args) == 1:
+            return np.asarray(args[0][0], dtype=float), args[0][1]
+
+        if name == 'int' and len(args) == 1:
+            v, invalid = args[0]
+            if not _is_int(np, v):
+                invalid = _or(np, invalid, np.logical_not(np.less(np.abs(v), INT_LIMIT)))
+                v = np.trunc(np.where(np.isfinite(v), v, 0)).astype('int64')
+            return v, invalid
+
+        if name in ('max', 'min') and len(args) >= 2:
+            # Python keeps the type of the winning argument
+            if len(set([ _is_int(np, v) for v, _ in args ])) > 1:
+                raise NotVectorizable(name)
+
+            fun = np.maximum if name == 'max' else np.minimum
+
+            result = args[0][0]
+            for v, _ in args[1:]:
+                result = fun(result, v)
+
+            return result, _or(np, *[ invalid for _, invalid in args ])
+
+        raise NotVectorizable(name)
+
+#----------------------------------------------------------------------#
+#                                                                      #
+#----------------------------------------------------------------------#
+
+def project_rows(columns_processors, rows, params):
+    return list(map(list, zip(*project_columns(columns_processors, rows, params))))
+
+def project_columns(columns_processors, rows, params, arrays=False):
+
+    # One list per column; with arrays=True the numeric columns computed
+    # without fallback rows are left as numpy arrays
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is None or not rows:
+        return row_columns(columns_processors, rows, params)
+
+    symbols = {}
+    for column_processor in columns_processors:
+        for sym_name in column_processor['used_symbols']:
+            symbols[python_name(sym_name)] = sym_name
+
+    evaluator = _Evaluator(np, rows, params, symbols)
+
+    columns  = [ None ] * len(columns_processors)
+    fallback = []
+
+    for i, column_processor in enumerate(columns_processors):
+        try:
+            values, invalid_rows = evaluator.evaluate(column_processor, arrays)
+        except (NotVectorizable, SyntaxError, TypeError, ValueError):
+            fallback.append(i)
+            continue
+
+        # Rows numpy can't reproduce (missing fields, zero divisors,
+        # overflows...) are computed by the per-row projection
+        if len(invalid_rows) * 4 > len(rows):
+            fallback.append(i)
+            continue
+
+        if invalid_rows:
+            project = compile_projection(projection_source([ column_processor ]))
+            for r in invalid_rows:
+                values[r] = project(rows[r], params)[0]
+
+        columns[i] = values
+
+    if len(fallback) == len(columns):
+        return row_columns(columns_processors, rows, params)
+
+    if fallback:
+        subset = [ columns_processors[i] for i in fallback ]
+
+        for j, values in enumerate(row_columns(subset, rows, params)):
+            columns[fallback[j]] = values
+
+    return columns
+
+def row_columns(columns_processors, rows, params):
+
+    project = compile_projection(projection_source(columns_processors))
+
+    per_row = [ project(row, params) for row in rows ]
+    if not per_row:
+        return [ [] for _ in columns_processors ]
+
+    return list(map(list, zip(*per_row)))